@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+bench-clients.py
+
+Per-request overhead of building API clients per message versus the shared, pooled
+clients of ``clients.py``, measured against a local stub HTTP server that answers like
+OpenAI's ``/v1/chat/completions`` and Cohere's ``/v2/embed``:
+
+- per_request: a new ``ChatOpenAI`` / ``cohere.ClientV2`` for every request (what
+  ``chat.py`` and ``ok.py`` did per message), so every request opens a new connection,
+- shared: ``get_chat_model`` / ``get_cohere_client``, one keep-alive pool for all requests.
+
+The stub runs on plain HTTP, so the TLS handshake a real endpoint adds to every new
+connection is not included; ``--connect_ms`` adds a fixed delay per new connection to
+approximate it (a TLS 1.3 handshake to a nearby region is typically 20-60 ms).
+
+Usage:
+  python bench-clients.py --requests 200
+  python bench-clients.py --requests 200 --connect_ms 40 --json
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List
+
+import cohere
+from langchain_openai import ChatOpenAI
+
+from clients import get_chat_model, get_cohere_client
+
+API_KEY = "bench"
+
+
+def chat_completion(model: str) -> Dict[str, Any]:
+    return {
+        "id": "chatcmpl-bench",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [
+            {"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop", "logprobs": None}
+        ],
+        "usage": {"prompt_tokens": 8, "completion_tokens": 1, "total_tokens": 9},
+    }
+
+
+def embed_response(texts: List[str], dim: int = 8) -> Dict[str, Any]:
+    return {
+        "id": "embed-bench",
+        "response_type": "embeddings_by_type",
+        "embeddings": {"float": [[0.1] * dim for _ in texts]},
+        "texts": texts,
+        "meta": {"api_version": {"version": "2"}},
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    disable_nagle_algorithm = True  # headers and body are separate writes
+
+    def setup(self) -> None:
+        super().setup()
+        server = self.server
+        with server.lock:  # type: ignore[attr-defined]
+            server.connections += 1  # type: ignore[attr-defined]
+        time.sleep(server.connect_ms / 1000)  # type: ignore[attr-defined]
+
+    def do_POST(self) -> None:
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path.endswith("/chat/completions"):
+            payload = chat_completion(body.get("model", ""))
+        elif self.path.endswith("/embed"):
+            payload = embed_response(body.get("texts", []))
+        else:
+            self.send_error(404)
+            return
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+
+def start_stub(connect_ms: float) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()  # type: ignore[attr-defined]
+    server.connections = 0  # type: ignore[attr-defined]
+    server.connect_ms = connect_ms  # type: ignore[attr-defined]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run(server: ThreadingHTTPServer, call: Callable[[], Any], requests: int) -> Dict[str, Any]:
+    call()  # warm-up: imports, first connection of the shared pool
+    opened = server.connections  # type: ignore[attr-defined]
+    latencies = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        call()
+        latencies.append(1000 * (time.perf_counter() - started))
+    latencies.sort()
+    return {
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": latencies[int(0.95 * (len(latencies) - 1))],
+        "mean_ms": statistics.fmean(latencies),
+        "connections": server.connections - opened,  # type: ignore[attr-defined]
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare per-request API clients with the shared pooled clients.")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per client and mode")
+    parser.add_argument("--connect_ms", type=float, default=0.0, help="Extra delay per new connection (handshake stand-in)")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    server = start_stub(args.connect_ms)
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    messages = [{"role": "user", "content": "ping"}]
+    texts = ["Wie funktioniert die Pumpe XR-2040?"]
+
+    def embed(client: Any) -> Any:
+        return client.embed(texts=texts, model="embed-v4.0", input_type="search_query", embedding_types=["float"])
+
+    calls = {
+        "chat": {
+            "per_request": lambda: ChatOpenAI(
+                model="gpt-4.1", temperature=0, base_url=f"{base}/v1", api_key=API_KEY
+            ).invoke(messages),
+            "shared": lambda: get_chat_model("gpt-4.1", base_url=f"{base}/v1", api_key=API_KEY).invoke(messages),
+        },
+        "embed": {
+            "per_request": lambda: embed(cohere.ClientV2(api_key=API_KEY, base_url=base)),
+            "shared": lambda: embed(get_cohere_client(API_KEY, base_url=base)),
+        },
+    }
+    results = {
+        client: {mode: run(server, call, args.requests) for mode, call in modes.items()}
+        for client, modes in calls.items()
+    }
+    for modes in results.values():
+        modes["saved_ms_per_request"] = modes["per_request"]["mean_ms"] - modes["shared"]["mean_ms"]
+    server.shutdown()
+
+    if args.json:
+        print(json.dumps({"requests": args.requests, "connect_ms": args.connect_ms, "results": results}, indent=2))
+        return
+
+    print(f"{'client':<6} {'mode':<12} {'p50 ms':>8} {'p95 ms':>8} {'mean ms':>8} {'connections':>11}")
+    for client, modes in results.items():
+        for mode in ("per_request", "shared"):
+            r = modes[mode]
+            print(f"{client:<6} {mode:<12} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['mean_ms']:>8.2f} {r['connections']:>11}")
+        print(f"{client:<6} saved {modes['saved_ms_per_request']:.2f} ms per request")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+bench-encoding.py
+
+Compare page image encoding profiles: payload bytes (raw and base64, as sent in the
+embed request) and encode time per page.
+
+Usage:
+  python bench-encoding.py --pdf reduzido.pdf
+  python bench-encoding.py --pdf reduzido.pdf --profiles png jpeg-1600 webp-1600 --json
+"""
+import argparse
+import json
+import time
+from itertools import islice
+from typing import Dict, List
+
+from PIL import Image
+
+from page_encoding import PROFILES, EncodingProfile, encode_page
+from page_stream import iter_page_images
+
+
+def bench_profile(pages: List[Image.Image], profile: EncodingProfile) -> Dict[str, float]:
+    total_bytes = 0
+    started = time.perf_counter()
+    for page in pages:
+        total_bytes += len(encode_page(page, profile))
+    elapsed = time.perf_counter() - started
+    n = max(len(pages), 1)
+    return {
+        "pages": len(pages),
+        "bytes_per_page": total_bytes / n,
+        # base64 inflates by 4/3; this is what actually goes over the wire
+        "payload_bytes_per_page": 4 * ((total_bytes / n + 2) // 3),
+        "encode_ms_per_page": 1000 * elapsed / n,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark page image encoding profiles.")
+    parser.add_argument("--pdf", default="reduzido.pdf", help="PDF to render")
+    parser.add_argument("--dpi", type=int, default=200, help="DPI for PDF->image conversion")
+    parser.add_argument("--pages", type=int, default=None, help="Only use the first N pages")
+    parser.add_argument("--profiles", nargs="+", default=sorted(PROFILES), choices=sorted(PROFILES))
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    pages = [image for _, image in islice(iter_page_images(args.pdf, dpi=args.dpi), args.pages)]
+
+    results = {name: bench_profile(pages, PROFILES[name]) for name in args.profiles}
+
+    if args.json:
+        print(json.dumps({"pdf": args.pdf, "dpi": args.dpi, "profiles": results}, indent=2))
+        return
+
+    baseline = results.get("png", {}).get("payload_bytes_per_page")
+    print(f"{args.pdf}: {len(pages)} pages at {args.dpi} DPI")
+    print(f"{'profile':<16} {'KB/page':>10} {'payload KB':>11} {'ms/page':>9} {'vs png':>8}")
+    for name, r in results.items():
+        ratio = f"{r['payload_bytes_per_page'] / baseline:.2f}x" if baseline else "-"
+        print(
+            f"{name:<16} {r['bytes_per_page'] / 1024:>10.1f} {r['payload_bytes_per_page'] / 1024:>11.1f} "
+            f"{r['encode_ms_per_page']:>9.1f} {ratio:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
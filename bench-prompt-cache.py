@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+bench-prompt-cache.py
+
+Prompt tokens per turn of a simulated conversation, before and after the cached system
+prompt:
+
+- before: the system prompt is re-formatted every turn and the request carries a
+  sliding ``history[-30:]`` window, as ``chat.py`` sends it,
+- after: the company's compiled prompt comes from ``SystemPromptCache`` and the history is
+  appended to it, so each request extends the previous one.
+
+For every turn it reports the prompt tokens, the tokens shared as an exact message
+prefix with the previous request, and how many of those a provider prefix cache would
+serve (OpenAI: prefixes of 1024+ tokens, in 128-token steps).
+
+Usage:
+  python bench-prompt-cache.py --turns 40
+  python bench-prompt-cache.py --turns 40 --json
+"""
+import argparse
+import json
+import random
+import time
+from typing import Any, Dict, List
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+
+from ok import prompt
+from system_prompt import CompanyData, SystemPromptCache
+from token_counting import message_tokens
+
+COMPANY = CompanyData(
+    company="Strom Verlag",
+    role="customer support",
+    institutional_info="Strom Verlag publishes technical manuals for pumps and river engineering. " * 20,
+    agent_name="Aileen",
+    manager_custom_instructions="Always mention the support hotline for warranty questions.",
+)
+WINDOW = 30
+
+
+def conversation(turns: int, seed: int = 0) -> List[List[BaseMessage]]:
+    """Messages added per turn: user question, tool call, tool result, answer."""
+    rng = random.Random(seed)
+    out = []
+    for turn in range(turns):
+        question = "Wie funktioniert die Pumpe XR-2040 im Winter? " * rng.randint(1, 6)
+        call_id = f"call_{turn}"
+        out.append(
+            [
+                HumanMessage(question),
+                AIMessage("", tool_calls=[{"name": "search", "args": {"queries": [question[:40]]}, "id": call_id}]),
+                ToolMessage("## Pumpe\n- strom.pdf, page 12\n" * rng.randint(2, 8), tool_call_id=call_id),
+                AIMessage("Hier ist, was ich gefunden habe: " + "Die Pumpe arbeitet zuverlässig. " * rng.randint(5, 30)),
+            ]
+        )
+    return out
+
+
+def _key(message: BaseMessage) -> Any:
+    return (message.type, message.content, json.dumps(getattr(message, "tool_calls", None), sort_keys=True))
+
+
+def cached_tokens(shared: int) -> int:
+    return 0 if shared < 1024 else 1024 + (shared - 1024) // 128 * 128
+
+
+def simulate(turns: int, cached: bool) -> List[Dict[str, Any]]:
+    cache = SystemPromptCache(prompt)
+    history: List[BaseMessage] = []
+    previous: List[BaseMessage] = []
+    rows = []
+    for added in conversation(turns):
+        history.append(added[0])
+        started = time.perf_counter()
+        if cached:
+            request = [cache.get(COMPANY), *history]
+        else:
+            system = SystemMessage(prompt.format(**COMPANY.__dict__))
+            request = [system, *history[-WINDOW:]]
+        render_us = 1e6 * (time.perf_counter() - started)
+
+        tokens = [message_tokens(m) for m in request]
+        shared = 0
+        for n, (a, b) in enumerate(zip(request, previous)):
+            if _key(a) != _key(b):
+                break
+            shared += tokens[n]
+        rows.append(
+            {
+                "prompt_tokens": sum(tokens),
+                "shared_prefix_tokens": shared,
+                "cached_tokens": cached_tokens(shared),
+                "render_us": render_us,
+            }
+        )
+        history.extend(added[1:])
+        previous = request
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Report prompt tokens per turn before/after system prompt caching.")
+    parser.add_argument("--turns", type=int, default=40, help="Simulated conversation turns")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    before, after = simulate(args.turns, cached=False), simulate(args.turns, cached=True)
+    totals = {
+        name: {
+            "prompt_tokens": sum(r["prompt_tokens"] for r in rows),
+            "cached_tokens": sum(r["cached_tokens"] for r in rows),
+            "uncached_tokens": sum(r["prompt_tokens"] - r["cached_tokens"] for r in rows),
+        }
+        for name, rows in (("before", before), ("after", after))
+    }
+
+    if args.json:
+        print(json.dumps({"turns": args.turns, "totals": totals, "before": before, "after": after}, indent=2))
+        return
+
+    print(f"{'turn':>4} | {'before: prompt':>14} {'cached':>7} {'render us':>9} | {'after: prompt':>13} {'cached':>7} {'render us':>9}")
+    for turn, (b, a) in enumerate(zip(before, after)):
+        print(
+            f"{turn:>4} | {b['prompt_tokens']:>14} {b['cached_tokens']:>7} {b['render_us']:>9.1f} |"
+            f" {a['prompt_tokens']:>13} {a['cached_tokens']:>7} {a['render_us']:>9.1f}"
+        )
+    for name, t in totals.items():
+        print(f"{name}: {t['prompt_tokens']} prompt tokens, {t['cached_tokens']} cacheable, {t['uncached_tokens']} uncached")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+bench-retrieval.py
+
+End-to-end retrieval benchmark against the local ``FakeEmbedClient`` (no API key, no
+network), with a JSON report to track regressions across releases.
+
+- ingest: ``ingest_pdfs`` from ``ingest.py`` over ``reduzido.pdf`` and synthetic
+  larger PDFs (image-only pages generated with PIL, ``--synthetic_pages``); reports
+  pages/sec and peak RSS (needs poppler for rasterization),
+- query: a synthetic corpus (or the text layer of ``--corpus_pdf``) embedded through
+  ``embed_pages_and_store``, then ``--queries`` searches through ``RetrievalService`` at
+  ``--concurrency`` in flight (optionally with a ``--rerank`` stage). Each query is a few consecutive words of one page, so
+  recall@k is whether that page comes back; also p50/p95 latency and throughput.
+  The fake embeddings are hashed bags of words, so they agree with BM25 by construction:
+  hybrid and lexical-rerank recall here overstates what real embeddings would gain.
+
+The fake embed service adds ``--embed_latency`` per call and enforces ``--rate_limit``
+calls/sec (429s are retried by ``embed_batching``). Peak RSS is ``ru_maxrss`` of this
+process (and of the largest worker process for ingest), so it is the peak up to the
+end of each suite, not of the suite alone.
+
+Usage:
+  python bench-retrieval.py --suite query --pages 2000 --concurrency 16
+  python bench-retrieval.py --suite ingest --pdf reduzido.pdf --synthetic_pages 100 400
+  python bench-retrieval.py --json --out bench-report.json
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from PIL import Image, ImageDraw, ImageFont
+
+import ingest
+from fake_embed import FakeEmbedClient
+from lexical_index import LexicalIndex, lexical_index_path, write_shard
+from page_ids import document_id, document_key, page_id
+from page_stream import extract_text
+from query_embedder import QueryEmbedder
+from reranking import RERANKERS, make_reranker
+from retrieval_service import RetrievalService
+from vector_store import NumpyVectorStore
+
+MODEL = "embed-v4.0"
+SYLLABLES = ["ka", "ro", "pum", "fluss", "ver", "lag", "stro", "mi", "ter", "wa", "sen", "del", "ing", "xa", "bo", "ne"]
+
+
+def peak_rss_mb(children: bool = False) -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # kilobytes on Linux, bytes on macOS
+    return usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def synthetic_texts(pages: int, words_per_page: int = 250, seed: int = 0) -> List[str]:
+    """Page texts over a pseudo-word vocabulary with a Zipf-like word frequency."""
+    rng = random.Random(seed)
+    vocab = sorted({"".join(rng.choices(SYLLABLES, k=rng.randint(2, 4))) for _ in range(20_000)})
+    weights = [1 / (rank + 1) ** 0.7 for rank in range(len(vocab))]
+    rng.shuffle(vocab)
+    return [" ".join(rng.choices(vocab, weights, k=words_per_page)) for _ in range(pages)]
+
+
+def synthetic_pdf(path: str, pages: int, dpi: int = 100, seed: int = 0) -> str:
+    """Image-only A4 PDF of ``pages`` pages of drawn text lines (1-bit, to keep it small)."""
+    texts = synthetic_texts(pages, seed=seed)
+    size = (int(8.27 * dpi), int(11.69 * dpi))
+    # the bitmap font renders ~100x faster than the default FreeType one
+    font = getattr(ImageFont, "load_default_imagefont", ImageFont.load_default)()
+    images = []
+    for text in texts:
+        image = Image.new("1", size, 1)
+        draw = ImageDraw.Draw(image)
+        words = text.split()
+        for line in range(0, len(words), 10):
+            draw.text((dpi // 2, dpi // 2 + 2 * line), " ".join(words[line : line + 10]), fill=0, font=font)
+        images.append(image)
+    images[0].save(path, "PDF", resolution=dpi, save_all=True, append_images=images[1:])
+    return path
+
+
+def bench_ingest(pdf_paths: List[str], args: argparse.Namespace, workdir: str) -> List[Dict[str, Any]]:
+    ingest.POPPLER_PATH = args.poppler_path
+    rows = []
+    for pdf_path in pdf_paths:
+        co_client = FakeEmbedClient(latency=args.embed_latency, latency_per_input=0.001, rate_limit=args.rate_limit)
+        started = time.perf_counter()
+        _, pages = ingest.ingest_pdfs(
+            co_client,
+            [pdf_path],
+            MODEL,
+            collection_name=f"bench_{uuid.uuid4().hex[:8]}",
+            dpi=args.dpi,
+            processes=args.processes,
+            page_store_dir=os.path.join(workdir, "page_store"),
+            lexical_index_dir=os.path.join(workdir, "lexical_index"),
+            page_text_dir=os.path.join(workdir, "page_text"),
+            max_workers=args.workers,
+        )
+        seconds = time.perf_counter() - started
+        rows.append(
+            {
+                "pdf": os.path.basename(pdf_path),
+                "pages": pages,
+                "seconds": seconds,
+                "pages_per_sec": pages / seconds,
+                "embed_calls": co_client.calls,
+                "rate_limited": co_client.rejected,
+                "peak_rss_mb": peak_rss_mb(),
+                "peak_worker_rss_mb": peak_rss_mb(children=True),
+            }
+        )
+    return rows
+
+
+def build_corpus(texts: List[str], source: str, args: argparse.Namespace, workdir: str) -> Tuple[Any, Optional[LexicalIndex]]:
+    """Embed ``texts`` as one document's pages into a fresh in-memory collection."""
+    entries = ({"content": [{"type": "text", "text": text}]} for text in texts)
+    collection, _ = ingest.embed_pages_and_store(
+        FakeEmbedClient(),
+        entries,
+        MODEL,
+        collection=ingest.open_collection(f"bench_{uuid.uuid4().hex[:8]}")[1],
+        source=source,
+        total_pages=len(texts),
+        window_size=256,
+    )
+    if args.backend == "numpy":
+        collection = NumpyVectorStore.from_chroma(collection)
+    if not (args.hybrid or args.rerank):
+        return collection, None
+    index_dir = os.path.join(workdir, "lexical_index")
+    write_shard(lexical_index_path(index_dir, source), source, texts, len(texts))
+    return collection, LexicalIndex(index_dir)
+
+
+def make_queries(texts: List[str], source: str, n: int, words: int = 6, seed: int = 1) -> List[Tuple[str, str]]:
+    """``(query, expected page id)``: ``words`` consecutive words of a random page."""
+    rng = random.Random(seed)
+    doc_id = document_id(source)
+    queries = []
+    for _ in range(n):
+        page = rng.randrange(len(texts))
+        tokens = texts[page].split() or [""]
+        start = rng.randrange(max(1, len(tokens) - words))
+        queries.append((" ".join(tokens[start : start + words]), page_id(doc_id, page)))
+    return queries
+
+
+async def run_load(service: RetrievalService, queries: List[Tuple[str, str]], concurrency: int) -> Dict[str, Any]:
+    loop = asyncio.get_running_loop()
+    # every plan runs its embed/search steps in threads; keep the pool from capping concurrency
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=max(32, 4 * concurrency)))
+    pending = list(enumerate(queries))
+    latencies: List[float] = [0.0] * len(queries)
+    found: List[Optional[bool]] = [None] * len(queries)
+
+    async def worker() -> None:
+        while pending:
+            i, (query, expected) = pending.pop()
+            started = time.perf_counter()
+            hits = (await service.search([query]))[query]
+            latencies[i] = 1000 * (time.perf_counter() - started)
+            found[i] = None if hits is None else any(hit["id"] == expected for hit in hits)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    seconds = time.perf_counter() - started
+    answered = [f for f in found if f is not None]
+    return {
+        "queries": len(queries),
+        "concurrency": concurrency,
+        "seconds": seconds,
+        "qps": len(queries) / seconds,
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": percentile(latencies, 0.95),
+        "recall_at_k": sum(answered) / max(len(answered), 1),
+        "timeouts": len(found) - len(answered),
+    }
+
+
+def bench_query(args: argparse.Namespace, workdir: str) -> Dict[str, Any]:
+    if args.corpus_pdf:
+        source = document_key(args.corpus_pdf)
+        texts = extract_text(args.corpus_pdf, poppler_path=args.poppler_path)
+    else:
+        source = f"synthetic-{args.pages}.pdf"
+        texts = synthetic_texts(args.pages)
+
+    started = time.perf_counter()
+    collection, lexical_index = build_corpus(texts, source, args, workdir)
+    build_seconds = time.perf_counter() - started
+
+    co_client = FakeEmbedClient(latency=args.embed_latency, rate_limit=args.rate_limit)
+    service = RetrievalService(
+        co_client,
+        collection,
+        top_k=args.top_k,
+        turn_budget=args.budget,
+        embedder=QueryEmbedder(co_client, MODEL),
+        lexical_index=lexical_index if args.hybrid else None,
+        reranker=make_reranker(args.rerank, lexical_index, co_client, overfetch=args.overfetch),
+    )
+    result = asyncio.run(run_load(service, make_queries(texts, source, args.queries), args.concurrency))
+    result.update(
+        {
+            "pages": len(texts),
+            "backend": args.backend,
+            "hybrid": args.hybrid,
+            "rerank": args.rerank,
+            "top_k": args.top_k,
+            "corpus_seconds": build_seconds,
+            "embed_calls": co_client.calls,
+            "rate_limited": co_client.rejected,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+    )
+    return result
+
+
+def git_revision() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="End-to-end ingest/query benchmark against a local fake embed service.")
+    parser.add_argument("--suite", default="all", choices=["ingest", "query", "all"], help="Benchmarks to run")
+    parser.add_argument("--pdf", nargs="*", default=["reduzido.pdf"], help="Real PDFs for the ingest benchmark")
+    parser.add_argument("--synthetic_pages", type=int, nargs="*", default=[200], help="Sizes of synthetic PDFs to ingest")
+    parser.add_argument("--dpi", type=int, default=100, help="Rasterization DPI for ingest")
+    parser.add_argument("--processes", type=int, default=None, help="Rasterization processes (default: all cores)")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent embed requests during ingest")
+    parser.add_argument(
+        "--poppler_path",
+        default=os.environ.get("POPPLER_PATH") or None,
+        help="Directory with the poppler binaries (default: PATH)",
+    )
+    parser.add_argument("--pages", type=int, default=2000, help="Pages of the synthetic query corpus")
+    parser.add_argument("--corpus_pdf", default=None, help="Use this PDF's text layer as the query corpus instead")
+    parser.add_argument("--backend", default="numpy", choices=["chroma", "numpy"], help="Vector store for the query benchmark")
+    parser.add_argument("--hybrid", action="store_true", help="Fuse BM25 hits into the query benchmark")
+    parser.add_argument("--rerank", default=None, choices=RERANKERS, help="Rerank over-fetched candidates")
+    parser.add_argument("--overfetch", type=int, default=4, help="First-stage hits per final page when reranking")
+    parser.add_argument("--queries", type=int, default=400, help="Queries in the load test")
+    parser.add_argument("--concurrency", type=int, default=16, help="Queries in flight")
+    parser.add_argument("--top_k", type=int, default=5, help="k for recall@k")
+    parser.add_argument("--budget", type=float, default=8.0, help="Per-search time budget in seconds")
+    parser.add_argument("--embed_latency", type=float, default=0.05, help="Fake embed latency per call in seconds")
+    parser.add_argument("--rate_limit", type=float, default=None, help="Fake embed calls allowed per second")
+    parser.add_argument("--out", default=None, help="Also write the JSON report to this file")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    report: Dict[str, Any] = {
+        "revision": git_revision(),
+        "started": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "config": vars(args),
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        if args.suite in ("query", "all"):
+            report["query"] = bench_query(args, workdir)
+        poppler = os.path.join(args.poppler_path, "pdfinfo") if args.poppler_path else shutil.which("pdfinfo")
+        if args.suite in ("ingest", "all") and not (poppler and os.path.exists(poppler)):
+            print("ingest: skipped, poppler (pdfinfo) not found; set --poppler_path", file=sys.stderr)
+            report["ingest"] = []
+        elif args.suite in ("ingest", "all"):
+            pdfs = list(args.pdf)
+            for n in args.synthetic_pages:
+                pdfs.append(synthetic_pdf(os.path.join(workdir, f"synthetic-{n}.pdf"), n, seed=n))
+            report["ingest"] = bench_ingest(pdfs, args, workdir)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    if "query" in report:
+        q = report["query"]
+        print(
+            f"query: {q['pages']} pages, {q['queries']} queries at concurrency {q['concurrency']} ({q['backend']}"
+            f"{', hybrid' if q['hybrid'] else ''}{', rerank ' + q['rerank'] if q['rerank'] else ''}): p50 {q['p50_ms']:.1f} ms, p95 {q['p95_ms']:.1f} ms, "
+            f"{q['qps']:.1f} q/s, recall@{q['top_k']} {q['recall_at_k']:.3f}, {q['timeouts']} timeouts, "
+            f"peak RSS {q['peak_rss_mb']:.0f} MB"
+        )
+    for row in report.get("ingest", []):
+        print(
+            f"ingest {row['pdf']}: {row['pages']} pages in {row['seconds']:.1f}s = {row['pages_per_sec']:.1f} pages/sec, "
+            f"peak RSS {row['peak_rss_mb']:.0f} MB (workers {row['peak_worker_rss_mb']:.0f} MB)"
+        )
+
+
+if __name__ == "__main__":
+    main()
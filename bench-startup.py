@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+bench-startup.py
+
+Startup time of the CLI entry points, with a budget per command so import-time
+regressions (a heavy SDK imported at module level again) fail loudly.
+
+Each case runs ``python -X importtime cli.py ...`` in a fresh interpreter ``--runs`` times
+and reports the median wall time of the whole process, the median time spent importing
+and the top-level imports that cost the most. ``query ... --import_only`` loads every
+module the query would run and exits before opening the index or calling an API, so it
+measures the startup cost a real query pays, without a network or an index.
+
+Exits with status 1 if a case's median wall time is over its budget.
+
+Usage:
+  python bench-startup.py
+  python cli.py bench startup --runs 10 --json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Tuple
+
+CLI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cli.py")
+
+# name -> (cli.py arguments, budget for the median wall time in ms)
+CASES: Dict[str, Tuple[List[str], float]] = {
+    "--help": (["--help"], 200.0),
+    "query --help": (["query", "--help"], 500.0),
+    "query --server": (["query", "--server", "http://127.0.0.1:8765", "--import_only"], 800.0),
+    "query (numpy)": (["query", "--backend", "numpy", "--import_only"], 2000.0),
+    "query (chroma)": (["query", "--backend", "chroma", "--import_only"], 3000.0),
+    "ingest --help": (["ingest", "--help"], 500.0),
+}
+
+
+def parse_importtime(stderr: str) -> Tuple[float, Dict[str, float]]:
+    """Total import ms and cumulative ms per top-level import from ``-X importtime`` output."""
+    top: Dict[str, float] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if not cumulative.strip().isdigit() or name.startswith("  "):
+            continue  # header line or a nested import (already in its parent's cumulative time)
+        top[name.strip()] = top.get(name.strip(), 0.0) + int(cumulative) / 1000
+    return sum(top.values()), top
+
+
+def profile(args: List[str], runs: int) -> Dict[str, Any]:
+    walls, imports, tops = [], [], []
+    env = dict(os.environ)
+    env.pop("TRACE_PATH", None)
+    for _ in range(runs):
+        started = time.perf_counter()
+        done = subprocess.run([sys.executable, "-X", "importtime", CLI, *args], capture_output=True, text=True, env=env)
+        walls.append((time.perf_counter() - started) * 1000)
+        if done.returncode != 0:
+            raise RuntimeError(f"cli.py {' '.join(args)} failed:\n{done.stderr[-2000:]}")
+        total, top = parse_importtime(done.stderr)
+        imports.append(total)
+        tops.append(top)
+    median_top = {name: statistics.median(t.get(name, 0.0) for t in tops) for name in tops[-1]}
+    return {
+        "wall_ms": statistics.median(walls),
+        "import_ms": statistics.median(imports),
+        "top_imports": dict(sorted(median_top.items(), key=lambda kv: -kv[1])[:5]),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Import-time profile of the CLI entry points against a budget.")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per case (median is reported)")
+    parser.add_argument("--cases", nargs="+", default=list(CASES), choices=list(CASES), help="Cases to run")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    # first run of each case compiles bytecode; keep it out of the medians
+    for name in args.cases:
+        profile(CASES[name][0], 1)
+    results = {}
+    for name in args.cases:
+        cli_args, budget = CASES[name]
+        results[name] = {**profile(cli_args, args.runs), "budget_ms": budget}
+        results[name]["ok"] = results[name]["wall_ms"] <= budget
+    over = [name for name, r in results.items() if not r["ok"]]
+
+    if args.json:
+        print(json.dumps({"python": sys.version.split()[0], "runs": args.runs, "results": results}, indent=2))
+    else:
+        print(f"{'case':<16} {'wall ms':>8} {'import ms':>9} {'budget':>7}  top imports (ms)")
+        for name, r in results.items():
+            top = ", ".join(f"{module} {ms:.0f}" for module, ms in list(r["top_imports"].items())[:3])
+            flag = "" if r["ok"] else "  OVER BUDGET"
+            print(f"{name:<16} {r['wall_ms']:>8.0f} {r['import_ms']:>9.0f} {r['budget_ms']:>7.0f}  {top}{flag}")
+    if over:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
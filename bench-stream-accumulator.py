@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+bench-stream-accumulator.py
+
+CPU cost of accumulating streamed replies: ``gathered = gathered + chunk`` (what
+``company_assistant`` used to do) against ``StreamAccumulator``, and tool-call injection
+with ``deepcopy`` against the shallow copies ``inject_properties`` makes now.
+
+Many concurrent sessions are simulated on one event loop with
+``FakeStreamingChatModel`` (no delay), so the wall time is the CPU time of the loop.
+
+Usage:
+  python bench-stream-accumulator.py
+  python bench-stream-accumulator.py --sessions 200 --chars 20000 --tool_calls 4 --json
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from copy import deepcopy
+from typing import Any, Callable, Dict, List
+
+from langchain_core.messages import AIMessageChunk
+
+from fake_chat_model import FakeStreamingChatModel, ScriptedReply
+from stream_accumulator import StreamAccumulator
+
+
+def script(chars: int, tool_calls: int) -> List[ScriptedReply]:
+    text = ("Hier ist die Antwort aus der Wissensdatenbank. " * (chars // 47 + 1))[:chars]
+    calls = [{"name": "search", "args": {"queries": [f"Frage {i} zur Pumpe XR-{2040 + i}", "Impressum"]}} for i in range(tool_calls)]
+    return [ScriptedReply(text, calls)]
+
+
+async def gather_by_add(stream) -> Any:
+    gathered = None
+    async for chunk in stream:
+        gathered = chunk if gathered is None else gathered + chunk
+    return gathered.tool_calls if gathered is not None else []
+
+
+async def gather_by_accumulator(stream) -> Any:
+    gathered = StreamAccumulator()
+    async for chunk in stream:
+        gathered.add(chunk)
+    return gathered.message().tool_calls
+
+
+async def run_sessions(gather: Callable, sessions: int, replies: List[ScriptedReply], chunk_size: int) -> Dict[str, Any]:
+    session_ms: List[float] = []
+
+    async def session() -> None:
+        llm = FakeStreamingChatModel(replies, chunk_size=chunk_size)
+        started = time.perf_counter()
+        await gather(llm.astream([]))
+        session_ms.append(1000 * (time.perf_counter() - started))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(session() for _ in range(sessions)))
+    elapsed = time.perf_counter() - started
+    return {"wall_ms": 1000 * elapsed, "session_p50_ms": statistics.median(session_ms)}
+
+
+def bench_injection(tool_calls: List[Dict[str, Any]], repeat: int) -> Dict[str, float]:
+    artifact = object()
+
+    def with_deepcopy() -> None:
+        for call in tool_calls:
+            copy = deepcopy(call)
+            copy["args"]["sources_artifact"] = artifact
+
+    def shallow() -> None:
+        for call in tool_calls:
+            {**call, "args": {**call["args"], "sources_artifact": artifact}}
+
+    out = {}
+    for name, fn in (("deepcopy", with_deepcopy), ("shallow", shallow)):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        out[f"{name}_us_per_reply"] = 1e6 * (time.perf_counter() - started) / repeat
+    return out
+
+
+async def _collect(llm: FakeStreamingChatModel) -> List[AIMessageChunk]:
+    return [chunk async for chunk in llm.astream([])]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark streamed reply accumulation.")
+    parser.add_argument("--sessions", type=int, default=100, help="Concurrent simulated sessions")
+    parser.add_argument("--chars", type=int, default=8000, help="Answer length in characters")
+    parser.add_argument("--chunk_size", type=int, default=4, help="Characters per streamed chunk")
+    parser.add_argument("--tool_calls", type=int, default=3, help="Tool calls per reply")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    replies = script(args.chars, args.tool_calls)
+    chunks_per_reply = len(asyncio.run(_collect(FakeStreamingChatModel(replies, chunk_size=args.chunk_size))))
+
+    results: Dict[str, Any] = {
+        "sessions": args.sessions,
+        "chunks_per_session": chunks_per_reply,
+        "add": asyncio.run(run_sessions(gather_by_add, args.sessions, replies, args.chunk_size)),
+        "accumulator": asyncio.run(run_sessions(gather_by_accumulator, args.sessions, replies, args.chunk_size)),
+        "injection": bench_injection([dict(c, id=f"call_{i}", type="tool_call") for i, c in enumerate(replies[0].tool_calls)], 10_000),
+    }
+    total_chunks = args.sessions * chunks_per_reply
+    for name in ("add", "accumulator"):
+        results[name]["chunks_per_sec"] = total_chunks / (results[name]["wall_ms"] / 1000)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{args.sessions} sessions x {chunks_per_reply} chunks")
+    for name in ("add", "accumulator"):
+        r = results[name]
+        print(f"{name:<12} wall {r['wall_ms']:>9.1f} ms  {r['chunks_per_sec']:>12.0f} chunks/s  session p50 {r['session_p50_ms']:.1f} ms")
+    print("injection    " + "  ".join(f"{k} {v:.1f}" for k, v in results["injection"].items()))
+
+
+if __name__ == "__main__":
+    main()
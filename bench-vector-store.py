@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+bench-vector-store.py
+
+Compare query latency and recall@k of the Chroma path against the NumPy vector store
+(exact, IVF, and int8/ubinary first pass with float rescoring), plus index memory.
+Recall is measured against exact NumPy search over a fixed (seeded) query set.
+
+Usage:
+  python bench-vector-store.py --synthetic 50000 --dim 1536
+  python bench-vector-store.py --persist_dir ./chroma_db --collection pdf_pages
+"""
+import argparse
+import json
+import statistics
+import time
+from typing import Callable, Dict, List
+
+import chromadb
+import numpy as np
+
+from vector_store import QUANTIZATIONS, NumpyVectorStore
+
+
+def timed(fn: Callable[[], Dict], repeats: int) -> "tuple[Dict, List[float]]":
+    latencies = []
+    result: Dict = {}
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = fn()
+        latencies.append(1000 * (time.perf_counter() - started))
+    return result, latencies
+
+
+def recall_at_k(expected: List[List[str]], got: List[List[str]], k: int) -> float:
+    hits = sum(len(set(e[:k]) & set(g[:k])) for e, g in zip(expected, got))
+    return hits / max(sum(min(k, len(e)) for e in expected), 1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark Chroma vs NumPy vector search.")
+    parser.add_argument("--persist_dir", default="./chroma_db", help="Chroma DB directory")
+    parser.add_argument("--collection", default="pdf_pages", help="Chroma collection name")
+    parser.add_argument("--synthetic", type=int, default=0, help="Use N random vectors instead of a stored collection")
+    parser.add_argument("--dim", type=int, default=1536, help="Vector size for --synthetic")
+    parser.add_argument("--queries", type=int, default=32, help="Queries per batch")
+    parser.add_argument("--top_k", type=int, default=10)
+    parser.add_argument("--ivf_lists", type=int, default=0, help="IVF lists (default: ~sqrt(N))")
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.synthetic:
+        # clustered like real page embeddings rather than uniform noise
+        centers = rng.standard_normal((max(1, args.synthetic // 200), args.dim), dtype=np.float32)
+        vectors = centers[rng.integers(len(centers), size=args.synthetic)]
+        vectors = vectors + 0.5 * rng.standard_normal((args.synthetic, args.dim), dtype=np.float32)
+        ids = [str(i) for i in range(args.synthetic)]
+        collection = chromadb.Client().get_or_create_collection("bench_vectors", metadata={"hnsw:space": "cosine"})
+        for start in range(0, len(ids), 5000):
+            collection.add(ids=ids[start : start + 5000], embeddings=vectors[start : start + 5000])
+        store = NumpyVectorStore(ids, vectors)
+    else:
+        collection = chromadb.PersistentClient(path=args.persist_dir).get_collection(args.collection)
+        store = NumpyVectorStore.from_chroma(collection)
+
+    # queries: stored vectors with noise, so they have meaningful neighbours
+    picks = rng.choice(store.count(), args.queries)
+    queries = store.embeddings[picks] + 0.05 * rng.standard_normal((args.queries, store.embeddings.shape[1]))
+    queries = queries.astype(np.float32).tolist()
+
+    exact, exact_ms = timed(lambda: store.query(queries, args.top_k, n_probe=None), args.repeats)
+    chroma, chroma_ms = timed(lambda: collection.query(query_embeddings=queries, n_results=args.top_k), args.repeats)
+    report = {
+        "vectors": store.count(),
+        "queries_per_batch": args.queries,
+        "top_k": args.top_k,
+        "chroma": {"p50_ms": statistics.median(chroma_ms), "recall": recall_at_k(exact["ids"], chroma["ids"], args.top_k)},
+        "numpy_exact": {"p50_ms": statistics.median(exact_ms), "recall": 1.0},
+    }
+
+    store.quantize()
+    report["index_bytes"] = store.index_bytes()
+    for kind in QUANTIZATIONS:
+        for multiplier in (4, 10, 20):
+            store.rescore_multiplier = multiplier
+            quantized, quantized_ms = timed(lambda: store.query(queries, args.top_k, quantization=kind), args.repeats)
+            report[f"numpy_{kind}_rescore_{multiplier}x"] = {
+                "p50_ms": statistics.median(quantized_ms),
+                "recall": recall_at_k(exact["ids"], quantized["ids"], args.top_k),
+            }
+
+    n_lists = args.ivf_lists or max(1, int(store.count() ** 0.5))
+    started = time.perf_counter()
+    store.build_ivf(n_lists)
+    report["ivf_build_s"] = time.perf_counter() - started
+    for n_probe in sorted({1, max(1, n_lists // 16), max(1, n_lists // 8), max(1, n_lists // 4)}):
+        ivf, ivf_ms = timed(lambda: store.query(queries, args.top_k, n_probe=n_probe), args.repeats)
+        report[f"numpy_ivf_{n_lists}_probe_{n_probe}"] = {
+            "p50_ms": statistics.median(ivf_ms),
+            "recall": recall_at_k(exact["ids"], ivf["ids"], args.top_k),
+        }
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,129 @@
+import logging
+import os
+from dataclasses import replace
+
 import streamlit as st
-from langchain_openai import ChatOpenAI
+
+from history_manager import HistoryManager, llm_summarizer
+
+# retrieval, page images and the OpenAI client are imported on first use, so the first
+# render only waits for streamlit; the cached resources below keep them for later reruns
+TOP_K = int(os.environ.get("CHAT_TOP_K", "4"))
+PAGE_IMAGE_MAX_DIM = int(os.environ.get("PAGE_IMAGE_MAX_DIM", "1024"))
+
+logger = logging.getLogger(__name__)
+
+
+@st.cache_resource
+def chat_model(model: str, **kwargs):
+    from clients import get_chat_model
+
+    # one pooled client per model for every rerun and session of this server
+    return get_chat_model(model, **kwargs)
+
+
+@st.cache_resource
+def retrieval():
+    from retrieval_service import RemoteRetrievalService
+
+    if os.environ.get("RETRIEVAL_SERVER_URL"):
+        # warm index in a long-running retrieval_server.py
+        return RemoteRetrievalService(os.environ["RETRIEVAL_SERVER_URL"], top_k=TOP_K)
+
+    from clients import get_cohere_client
+    from lexical_index import DEFAULT_INDEX_DIR, LexicalIndex
+    from vector_store import open_vector_store
+
+    collection = open_vector_store(
+        os.environ.get("RETRIEVAL_BACKEND", "chroma"),
+        os.environ.get("CHROMA_DIR", "./chroma_db"),
+        os.environ.get("CHROMA_COLLECTION", "pdf_pages"),
+    )
+    lexical_dir = os.environ.get("LEXICAL_INDEX_DIR", DEFAULT_INDEX_DIR)
+    lexical_index = LexicalIndex(lexical_dir) if os.path.isdir(lexical_dir) else None
+    api_key = os.environ.get("COHERE_API_KEY")
+    if not api_key:
+        raise RuntimeError("COHERE_API_KEY is not set")
+    return get_cohere_client(api_key), collection, lexical_index
+
+
+@st.cache_resource
+def page_images():
+    from page_images import CHAT_PROFILE, PageImageCache
+    from page_store import DEFAULT_STORE_DIR
+    from page_text import DEFAULT_TEXT_DIR, PageTexts
+
+    # page stores are opened on first use; recently sent pages stay encoded in an LRU.
+    # Pages with a usable text layer (see page_text.py) are sent as text instead of images
+    text_dir = os.environ.get("PAGE_TEXT_DIR", DEFAULT_TEXT_DIR)
+    return PageImageCache(
+        os.environ.get("PAGE_STORE_DIR", DEFAULT_STORE_DIR),
+        replace(CHAT_PROFILE, max_dim=PAGE_IMAGE_MAX_DIM),
+        texts=PageTexts(text_dir) if os.path.isdir(text_dir) else None,
+    )
+
+
+def retrieve_pages(question: str):
+    """Top-k page ids for the question and a "source, page" label for each.
+
+    Retrieval is best effort: without an index or ``COHERE_API_KEY``, or with the retrieval
+    server down, the turn is answered without pages and a warning is logged.
+    """
+    try:
+        from query_collection import query_results
+        from retrieval_service import RemoteRetrievalService
+
+        service = retrieval()
+        if isinstance(service, RemoteRetrievalService):
+            hits = service.query([question])["results"][question]
+            ids, metadatas = [hit["id"] for hit in hits], [hit["metadata"] for hit in hits]
+        else:
+            co_client, collection, lexical_index = service
+            results = query_results(co_client, collection, [question], "embed-v4.0", TOP_K, lexical_index=lexical_index)
+            ids, metadatas = results["ids"][0], results["metadatas"][0]
+    except Exception:
+        logger.warning("Page retrieval failed; answering without retrieved pages", exc_info=True)
+        return [], []
+    labels = [f"{(meta or {}).get('source', '?')}, p. {(meta or {}).get('page', 0) + 1}" for meta in metadatas]
+    return ids, labels
+
+
+def summarize(previous: str, messages):
+    # the summary model is built on the first summary, not on the first page render
+    return llm_summarizer(chat_model("gpt-4.1-mini"))(previous, messages)
+
 
 if "history" not in st.session_state:
-    st.session_state.history = []
+    # recent turns within a token budget; older ones folded into a rolling summary
+    st.session_state.history = HistoryManager(token_budget=6000, summarizer=summarize)
+
+history: HistoryManager = st.session_state.history
 
-for msg in st.session_state.history:
+for msg in history.messages:
     with st.chat_message(msg["role"]):
         st.markdown(msg["content"])
 
 user_input = st.chat_input("Type your message...")
 
 if user_input:
-    st.session_state.history.append({"role": "user", "content": user_input})
+    history.append({"role": "user", "content": user_input})
     with st.chat_message("user"):
         st.markdown(user_input)
 
+    # only this turn's request carries the retrieved pages; the history keeps the text
+    page_ids, labels = retrieve_pages(user_input)
+    pages = page_images().page_blocks(page_ids, labels) if page_ids else []
+    hint = f"\n\nAnswer using the attached pages ({'; '.join(labels)}) when relevant." if page_ids else ""
+    question = {"role": "user", "content": [{"type": "text", "text": f"{user_input}{hint}"}, *pages]}
+
     partial_text = ""
     with st.chat_message("assistant"):
         placeholder = st.empty()
-        llm = ChatOpenAI(model="gpt-4.1", temperature=0, streaming=True)
-        for chunk in llm.stream(st.session_state.history[-30:]):
+        llm = chat_model("gpt-4.1", streaming=True)
+        for chunk in llm.stream([*history.context()[:-1], question]):
             partial_text += chunk.content or ""  # type: ignore
             placeholder.markdown(partial_text)
+        if labels:
+            st.caption("Pages: " + "; ".join(labels))
 
-    st.session_state.history.append({"role": "assistant", "content": partial_text})
+    history.append({"role": "assistant", "content": partial_text})
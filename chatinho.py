@@ -27,16 +27,17 @@
 #         )
 #     )
 
-import json
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage
 
+from page_store import DEFAULT_STORE_DIR, PageStore, page_store_path
+
 if __name__ == "__main__":
     llm = ChatOpenAI(model="gpt-4.1", temperature=0)
 
-    # pega a página 60 (índice 59) já em base64 PNG
-    with open("pages_base64.json", "r") as f:
-        pdf_page_b64 = json.load(f)[59]
+    # pega a página 60 (índice 59) direto do page store, sem decodificar o livro inteiro
+    with PageStore(page_store_path(DEFAULT_STORE_DIR, "strom.pdf")) as pages:
+        pdf_page_url = pages.data_url(59)
 
     # monta mensagem multimodal correta
     msg = HumanMessage(
@@ -45,7 +46,7 @@ if __name__ == "__main__":
                 "type": "text",
                 "text": "Me diga o título e subtítulo desta página. Tenho baixa visão. Sobre o que eh esse conteiudo. Voce pode me explicar de uma formam bem simples?",
             },
-            {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{pdf_page_b64}"}},
+            {"type": "image_url", "image_url": {"url": pdf_page_url}},
         ]
     )
 
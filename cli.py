@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+cli.py
+
+One entry point for the ingest, query, serve and benchmark commands.
+
+Only the chosen command's module is imported, after its name has been read from the
+command line: ``cli.py --help`` loads nothing but argparse, ``cli.py query`` never loads
+the ingest pipeline (pdf2image, page stores) and ``cli.py query --server URL`` never loads
+chromadb or cohere. Each command module exposes ``DESCRIPTION``, ``add_arguments(parser)``
+and ``run(args)``. ``bench <name>`` runs ``bench-<name>.py`` with the remaining arguments;
+``bench startup`` profiles the import time of these entry points against a budget.
+
+Usage:
+  python cli.py ingest --pdf ./manuals --checkpoint ingest.json
+  python cli.py query --query impressum "XR-2040" --lexical_index ./lexical_index
+  python cli.py serve --port 8765
+  python cli.py bench retrieval --suite query --pages 2000
+  python cli.py bench startup --json
+"""
+import argparse
+import glob
+import importlib
+import os
+import runpy
+import sys
+from typing import Dict, List, Optional, Tuple
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# command -> (module, one-line help); the module is imported only when the command runs
+COMMANDS: Dict[str, Tuple[str, str]] = {
+    "ingest": ("ingest", "Embed PDFs page by page into the page index"),
+    "query": ("query_collection", "Query the page index (locally or through a retrieval server)"),
+    "serve": ("retrieval_server", "Serve the page index over HTTP with micro-batched queries"),
+}
+
+
+def bench_scripts() -> Dict[str, str]:
+    """``bench-<name>.py`` next to this file, by name."""
+    paths = glob.glob(os.path.join(HERE, "bench-*.py"))
+    return {os.path.basename(p)[len("bench-") : -len(".py")]: p for p in sorted(paths)}
+
+
+def run_bench(argv: List[str]) -> None:
+    scripts = bench_scripts()
+    usage = f"usage: cli.py bench {{{','.join(scripts)}}} [args...]"
+    if not argv or argv[0] in ("-h", "--help"):
+        print(usage)
+        sys.exit(0 if argv else 2)
+    if argv[0] not in scripts:
+        sys.exit(f"{usage}\ncli.py bench: unknown benchmark {argv[0]!r}")
+    name, rest = argv[0], argv[1:]
+    sys.argv = [scripts[name], *rest]
+    sys.path.insert(0, HERE)
+    runpy.run_path(scripts[name], run_name="__main__")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="cli.py", description="PDF page retrieval: ingest, query, serve, bench.")
+    commands = parser.add_subparsers(dest="command", metavar="command", required=True)
+    for name, (_, help_text) in COMMANDS.items():
+        commands.add_parser(name, help=help_text, add_help=False)
+    commands.add_parser("bench", help="Run bench-<name>.py, or 'startup' to profile import time", add_help=False)
+    # only the command name is parsed here; its own parser is built after importing its module
+    args, rest = parser.parse_known_args(argv)
+
+    if args.command == "bench":
+        run_bench(rest)
+        return
+    module = importlib.import_module(COMMANDS[args.command][0])
+    command_parser = argparse.ArgumentParser(prog=f"cli.py {args.command}", description=module.DESCRIPTION)
+    module.add_arguments(command_parser)
+    module.run(command_parser.parse_args(rest))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+clients.py
+
+Shared API clients with pooled, keep-alive HTTP connections.
+
+Building a ``ChatOpenAI`` or ``cohere.ClientV2`` per message also builds a fresh HTTP
+client, so every turn pays a new TCP + TLS handshake. The getters here return one client
+per configuration for the whole process, all backed by a single ``httpx`` connection
+pool (``HTTP_LIMITS``, ``HTTP_TIMEOUT``). Async clients are kept per event loop, because
+an ``httpx.AsyncClient``'s connections belong to the loop that opened them.
+
+In Streamlit, wrap the getters in ``st.cache_resource`` so reruns reuse them as well.
+``bench-clients.py`` measures the per-request overhead saved against a local stub server.
+"""
+import asyncio
+import threading
+import weakref
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import httpx
+
+HTTP_TIMEOUT = httpx.Timeout(60.0, connect=5.0)
+HTTP_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32, keepalive_expiry=120.0)
+MAX_RETRIES = 2
+
+_lock = threading.Lock()
+_http_client: Optional[httpx.Client] = None
+_async_http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+_cohere_clients: Dict[Tuple[Optional[str], Optional[str]], Any] = {}
+_chat_models: Dict[Tuple[Any, ...], Any] = {}
+_loop_chat_models: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple[Any, ...], Any]]" = weakref.WeakKeyDictionary()
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def http_client() -> httpx.Client:
+    """The process-wide pooled sync HTTP client."""
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            _http_client = httpx.Client(timeout=HTTP_TIMEOUT, limits=HTTP_LIMITS)
+        return _http_client
+
+
+def async_http_client() -> Optional[httpx.AsyncClient]:
+    """The pooled async HTTP client of the running event loop (``None`` outside a loop)."""
+    loop = _running_loop()
+    if loop is None:
+        return None
+    with _lock:
+        client = _async_http_clients.get(loop)
+        if client is None:
+            client = _async_http_clients[loop] = httpx.AsyncClient(timeout=HTTP_TIMEOUT, limits=HTTP_LIMITS)
+        return client
+
+
+def get_cohere_client(api_key: Optional[str] = None, base_url: Optional[str] = None) -> Any:
+    """Shared ``cohere.ClientV2`` per (api key, base url); the key defaults to ``COHERE_API_KEY``."""
+    import cohere
+
+    key = (api_key, base_url)
+    with _lock:
+        client = _cohere_clients.get(key)
+    if client is None:
+        client = cohere.ClientV2(
+            api_key=api_key, base_url=base_url, timeout=HTTP_TIMEOUT.read, httpx_client=http_client()
+        )
+        with _lock:
+            client = _cohere_clients.setdefault(key, client)
+    return client
+
+
+def get_chat_model(model: str = "gpt-4.1", tools: Sequence[Any] = (), **kwargs: Any) -> Any:
+    """Shared ``ChatOpenAI`` per configuration, with ``tools`` already bound if given.
+
+    Inside an event loop the model is cached per loop, since its async HTTP client is.
+    """
+    from langchain_openai import ChatOpenAI
+
+    kwargs.setdefault("temperature", 0)
+    key = (model, tuple(getattr(t, "name", repr(t)) for t in tools), tuple(sorted(kwargs.items())))
+    loop = _running_loop()
+    with _lock:
+        cache = _chat_models if loop is None else _loop_chat_models.setdefault(loop, {})
+        cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    llm = ChatOpenAI(
+        model=model,
+        timeout=HTTP_TIMEOUT.read,
+        max_retries=MAX_RETRIES,
+        http_client=http_client(),
+        http_async_client=async_http_client(),
+        **kwargs,
+    )
+    bound = llm.bind_tools(list(tools)) if tools else llm
+    with _lock:
+        return cache.setdefault(key, bound)
@@ -0,0 +1,144 @@
+"""
+context_assembly.py
+
+Turns the top-k hits of a batch of queries into the page context of one chat turn.
+
+Each hit is widened to its neighbor pages, clipped to the document's real page count
+(``page_count`` metadata), and the resulting ranges are merged per document with NumPy
+interval operations, so a page found by several queries -- or sitting next to another
+hit -- is fetched and sent only once. Merged ranges are ranked by a reciprocal-rank
+fused score and taken greedily until the token budget is spent.
+"""
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from page_ids import page_id, parse_page_id
+from token_counting import IMAGE_TOKENS
+
+RRF_K = 60
+DEFAULT_RADIUS = 1
+# prompt cost of one page image, charged the same as in the history budget
+DEFAULT_TOKENS_PER_PAGE = IMAGE_TOKENS
+
+
+@dataclass(frozen=True)
+class ContextRange:
+    doc_id: str
+    source: Optional[str]
+    first_page: int
+    last_page: int
+    score: float
+    hit_pages: Tuple[int, ...]
+
+    @property
+    def pages(self) -> range:
+        return range(self.first_page, self.last_page + 1)
+
+    @property
+    def page_ids(self) -> List[str]:
+        return [page_id(self.doc_id, p) if self.doc_id else str(p) for p in self.pages]
+
+    def __len__(self) -> int:
+        return self.last_page - self.first_page + 1
+
+
+def _flatten_hits(results: Dict[str, Any]):
+    """Chroma-shaped results (one list per query) -> per-hit doc/page/count/rank arrays."""
+    ids_per_query = results.get("ids") or []
+    metas_per_query = results.get("metadatas") or [None] * len(ids_per_query)
+
+    docs: List[str] = []
+    sources: Dict[str, Optional[str]] = {}
+    pages: List[int] = []
+    counts: List[int] = []
+    ranks: List[int] = []
+    for ids, metas in zip(ids_per_query, metas_per_query):
+        for rank, pid in enumerate(ids):
+            meta = (metas[rank] if metas else None) or {}
+            doc_id, page = parse_page_id(pid)
+            doc_id = meta.get("doc_id", doc_id)
+            page = int(meta.get("page", page))
+            docs.append(doc_id)
+            sources.setdefault(doc_id, meta.get("source"))
+            pages.append(page)
+            # legacy entries without page_count: never expand past the hit itself
+            counts.append(int(meta.get("page_count", page + 1)))
+            ranks.append(rank)
+    return docs, sources, np.array(pages, dtype=np.int64), np.array(counts, dtype=np.int64), np.array(ranks)
+
+
+def expand_ranges(pages: np.ndarray, page_counts: np.ndarray, radius: int = DEFAULT_RADIUS) -> Tuple[np.ndarray, np.ndarray]:
+    """Inclusive ``[page - radius, page + radius]`` windows clipped to ``[0, page_count - 1]``."""
+    start = np.maximum(pages - radius, 0)
+    end = np.minimum(pages + radius, np.maximum(page_counts, pages + 1) - 1)
+    return start, end
+
+
+def merge_ranges(doc: np.ndarray, start: np.ndarray, end: np.ndarray, adjacent: bool = True):
+    """Merge overlapping (and, with ``adjacent``, touching) inclusive ranges per document.
+
+    Returns ``(order, group, heads, merged_end)``: ``order`` sorts the input by (doc, start),
+    ``group[i]`` is the merged range of sorted input ``i``, ``heads`` indexes the first sorted
+    input of each merged range (its doc and start) and ``merged_end`` is the range's last page.
+    """
+    order = np.lexsort((start, doc))
+    doc, start, end = doc[order], start[order], end[order]
+
+    # running max of ``end`` that restarts per document: offset every document past the
+    # previous one so a single maximum.accumulate never leaks across documents
+    span = int(end.max()) + 2
+    reach = np.maximum.accumulate(end + doc * span) - doc * span
+
+    new = np.ones(len(order), dtype=bool)
+    new[1:] = (doc[1:] != doc[:-1]) | (start[1:] > reach[:-1] + (1 if adjacent else 0))
+    group = np.cumsum(new) - 1
+    heads = np.flatnonzero(new)
+    return order, group, heads, np.maximum.reduceat(end, heads)
+
+
+def assemble_context(
+    results: Dict[str, Any],
+    radius: int = DEFAULT_RADIUS,
+    token_budget: Optional[int] = None,
+    tokens_per_page: int = DEFAULT_TOKENS_PER_PAGE,
+    rrf_k: int = RRF_K,
+) -> List[ContextRange]:
+    """Deduplicated, ranked page ranges for the hits in ``results`` (``collection.query`` output).
+
+    A range whose neighbors do not fit in ``token_budget`` is trimmed to the span of its hit
+    pages; ranges that still do not fit are dropped.
+    """
+    docs, sources, pages, counts, ranks = _flatten_hits(results)
+    if not len(pages):
+        return []
+
+    doc_names, doc = np.unique(np.array(docs, dtype=object), return_inverse=True)
+    start, end = expand_ranges(pages, counts, radius)
+    order, group, heads, merged_end = merge_ranges(doc, start, end)
+
+    # reciprocal rank fusion: a page found by several queries, or a range holding several
+    # hits, outranks a single top hit of one query
+    scores = np.bincount(group, weights=1.0 / (rrf_k + ranks[order] + 1))
+    hit_pages = np.split(pages[order], heads[1:])
+
+    context: List[ContextRange] = []
+    used = 0
+    for g in np.argsort(-scores, kind="stable"):
+        first, last = int(start[order][heads[g]]), int(merged_end[g])
+        hits = tuple(sorted(set(hit_pages[g].tolist())))
+        if token_budget is not None:
+            if used + (last - first + 1) * tokens_per_page > token_budget:
+                first, last = hits[0], hits[-1]
+            if used + (last - first + 1) * tokens_per_page > token_budget:
+                continue
+            used += (last - first + 1) * tokens_per_page
+        doc_id = str(doc_names[doc[order][heads[g]]])
+        context.append(ContextRange(doc_id, sources.get(doc_id), first, last, float(scores[g]), hits))
+    return context
+
+
+def context_page_ids(context: Sequence[ContextRange]) -> List[str]:
+    """Page ids to fetch for ``context``, in rank order; each page appears once."""
+    return [pid for r in context for pid in r.page_ids]
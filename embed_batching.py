@@ -0,0 +1,206 @@
+"""
+embed_batching.py
+
+Batched, concurrent calls to Cohere ``ClientV2.embed``.
+
+Entries are packed into requests up to the API input limit (and a payload byte
+budget, since page images are large), a bounded thread pool keeps several
+requests in flight, and 429/5xx responses are retried with exponential backoff.
+Results always come back in the same order as the inputs.
+
+Anything with an ``embed(inputs=..., model=..., input_type=..., embedding_types=...)``
+method returning ``.embeddings.<type>`` (``float``, ``int8``, ``ubinary``, ...) works as a
+client, so a local fake can stand in for ``cohere.ClientV2``.
+"""
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+# Cohere embed accepts at most 96 inputs per call.
+MAX_INPUTS_PER_CALL = 96
+# Keep request bodies well below the API payload limit; one 200 DPI PNG page is a few MB.
+MAX_BATCH_BYTES = 16 * 1024 * 1024
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class RateLimiter:
+    """Token bucket limiting how many embed requests start per minute, shared across threads."""
+
+    def __init__(self, requests_per_minute: float, burst: Optional[int] = None):
+        self.interval = 60.0 / requests_per_minute
+        self.capacity = float(burst or max(1, int(requests_per_minute // 60)))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) / self.interval)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) * self.interval
+            time.sleep(wait)
+
+
+def entry_size(entry: dict) -> int:
+    """Approximate payload size of one input entry (text and data URLs dominate)."""
+    size = 0
+    for part in entry.get("content", []):
+        if part.get("type") == "text":
+            size += len(part.get("text", ""))
+        elif part.get("type") == "image_url":
+            size += len(part.get("image_url", {}).get("url", ""))
+    return size
+
+
+def pack_batches(
+    inputs: Sequence[dict], max_inputs: int = MAX_INPUTS_PER_CALL, max_bytes: int = MAX_BATCH_BYTES
+) -> List[List[int]]:
+    """Group input indexes into batches bounded by count and approximate payload size.
+
+    An entry larger than ``max_bytes`` still gets a batch of its own.
+    """
+    batches: List[List[int]] = []
+    current: List[int] = []
+    current_bytes = 0
+    for i, entry in enumerate(inputs):
+        size = entry_size(entry)
+        if current and (len(current) >= max_inputs or current_bytes + size > max_bytes):
+            batches.append(current)
+            current, current_bytes = [], 0
+        current.append(i)
+        current_bytes += size
+    if current:
+        batches.append(current)
+    return batches
+
+
+def is_retryable(exc: Exception) -> bool:
+    status = getattr(exc, "status_code", None)
+    return status in RETRYABLE_STATUS
+
+
+def _retry_after(exc: Exception) -> Optional[float]:
+    headers = getattr(exc, "headers", None) or {}
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def embed_with_retry(
+    co_client: Any,
+    batch: List[dict],
+    model: str,
+    input_type: str = "search_document",
+    embedding_types: Sequence[str] = ("float",),
+    max_retries: int = 5,
+    base_delay: float = 1.0,
+    max_delay: float = 30.0,
+    sleep: Callable[[float], None] = time.sleep,
+    rate_limiter: Optional[RateLimiter] = None,
+):
+    """Call ``co_client.embed`` for one batch, retrying 429/5xx with jittered exponential backoff.
+
+    A ``Retry-After`` header replaces the backoff, capped at ``max_delay`` as well.
+    """
+    attempt = 0
+    while True:
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        try:
+            return co_client.embed(
+                inputs=batch,
+                model=model,
+                input_type=input_type,
+                embedding_types=list(embedding_types),
+            )
+        except Exception as exc:
+            if attempt >= max_retries or not is_retryable(exc):
+                raise
+            delay = _retry_after(exc)
+            if delay is None:
+                delay = min(max_delay, base_delay * (2**attempt)) * (0.5 + random.random() / 2)
+            else:
+                # a large or bogus Retry-After must not stall the whole ingest
+                delay = min(max(delay, 0.0), max_delay)
+            sleep(delay)
+            attempt += 1
+
+
+def embed_inputs_by_type(
+    co_client: Any,
+    inputs: Sequence[dict],
+    model: str,
+    input_type: str = "search_document",
+    embedding_types: Sequence[str] = ("float",),
+    max_inputs: int = MAX_INPUTS_PER_CALL,
+    max_bytes: int = MAX_BATCH_BYTES,
+    max_workers: int = 4,
+    max_retries: int = 5,
+    rate_limiter: Optional[RateLimiter] = None,
+) -> Dict[str, List[list]]:
+    """Embed ``inputs`` in packed batches with at most ``max_workers`` requests in flight.
+
+    Pass the same ``rate_limiter`` to concurrent callers to share one request budget.
+    Returns one vector per input, in input order, for each of ``embedding_types``.
+    """
+    batches = pack_batches(inputs, max_inputs=max_inputs, max_bytes=max_bytes)
+    embeddings: Dict[str, List[Optional[list]]] = {t: [None] * len(inputs) for t in embedding_types}
+
+    def run(indexes: List[int]) -> None:
+        res = embed_with_retry(
+            co_client,
+            [inputs[i] for i in indexes],
+            model,
+            input_type,
+            embedding_types=embedding_types,
+            max_retries=max_retries,
+            rate_limiter=rate_limiter,
+        )
+        for t in embedding_types:
+            for i, emb in zip(indexes, getattr(res.embeddings, t)):
+                embeddings[t][i] = emb
+
+    if len(batches) <= 1 or max_workers <= 1:
+        for indexes in batches:
+            run(indexes)
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as pool:
+            # list() re-raises the first failed batch
+            list(pool.map(run, batches))
+
+    return embeddings  # type: ignore[return-value]
+
+
+def embed_inputs(
+    co_client: Any,
+    inputs: Sequence[dict],
+    model: str,
+    input_type: str = "search_document",
+    max_inputs: int = MAX_INPUTS_PER_CALL,
+    max_bytes: int = MAX_BATCH_BYTES,
+    max_workers: int = 4,
+    max_retries: int = 5,
+    rate_limiter: Optional[RateLimiter] = None,
+) -> List[List[float]]:
+    """Float embeddings for ``inputs``, in input order (see ``embed_inputs_by_type``)."""
+    return embed_inputs_by_type(
+        co_client,
+        inputs,
+        model,
+        input_type,
+        ("float",),
+        max_inputs=max_inputs,
+        max_bytes=max_bytes,
+        max_workers=max_workers,
+        max_retries=max_retries,
+        rate_limiter=rate_limiter,
+    )["float"]
@@ -0,0 +1,101 @@
+"""
+embedding_cache.py
+
+Persistent, content-addressed cache of embedding vectors.
+
+Vectors are keyed by (hash of the rendered page, model, input_type, dpi[, embedding
+type]) and kept in a small SQLite file, so re-ingesting a revised PDF only sends the
+pages whose rendering actually changed. The cache is bounded by ``max_entries``; when it grows
+past that, the least recently used vectors are evicted.
+"""
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional, Sequence
+
+DEFAULT_CACHE_PATH = "./embedding_cache.sqlite"
+
+
+def content_hash(entry: dict) -> str:
+    """sha256 over the text and image parts of an embed input entry.
+
+    The image part is the base64 data URL of the rendered page, so this is a hash of
+    the rendered page bytes (plus the accompanying text).
+    """
+    digest = hashlib.sha256()
+    for part in entry.get("content", []):
+        if part.get("type") == "text":
+            digest.update(b"t:" + part.get("text", "").encode("utf-8"))
+        elif part.get("type") == "image_url":
+            digest.update(b"i:" + part.get("image_url", {}).get("url", "").encode("utf-8"))
+    return digest.hexdigest()
+
+
+def cache_key(
+    page_hash: str, model: str, input_type: str, dpi: Optional[int], embedding_type: str = "float"
+) -> str:
+    key = f"{page_hash}:{model}:{input_type}:{dpi or ''}"
+    return key if embedding_type == "float" else f"{key}:{embedding_type}"
+
+
+class EmbeddingCache:
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = 50_000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def __len__(self) -> int:
+        return self._count
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, List[float]]:
+        """Return the cached vectors for ``keys`` (misses are left out) and mark them as used."""
+        found: Dict[str, List[float]] = {}
+        if not keys:
+            return found
+        with self._lock:
+            # stay under SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                chunk = list(keys[start : start + 500])
+                marks = ",".join("?" * len(chunk))
+                for key, blob in self._conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({marks})", chunk):
+                    found[key] = array("f", blob).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, k) for k in found])
+                self._conn.commit()
+        return found
+
+    def put_many(self, items: Dict[str, Sequence[float]]) -> None:
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, array("f", vector).tobytes(), now) for key, vector in items.items()],
+            )
+            self._count += self._conn.total_changes - before
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        excess = self._count - self.max_entries
+        if excess <= 0:
+            return
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)", (excess,)
+        )
+        self._count -= excess
+
+    def close(self) -> None:
+        self._conn.close()
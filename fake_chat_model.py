@@ -0,0 +1,84 @@
+"""
+fake_chat_model.py
+
+Scripted streaming chat model for exercising ``ok.company_assistant`` without an API key.
+
+``FakeStreamingChatModel`` answers the ``bind_tools`` / ``astream`` calls the assistant
+makes with pre-written replies, streamed the way OpenAI does it: the text in small
+chunks, then each tool call's JSON arguments split across several ``tool_call_chunks``,
+then a usage-only chunk. Each ``astream`` call plays the next reply of the script, so a
+script of ``[reply with tool calls, final answer]`` drives one tool round.
+
+  llm = FakeStreamingChatModel([
+      ScriptedReply("Let me check. ", [{"name": "search", "args": {"queries": ["impressum"]}}]),
+      ScriptedReply("Here is what I found."),
+  ], chunk_delay=0.01)
+  async for chunk in company_assistant(message, history, llm=llm): ...
+"""
+import asyncio
+import json
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Sequence
+
+from langchain_core.messages import AIMessageChunk, BaseMessage
+
+
+@dataclass(frozen=True)
+class ScriptedReply:
+    text: str = ""
+    tool_calls: Sequence[Dict[str, Any]] = field(default_factory=tuple)
+
+
+class FakeStreamingChatModel:
+    def __init__(self, script: Sequence[ScriptedReply], chunk_delay: float = 0.0, chunk_size: int = 4):
+        self.script = list(script)
+        self.chunk_delay = chunk_delay
+        self.chunk_size = chunk_size
+        self.calls: List[List[BaseMessage]] = []
+
+    def bind_tools(self, tools: Sequence[Any]) -> "FakeStreamingChatModel":
+        return self
+
+    def _pieces(self, text: str) -> List[str]:
+        return [text[i : i + self.chunk_size] for i in range(0, len(text), self.chunk_size)]
+
+    async def astream(self, messages: Sequence[BaseMessage]) -> AsyncIterator[AIMessageChunk]:
+        """Stream the next scripted reply (the last one repeats once the script runs out)."""
+        self.calls.append(list(messages))
+        reply = self.script[min(len(self.calls), len(self.script)) - 1]
+
+        chunks = [AIMessageChunk(content=piece) for piece in self._pieces(reply.text)]
+        for index, tool_call in enumerate(reply.tool_calls):
+            call_id = tool_call.get("id") or f"call_{uuid.uuid4().hex[:12]}"
+            for n, piece in enumerate(self._pieces(json.dumps(tool_call["args"]))):
+                chunks.append(
+                    AIMessageChunk(
+                        content="",
+                        tool_call_chunks=[
+                            {
+                                "name": tool_call["name"] if n == 0 else None,
+                                "args": piece,
+                                "id": call_id if n == 0 else None,
+                                "index": index,
+                            }
+                        ],
+                    )
+                )
+        output_tokens = len(chunks)
+        input_tokens = sum(len(str(m.content)) // 4 for m in messages)
+        chunks.append(
+            AIMessageChunk(
+                content="",
+                usage_metadata={
+                    "input_tokens": input_tokens,
+                    "output_tokens": output_tokens,
+                    "total_tokens": input_tokens + output_tokens,
+                },
+            )
+        )
+
+        for chunk in chunks:
+            if self.chunk_delay:
+                await asyncio.sleep(self.chunk_delay)
+            yield chunk
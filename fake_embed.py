@@ -0,0 +1,138 @@
+"""
+fake_embed.py
+
+Deterministic local stand-in for ``cohere.ClientV2.embed``, for benchmarks and offline runs.
+
+``FakeEmbedClient`` hashes every input into a unit vector: the words of its text parts
+(feature hashing, so texts that share words get similar vectors and a query can find
+its page) and the bytes of its images. The same input always gives the same vector, on
+any machine. It takes ``texts=`` or multimodal ``inputs=`` like the real client and
+returns ``.embeddings.float`` / ``.int8`` / ``.ubinary``.
+
+To look like the API under load it can add ``latency`` per call plus
+``latency_per_input`` per input, and enforce ``rate_limit`` calls per second: calls over
+the limit fail with a 429 ``FakeApiError`` carrying ``retry-after``, which
+``embed_batching.embed_with_retry`` backs off from like a real rate limit.
+
+  co_client = FakeEmbedClient(dim=1024, latency=0.05, rate_limit=10)
+  query_collection(co_client, collection, ["impressum"], "embed-v4.0")
+"""
+import hashlib
+import re
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from embed_batching import MAX_INPUTS_PER_CALL
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+class FakeApiError(Exception):
+    def __init__(self, status_code: int, message: str, headers: Optional[Dict[str, str]] = None):
+        super().__init__(f"{status_code}: {message}")
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+def _bucket(token: bytes, dim: int) -> "tuple[int, float]":
+    digest = hashlib.blake2b(token, digest_size=8).digest()
+    value = int.from_bytes(digest, "little")
+    return value % dim, 1.0 if value >> 63 else -1.0
+
+
+def hash_vector(text: str = "", image_bytes: Sequence[bytes] = (), dim: int = 1024) -> np.ndarray:
+    """Unit vector from the words of ``text`` and 64-byte shingles of ``image_bytes``."""
+    vector = np.zeros(dim, dtype=np.float32)
+    for word in _WORD.findall(text.casefold()):
+        index, sign = _bucket(word.encode("utf-8"), dim)
+        vector[index] += sign
+    for data in image_bytes:
+        for start in range(0, len(data), 4096):
+            index, sign = _bucket(data[start : start + 64], dim)
+            vector[index] += sign
+    norm = np.linalg.norm(vector)
+    if not norm:
+        # empty input: a fixed, non-zero vector
+        vector[_bucket(b"", dim)[0]] = 1.0
+        return vector
+    return vector / norm
+
+
+def _parts(entry: Any) -> "tuple[str, List[bytes]]":
+    if isinstance(entry, str):
+        return entry, []
+    texts, images = [], []
+    for part in entry.get("content", []):
+        if part.get("type") == "text":
+            texts.append(part.get("text", ""))
+        elif part.get("type") == "image_url":
+            images.append(part.get("image_url", {}).get("url", "").encode("utf-8"))
+    return " ".join(texts), images
+
+
+class FakeEmbedClient:
+    def __init__(
+        self,
+        dim: int = 1024,
+        latency: float = 0.0,
+        latency_per_input: float = 0.0,
+        rate_limit: Optional[float] = None,
+        max_inputs: int = MAX_INPUTS_PER_CALL,
+    ):
+        self.dim = dim
+        self.latency = latency
+        self.latency_per_input = latency_per_input
+        self.rate_limit = rate_limit
+        self.max_inputs = max_inputs
+        self.calls = self.inputs = self.rejected = 0
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_calls = 0
+
+    def _admit(self) -> None:
+        if self.rate_limit is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window_start >= 1.0:
+                self._window_start, self._window_calls = now, 0
+            if self._window_calls >= self.rate_limit:
+                self.rejected += 1
+                retry_after = 1.0 - (now - self._window_start)
+                raise FakeApiError(429, "rate limit exceeded", {"retry-after": f"{retry_after:.3f}"})
+            self._window_calls += 1
+
+    def embed(
+        self,
+        texts: Optional[Sequence[str]] = None,
+        inputs: Optional[Sequence[dict]] = None,
+        model: str = "embed-v4.0",
+        input_type: str = "search_document",
+        embedding_types: Sequence[str] = ("float",),
+        **_: Any,
+    ) -> Any:
+        items = list(texts if texts is not None else inputs or [])
+        if len(items) > self.max_inputs:
+            raise FakeApiError(400, f"at most {self.max_inputs} inputs per call, got {len(items)}")
+        self._admit()
+        with self._lock:
+            self.calls += 1
+            self.inputs += len(items)
+        time.sleep(self.latency + self.latency_per_input * len(items))
+
+        matrix = np.stack([hash_vector(*_parts(item), dim=self.dim) for item in items]) if items else np.zeros((0, self.dim))
+        embeddings: Dict[str, List[list]] = {}
+        for kind in embedding_types:
+            if kind == "float":
+                embeddings[kind] = matrix.tolist()
+            elif kind == "int8":
+                embeddings[kind] = np.clip(np.round(matrix * 127 / max(np.abs(matrix).max(), 1e-9)), -128, 127).astype(int).tolist()
+            elif kind == "ubinary":
+                embeddings[kind] = np.packbits(matrix > 0, axis=1).astype(int).tolist()
+            else:
+                raise FakeApiError(400, f"unsupported embedding type {kind!r}")
+        return SimpleNamespace(id="fake", embeddings=SimpleNamespace(**embeddings), texts=texts, meta=None)
@@ -0,0 +1,234 @@
+"""
+history_manager.py
+
+Token-budgeted chat history.
+
+Instead of a fixed ``history[-30:]`` slice, ``HistoryManager.context()`` sends the most
+recent turns that fit ``token_budget`` and folds everything older into a rolling
+summary:
+
+- each message's token count is computed once, when it is appended,
+- turns leave the window in blocks (down to ``refill_ratio`` of the budget), and only
+  the newly dropped turns are passed to the summarizer together with the previous
+  summary, so the summary is extended rather than recomputed -- and the request prefix
+  stays unchanged for many turns in a row, which keeps provider prompt caching useful,
+- tool outputs are replaced by a short placeholder in all but the latest
+  ``tool_output_turns`` turns, the one being answered included (the tool call itself is
+  kept so the transcript stays valid),
+- the turn being answered is never summarized away; if it alone exceeds the budget, its
+  tool outputs are truncated to ``refill_ratio`` of it (and a warning is logged if the
+  turn still does not fit).
+
+Async callers use ``await acontext()``, which runs the summarizer -- an LLM call with
+``llm_summarizer`` -- in a worker thread instead of on the event loop.
+
+Messages may be ``{"role", "content"}`` dicts (``chat.py``) or LangChain messages.
+"""
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.messages import SystemMessage
+
+from token_counting import count_tokens, message_tokens
+
+logger = logging.getLogger(__name__)
+
+TOOL_OUTPUT_PLACEHOLDER = "[tool output omitted]"
+TRUNCATED_SUFFIX = "\n[tool output truncated]"
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+Summarizer = Callable[[str, List[Any]], str]
+
+
+def role(message: Any) -> str:
+    if isinstance(message, dict):
+        return message.get("role", "")
+    return {"human": "user", "ai": "assistant"}.get(message.type, message.type)
+
+
+def text_of(message: Any) -> str:
+    content = message.get("content", "") if isinstance(message, dict) else message.content
+    if isinstance(content, str):
+        return content
+    return " ".join(p if isinstance(p, str) else p.get("text", "") for p in content)
+
+
+def extractive_summarizer(max_tokens: int = 600) -> Summarizer:
+    """No-API summarizer: the first line of every user/assistant message, newest kept within ``max_tokens``."""
+
+    def summarize(previous: str, messages: List[Any]) -> str:
+        lines = previous.splitlines() if previous else []
+        for message in messages:
+            if role(message) in ("user", "assistant") and text_of(message).strip():
+                first_line = text_of(message).strip().splitlines()[0][:200]
+                lines.append(f"- {role(message)}: {first_line}")
+        while len(lines) > 1 and count_tokens("\n".join(lines)) > max_tokens:
+            lines.pop(0)
+        return "\n".join(lines)
+
+    return summarize
+
+
+def llm_summarizer(llm: Any, max_tokens: int = 600) -> Summarizer:
+    """Summarizer that asks ``llm`` to extend the previous summary with the newly dropped messages."""
+
+    def summarize(previous: str, messages: List[Any]) -> str:
+        transcript = "\n".join(f"{role(m)}: {text_of(m)}" for m in messages if role(m) in ("user", "assistant"))
+        request = (
+            f"Update the running summary of a support conversation with the new messages below. "
+            f"Keep facts, names, product codes and open questions; stay under {max_tokens} tokens. "
+            f"Answer with the updated summary only.\n\n"
+            f"<summary>\n{previous}\n</summary>\n\n<new_messages>\n{transcript}\n</new_messages>"
+        )
+        return str(llm.invoke([{"role": "user", "content": request}]).content)
+
+    return summarize
+
+
+class HistoryManager:
+    def __init__(
+        self,
+        token_budget: int = 6000,
+        refill_ratio: float = 0.6,
+        tool_output_turns: int = 2,
+        summarizer: Optional[Summarizer] = None,
+    ):
+        self.token_budget = token_budget
+        self.refill_ratio = refill_ratio
+        self.tool_output_turns = tool_output_turns
+        self.summarizer = summarizer or extractive_summarizer()
+        self.messages: List[Any] = []
+        self.summary = ""
+        self._tokens: List[int] = []
+        self._stripped_tokens: Dict[int, int] = {}
+        self._turn_starts: List[int] = []
+        # messages before this index live only in the summary
+        self._window_start = 0
+        self._summary_message: Any = None
+
+    def append(self, message: Any) -> None:
+        if role(message) == "user":
+            self._turn_starts.append(len(self.messages))
+        self.messages.append(message)
+        self._tokens.append(message_tokens(message))
+
+    def extend(self, messages: List[Any]) -> None:
+        for message in messages:
+            self.append(message)
+
+    @staticmethod
+    def _with_content(message: Any, content: str) -> Any:
+        if isinstance(message, dict):
+            return {**message, "content": content}
+        return message.model_copy(update={"content": content})
+
+    def _strip(self, message: Any) -> Any:
+        return self._with_content(message, TOOL_OUTPUT_PLACEHOLDER)
+
+    def _truncate(self, message: Any, max_tokens: int) -> Any:
+        """``message`` with its text cut to fit ``max_tokens``, or the placeholder if nothing fits."""
+        text = text_of(message)
+        truncated, keep = message, len(text)
+        while keep > 0 and message_tokens(truncated) > max_tokens:
+            keep = min(keep - 1, int(keep * max_tokens / message_tokens(truncated)))
+            truncated = self._with_content(message, text[:keep] + TRUNCATED_SUFFIX)
+        return truncated if message_tokens(truncated) <= max_tokens else self._strip(message)
+
+    def _fit_latest_turn(self, budget: int, keep_tools_from: int, target: Optional[int] = None) -> None:
+        """If the latest turn alone exceeds ``budget``, truncate its tool outputs to fit ``target``.
+
+        ``target`` defaults to ``budget``. The truncated copies replace the originals, so later requests of the turn send the
+        same messages. Smaller outputs are kept whole and the larger ones share what is left.
+        """
+        start = max(self._turn_starts[-1] if self._turn_starts else 0, self._window_start)
+        latest = range(start, len(self.messages))
+        used = sum(self._cost(i, keep_tools_from) for i in latest)
+        if used <= budget:
+            return
+        target = budget if target is None else target
+        tools = [i for i in latest if i >= keep_tools_from and role(self.messages[i]) == "tool"]
+        left = target - (used - sum(self._tokens[i] for i in tools))
+        truncated = 0
+        for n, i in enumerate(sorted(tools, key=lambda i: self._tokens[i])):
+            share = max(left, 0) // (len(tools) - n)
+            if self._tokens[i] > share:
+                self.messages[i] = self._truncate(self.messages[i], share)
+                self._tokens[i] = message_tokens(self.messages[i])
+                truncated += 1
+            left -= self._tokens[i]
+        used = sum(self._cost(i, keep_tools_from) for i in latest)
+        if truncated:
+            logger.warning("Truncated %d tool outputs of the latest turn to fit the history budget", truncated)
+        if used > budget:
+            logger.warning("Latest turn takes %d tokens, over the history budget of %d", used, budget)
+
+    def _stripped_from(self) -> int:
+        """Index of the first message whose tool outputs are kept."""
+        turns = self._turn_starts
+        if self.tool_output_turns <= 0 or not turns:
+            return len(self.messages)
+        return turns[-self.tool_output_turns] if len(turns) >= self.tool_output_turns else turns[0]
+
+    def _cost(self, i: int, keep_tools_from: int) -> int:
+        if i >= keep_tools_from or role(self.messages[i]) != "tool":
+            return self._tokens[i]
+        if i not in self._stripped_tokens:
+            self._stripped_tokens[i] = message_tokens(self._strip(self.messages[i]))
+        return self._stripped_tokens[i]
+
+    def _window_tokens(self, start: int, keep_tools_from: int) -> int:
+        return sum(self._cost(i, keep_tools_from) for i in range(start, len(self.messages)))
+
+    def _compact(self) -> None:
+        keep_tools_from = self._stripped_from()
+        budget = self.token_budget - (message_tokens(self._summary_message) if self._summary_message else 0)
+        if self._window_tokens(self._window_start, keep_tools_from) <= budget:
+            return
+        # an oversized latest turn is cut to refill_ratio of the budget, like the window, so
+        # the reply and follow-up requests of the turn still fit without cutting it again
+        self._fit_latest_turn(budget, keep_tools_from, int(self.refill_ratio * budget))
+        if self._window_tokens(self._window_start, keep_tools_from) <= budget:
+            return
+
+        # drop whole turns from the front until the window is back under refill_ratio of what
+        # the summary leaves of the budget, but never the latest turn
+        target = self.refill_ratio * budget
+        starts = [s for s in self._turn_starts if s > self._window_start]
+        new_start = self._window_start
+        remaining = self._window_tokens(self._window_start, keep_tools_from)
+        for start in starts[:-1]:
+            if remaining <= target:
+                break
+            remaining -= sum(self._cost(i, keep_tools_from) for i in range(new_start, start))
+            new_start = start
+        if new_start == self._window_start:
+            return
+
+        self.summary = self.summarizer(self.summary, self.messages[self._window_start : new_start])
+        self._window_start = new_start
+        # same message style as the history it summarizes
+        if isinstance(self.messages[0], dict):
+            self._summary_message = {"role": "system", "content": SUMMARY_PREFIX + self.summary}
+        else:
+            self._summary_message = SystemMessage(SUMMARY_PREFIX + self.summary)
+        # the grown summary leaves less of the budget to the latest turn
+        self._fit_latest_turn(self.token_budget - message_tokens(self._summary_message), keep_tools_from)
+
+    def context(self) -> List[Any]:
+        """Messages to send: the rolling summary (if any) and the recent turns within the budget."""
+        self._compact()
+        keep_tools_from = self._stripped_from()
+        window = [
+            self._strip(m) if i < keep_tools_from and role(m) == "tool" else m
+            for i, m in enumerate(self.messages[self._window_start :], start=self._window_start)
+        ]
+        return [self._summary_message, *window] if self._summary_message is not None else window
+
+    async def acontext(self) -> List[Any]:
+        """``context()`` for async callers; summarizing runs in a worker thread, off the event loop."""
+        await asyncio.to_thread(self._compact)
+        return self.context()
+
+    def context_tokens(self) -> int:
+        return sum(message_tokens(m) for m in self.context())
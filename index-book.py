@@ -1,16 +1,11 @@
-import base64, json
-from pdf2image import convert_from_path
-from io import BytesIO
+from page_stream import encode_image, iter_page_images, prefetch
+from page_ids import document_key
+from page_store import DEFAULT_STORE_DIR, PageStoreWriter, page_store_path
 
 pdf_path = "strom.pdf"
-pages = convert_from_path(pdf_path, dpi=200)
 
-base64_pages = []
-for page in pages:
-    buf = BytesIO()
-    page.save(buf, format="PNG")
-    b64 = base64.b64encode(buf.getvalue()).decode("utf-8")
-    base64_pages.append(b64)
-
-with open("pages_base64.json", "w") as f:
-    json.dump(base64_pages, f)
+# Pages are rendered a few at a time and appended to the page store as they arrive,
+# so memory stays bounded by the chunk size instead of the book length.
+with PageStoreWriter(page_store_path(DEFAULT_STORE_DIR, document_key(pdf_path)), "image/png") as store:
+    for _, page in prefetch(iter_page_images(pdf_path, dpi=200)):
+        store.add(encode_image(page, "PNG"))
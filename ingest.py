@@ -0,0 +1,611 @@
+#!/usr/bin/env python3
+"""
+ingest.py
+
+Convert PDFs to per-page multimodal inputs and generate/store embeddings
+using Cohere Embed v4 and ChromaDB, adapted from the Cohere docs:
+https://docs.cohere.com/v2/docs/semantic-search-embed#multimodal-pdf-search
+
+chromadb and pdf2image are only imported once a collection is opened or a page is
+rendered, so importing this module (``bench-retrieval.py``, ``cli.py ingest --help``)
+stays cheap.
+
+Usage:
+  export COHERE_API_KEY="..."
+  python cli.py ingest --pdf /path/to/file.pdf
+  python cli.py ingest --pdf ./manuals "./archive/**/*.pdf" --checkpoint ingest.json
+  python pdf-to-embed.py --pdf /path/to/file.pdf   # same as cli.py ingest
+
+"""
+import base64
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
+from itertools import groupby
+from typing import Iterable, Iterator, List, Tuple, Optional, Dict, Sequence
+
+from embed_batching import MAX_INPUTS_PER_CALL, RateLimiter, embed_inputs_by_type
+from embedding_cache import DEFAULT_CACHE_PATH, EmbeddingCache, cache_key, content_hash
+from lexical_index import DEFAULT_INDEX_DIR, lexical_index_path, write_shard
+from page_encoding import DEFAULT_PROFILE, PROFILES, EncodingProfile, encode_page
+from page_ids import document_id, document_key, page_id, pdf_sources
+from page_store import DEFAULT_STORE_DIR, PageStoreWriter, page_store_path
+from page_text import DEFAULT_TEXT_DIR, extract_layout, page_text_path, write_page_text
+from vector_store import QUANTIZATIONS, pack_quantized
+from page_stream import (
+    DEFAULT_CHUNK_SIZE,
+    chunked,
+    iter_page_images,
+    map_ordered,
+    page_count,
+    render_pages,
+)
+
+
+POPPLER_PATH = "/opt/homebrew/bin"
+
+
+def page_entry(pdf_path: str, image_bytes: bytes, mime_type: str = "image/png") -> dict:
+    """Build one Cohere embed input entry from a rendered page."""
+    base64_str = base64.b64encode(image_bytes).decode("utf-8")
+    base64_image = f"data:{mime_type};base64,{base64_str}"
+    return {
+        "content": [
+            {"type": "text", "text": f"{os.path.basename(pdf_path)}"},
+            {"type": "image_url", "image_url": {"url": base64_image}},
+        ]
+    }
+
+
+def iter_image_entries(
+    pdf_path: str,
+    dpi: int = 200,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    profile: EncodingProfile = DEFAULT_PROFILE,
+) -> Iterator[dict]:
+    """Lazily render and encode pages, ``chunk_size`` pages at a time."""
+    for _, page in iter_page_images(pdf_path, dpi=dpi, chunk_size=chunk_size, poppler_path=POPPLER_PATH):
+        yield page_entry(pdf_path, encode_page(page, profile), profile.mime_type)
+
+
+def pdf_to_image_entries(pdf_path: str, dpi: int = 200, profile: EncodingProfile = DEFAULT_PROFILE) -> List[dict]:
+    """Convert a PDF into a list of input entries suitable for Cohere embed API.
+
+    Each page becomes an entry with a small text field and a base64-encoded image URL
+    (lossless PNG unless another encoding ``profile`` is given).
+    Prefer ``iter_image_entries`` for large documents; this keeps every page in memory.
+    """
+    return list(iter_image_entries(pdf_path, dpi=dpi, profile=profile))
+
+
+def open_collection(
+    collection_name: str = "pdf_pages", persist_dir: Optional[str] = None
+) -> Tuple["chromadb.api.ClientAPI", "chromadb.api.models.Collection"]:
+    import chromadb
+
+    # Use PersistentClient when a persist_dir is provided so no separate server is needed
+    if persist_dir:
+        # PersistentClient will manage on-disk storage (duckdb+parquet) at the given path
+        chroma_client = chromadb.PersistentClient(path=persist_dir)
+    else:
+        chroma_client = chromadb.Client()
+
+    # get_or_create_collection avoids race/errors if already exists
+    try:
+        collection = chroma_client.get_or_create_collection(name=collection_name)
+    except Exception:
+        # fallback to create_collection for older chromadb versions
+        collection = chroma_client.create_collection(collection_name)
+    return chroma_client, collection
+
+
+def embed_window(
+    co_client: "cohere.ClientV2",
+    entries: List[dict],
+    hashes: List[str],
+    model: str,
+    batch_size: int = MAX_INPUTS_PER_CALL,
+    max_workers: int = 4,
+    cache: Optional[EmbeddingCache] = None,
+    dpi: Optional[int] = None,
+    rate_limiter: Optional[RateLimiter] = None,
+    embedding_types: Sequence[str] = ("float",),
+) -> Tuple[Dict[str, List[list]], int]:
+    """Embed ``entries``, serving what it can from ``cache``.
+
+    A page is a cache hit only if every requested embedding type is cached.
+    Returns the embeddings in order per type and how many pages needed an API call.
+    """
+    keys = {t: [cache_key(h, model, "search_document", dpi, t) for h in hashes] for t in embedding_types}
+    cached = cache.get_many([k for type_keys in keys.values() for k in type_keys]) if cache is not None else {}
+    missing = [i for i in range(len(entries)) if any(keys[t][i] not in cached for t in embedding_types)]
+
+    fresh = embed_inputs_by_type(
+        co_client,
+        [entries[i] for i in missing],
+        model,
+        input_type="search_document",
+        embedding_types=embedding_types,
+        max_inputs=batch_size,
+        max_workers=max_workers,
+        rate_limiter=rate_limiter,
+    )
+    if cache is None:
+        return fresh, len(missing)
+
+    embeddings = {t: [cached.get(key) for key in keys[t]] for t in embedding_types}
+    for t in embedding_types:
+        for i, emb in zip(missing, fresh[t]):
+            embeddings[t][i] = emb
+    cache.put_many({keys[t][i]: emb for t in embedding_types for i, emb in zip(missing, fresh[t])})
+    return embeddings, len(missing)  # type: ignore[return-value]
+
+
+def _stored_pages(collection: "chromadb.api.models.Collection", doc_id: str) -> Dict[str, tuple]:
+    """``{page id: (content_hash, page_count, model, {quantized types})}`` of a document's stored pages."""
+    stored = collection.get(where={"doc_id": doc_id}, include=["metadatas"])
+    existing = {}
+    for pid, metadata in zip(stored["ids"], stored["metadatas"]):
+        metadata = metadata or {}
+        existing[pid] = (
+            metadata.get("content_hash"),
+            metadata.get("page_count"),
+            metadata.get("model"),
+            {t for t in QUANTIZATIONS if t in metadata},
+        )
+    return existing
+
+
+def embed_pages_and_store(
+    co_client: "cohere.ClientV2",
+    input_array: Iterable[dict],
+    model: str,
+    collection_name: str = "pdf_pages",
+    persist_dir: Optional[str] = None,
+    batch_size: int = MAX_INPUTS_PER_CALL,
+    max_workers: int = 4,
+    window_size: int = 32,
+    cache: Optional[EmbeddingCache] = None,
+    dpi: Optional[int] = None,
+    source: Optional[str] = None,
+    total_pages: Optional[int] = None,
+    sync: bool = False,
+    rate_limiter: Optional[RateLimiter] = None,
+    collection: Optional["chromadb.api.models.Collection"] = None,
+    embedding_types: Sequence[str] = ("float",),
+) -> Tuple["chromadb.api.models.Collection", List[str]]:
+    """Generate embeddings for each page and store them in a Chroma collection.
+    Pages are sent in batches of up to ``batch_size`` with ``max_workers`` requests in flight.
+    ``input_array`` may be a lazy iterator: it is consumed ``window_size`` pages at a time,
+    so only that window of pages is held in memory.
+    With a ``cache``, pages already embedded with the same model and dpi skip the API call.
+
+    Ids are stable per document (``page_ids.page_id``) and every page is upserted with
+    source/page/dpi/model/content_hash metadata. With ``sync=True`` only new or changed
+    pages are embedded and written (a page also counts as changed when it was stored with
+    another ``model`` or without one of the requested ``embedding_types``), and pages of
+    this document that no longer exist are deleted. ``source`` is the document key the ids
+    are derived from (``page_ids.document_key``, e.g. ``a/manual.pdf`` relative to the ingest
+    root); it defaults to the file name carried in the entries' text part.
+    Pass an open ``collection`` to write several documents without reopening the DB.
+    Float vectors are always stored; ``int8``/``ubinary`` in ``embedding_types`` are also
+    requested and kept base64-packed in the page metadata for ``vector_store``.
+    Returns the collection and the list of ids for the document.
+    """
+    chroma_client = None
+    if collection is None:
+        chroma_client, collection = open_collection(collection_name, persist_dir)
+
+    types = ["float"] + [t for t in embedding_types if t != "float"]
+    quantized = {t for t in QUANTIZATIONS if t in types}
+    # a 0-page document still gets its id from ``source``, so its old pages are deleted
+    doc_id = document_id(source) if source else None
+    existing = _stored_pages(collection, doc_id) if sync and doc_id else {}
+
+    def _up_to_date(stored: Optional[tuple], page_hash: str) -> bool:
+        return stored is not None and stored[:3] == (page_hash, total_pages, model) and quantized <= stored[3]
+
+    ids: List[str] = []
+    embedded = unchanged = 0
+    for window in chunked(input_array, window_size):
+        if doc_id is None:
+            source = window[0]["content"][0]["text"]
+            doc_id = document_id(source)
+            if sync:
+                existing = _stored_pages(collection, doc_id)
+
+        first_page = len(ids)
+        window_ids = [page_id(doc_id, first_page + i) for i in range(len(window))]
+        ids.extend(window_ids)
+        hashes = [content_hash(entry) for entry in window]
+        # a page whose document grew or shrank, or that was stored with another model or
+        # other quantized embeddings, is rewritten too
+        changed = [i for i in range(len(window)) if not _up_to_date(existing.get(window_ids[i]), hashes[i])]
+        unchanged += len(window) - len(changed)
+        if not changed:
+            continue
+
+        by_type, n_embedded = embed_window(
+            co_client,
+            [window[i] for i in changed],
+            [hashes[i] for i in changed],
+            model,
+            batch_size=batch_size,
+            max_workers=max_workers,
+            cache=cache,
+            dpi=dpi,
+            rate_limiter=rate_limiter,
+            embedding_types=types,
+        )
+        embedded += n_embedded
+        metadatas = []
+        for n, i in enumerate(changed):
+            metadata = {
+                "doc_id": doc_id,
+                "source": source,
+                "page": first_page + i,
+                "model": model,
+                "content_hash": hashes[i],
+            }
+            if dpi is not None:
+                metadata["dpi"] = dpi
+            if total_pages is not None:
+                metadata["page_count"] = total_pages
+            for t in QUANTIZATIONS:
+                if t in by_type:
+                    metadata[t] = pack_quantized(t, by_type[t][n])
+            metadatas.append(metadata)
+        collection.upsert(ids=[window_ids[i] for i in changed], embeddings=by_type["float"], metadatas=metadatas)
+
+    seen = set(ids)
+    stale = [pid for pid in existing if pid not in seen]
+    if stale:
+        collection.delete(ids=stale)
+
+    print(
+        f"Embedded {embedded} pages, {len(ids) - unchanged - embedded} served from cache, "
+        f"{unchanged} unchanged, {len(stale)} deleted.",
+        flush=True,
+    )
+
+    # PersistentClient writes to disk automatically; attempt explicit persist if available
+    if persist_dir and chroma_client is not None:
+        try:
+            chroma_client.persist()
+        except Exception:
+            pass
+
+    return collection, ids
+
+
+class IngestCheckpoint:
+    """JSON file recording which PDFs were fully ingested, so an interrupted run can resume.
+
+    A PDF counts as done only while its size and mtime match what was recorded.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done: Dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self.done = json.load(f)
+
+    @staticmethod
+    def _stamp(pdf_path: str) -> dict:
+        stat = os.stat(pdf_path)
+        return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+    def is_done(self, pdf_path: str) -> bool:
+        record = self.done.get(os.path.abspath(pdf_path))
+        return record is not None and record["stamp"] == self._stamp(pdf_path)
+
+    def mark_done(self, pdf_path: str, pages: int) -> None:
+        self.done[os.path.abspath(pdf_path)] = {"stamp": self._stamp(pdf_path), "pages": pages}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.done, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+class Progress:
+    def __init__(self, total_docs: int, every: float = 2.0):
+        self.total_docs = total_docs
+        self.every = every
+        self.docs = 0
+        self.pages = 0
+        self.started = time.monotonic()
+        self._last_report = 0.0
+
+    @property
+    def pages_per_sec(self) -> float:
+        return self.pages / max(time.monotonic() - self.started, 1e-9)
+
+    def report(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if force or now - self._last_report >= self.every:
+            self._last_report = now
+            print(
+                f"[{self.docs}/{self.total_docs} docs] {self.pages} pages, {self.pages_per_sec:.1f} pages/sec",
+                flush=True,
+            )
+
+    def track(self, entries: Iterable[dict]) -> Iterator[dict]:
+        for entry in entries:
+            self.pages += 1
+            self.report()
+            yield entry
+
+
+def iter_rendered_documents(
+    pool: ProcessPoolExecutor,
+    pdf_paths: List[str],
+    dpi: int = 200,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    max_in_flight: int = 8,
+    profile: EncodingProfile = DEFAULT_PROFILE,
+    page_store_dir: Optional[str] = None,
+    sources: Optional[Dict[str, str]] = None,
+) -> Iterator[Tuple[str, int, Iterator[dict]]]:
+    """Render every PDF in ``pool``, yielding ``(pdf_path, page_count, entries)`` per document.
+
+    Page ranges of all documents are scheduled back to back, so workers keep rendering the
+    next document while the current one is being embedded. Each ``entries`` iterator must be
+    consumed before moving on to the next document. With ``page_store_dir``, the encoded
+    pages are also written to a per-document ``PageStore`` as they stream past, named by the
+    document key in ``sources`` (the file name by default).
+    """
+    sources = sources or {}
+    totals: Dict[str, int] = {}
+
+    def tasks():
+        for pdf_path in pdf_paths:
+            totals[pdf_path] = total = page_count(pdf_path, poppler_path=POPPLER_PATH)
+            for first in range(1, total + 1, chunk_size):
+                yield pdf_path, first, min(first + chunk_size - 1, total), dpi, POPPLER_PATH, profile
+
+    def document_entries(pdf_path: str, chunks) -> Iterator[dict]:
+        if page_store_dir is None:
+            for _, images in chunks:
+                for data in images:
+                    yield page_entry(pdf_path, data, profile.mime_type)
+            return
+        key = sources.get(pdf_path) or document_key(pdf_path)
+        with PageStoreWriter(page_store_path(page_store_dir, key), profile.mime_type) as store:
+            for _, images in chunks:
+                for data in images:
+                    store.add(data)
+                    yield page_entry(pdf_path, data, profile.mime_type)
+
+    rendered = map_ordered(pool, render_pages, tasks(), max_in_flight)
+    # documents without pages render nothing; they are still yielded, in order, so a sync
+    # deletes the pages they used to have
+    in_order = iter(pdf_paths)
+    for pdf_path, chunks in groupby(rendered, key=lambda item: item[0][0]):
+        for empty in in_order:
+            if empty == pdf_path:
+                break
+            yield empty, totals[empty], iter(())
+        yield pdf_path, totals[pdf_path], document_entries(pdf_path, chunks)
+    for empty in in_order:
+        yield empty, totals[empty], iter(())
+
+
+def ingest_pdfs(
+    co_client: "cohere.ClientV2",
+    pdf_paths: List[str],
+    model: str,
+    collection_name: str = "pdf_pages",
+    persist_dir: Optional[str] = None,
+    dpi: int = 200,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    processes: Optional[int] = None,
+    max_in_flight: Optional[int] = None,
+    checkpoint: Optional[IngestCheckpoint] = None,
+    profile: EncodingProfile = DEFAULT_PROFILE,
+    page_store_dir: Optional[str] = None,
+    lexical_index_dir: Optional[str] = None,
+    page_text_dir: Optional[str] = None,
+    sources: Optional[Dict[str, str]] = None,
+    **store_kwargs,
+) -> Tuple["chromadb.api.models.Collection", int]:
+    """Ingest many PDFs into one collection.
+
+    Rasterization and PNG encoding (CPU-bound) run in a pool of ``processes`` workers; the
+    embedding stage is shared by all documents (pass a ``rate_limiter`` in ``store_kwargs``
+    to bound requests across the whole run). PDFs recorded in ``checkpoint`` are skipped and
+    each finished PDF is recorded, so an interrupted run resumes at the first unfinished one.
+    With ``page_store_dir``, each document's page images are kept in a ``PageStore`` for chat.
+    With ``lexical_index_dir`` or ``page_text_dir``, each document's text layer and layout
+    are extracted in the same pool while its pages render (``page_text.extract_layout``)
+    and written to a BM25 shard (``lexical_index``) and/or a page text file (``page_text``).
+    Everything a document stores is keyed by its document key in ``sources`` (``pdf_sources``,
+    the path relative to the ingest root), or by its file name if it has none.
+    Returns the collection and the number of pages stored.
+    """
+    if checkpoint is not None:
+        skipped = [p for p in pdf_paths if checkpoint.is_done(p)]
+        if skipped:
+            print(f"Skipping {len(skipped)} PDFs already ingested per {checkpoint.path}.", flush=True)
+        pdf_paths = [p for p in pdf_paths if not checkpoint.is_done(p)]
+
+    chroma_client, collection = open_collection(collection_name, persist_dir)
+    processes = processes or os.cpu_count() or 1
+    progress = Progress(len(pdf_paths))
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        documents = iter_rendered_documents(
+            pool,
+            pdf_paths,
+            dpi=dpi,
+            chunk_size=chunk_size,
+            max_in_flight=max_in_flight or 2 * processes,
+            profile=profile,
+            page_store_dir=page_store_dir,
+            sources=sources,
+        )
+        for pdf_path, total, entries in documents:
+            key = (sources or {}).get(pdf_path) or document_key(pdf_path)
+            print(f"Ingesting {pdf_path} ({total} pages)", flush=True)
+            extract = lexical_index_dir or page_text_dir
+            layouts = pool.submit(extract_layout, pdf_path, None, None, POPPLER_PATH) if extract else None
+            _, ids = embed_pages_and_store(
+                co_client,
+                progress.track(entries),
+                model,
+                collection=collection,
+                dpi=dpi,
+                source=key,
+                total_pages=total,
+                **store_kwargs,
+            )
+            pages = layouts.result() if layouts is not None else None
+            if pages is not None and len(pages) != total:
+                # poppler output this parser did not understand: keep the page images in charge
+                print(f"Text layer of {pdf_path} parsed as {len(pages)} of {total} pages; not storing it.", flush=True)
+                pages = None
+            if pages is not None:
+                if lexical_index_dir:
+                    write_shard(lexical_index_path(lexical_index_dir, key), key, [p.text for p in pages], total)
+                if page_text_dir:
+                    write_page_text(page_text_path(page_text_dir, key), key, pages, total)
+            progress.docs += 1
+            progress.report(force=True)
+            if checkpoint is not None:
+                checkpoint.mark_done(pdf_path, len(ids))
+
+    if persist_dir:
+        try:
+            chroma_client.persist()
+        except Exception:
+            pass
+    return collection, progress.pages
+
+
+DESCRIPTION = "Convert PDF to embeddings using Cohere embed-v4 and store in ChromaDB."
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--pdf", required=True, nargs="+", help="PDF files, directories of PDFs or glob patterns")
+    parser.add_argument("--dpi", type=int, default=200, help="DPI for PDF->image conversion")
+    parser.add_argument("--model", default="embed-v4.0", help="Cohere embed model to use")
+    parser.add_argument("--encoding", default="png", choices=sorted(PROFILES), help="Page image encoding profile")
+    parser.add_argument("--quality", type=int, default=None, help="Override the profile's JPEG/WebP quality")
+    parser.add_argument("--max_dim", type=int, default=None, help="Override the profile's max page width/height in px")
+    parser.add_argument("--grayscale", action="store_true", help="Encode pages in grayscale")
+    parser.add_argument("--crop_whitespace", action="store_true", help="Crop white page margins before encoding")
+    parser.add_argument("--collection", default="pdf_pages", help="Chroma collection name")
+    parser.add_argument("--persist_dir", default="./chroma_db", help="Directory to persist Chroma DB (uses duckdb+parquet).")
+    parser.add_argument("--query", default=None, help="Optional query to run after embedding")
+    parser.add_argument("--top_k", type=int, default=5, help="Number of results to return for the query")
+    parser.add_argument("--batch_size", type=int, default=MAX_INPUTS_PER_CALL, help="Max pages per embed request")
+    parser.add_argument("--workers", type=int, default=4, help="Max concurrent embed requests")
+    parser.add_argument(
+        "--embedding_types",
+        nargs="+",
+        default=["float"],
+        choices=["float", *QUANTIZATIONS],
+        help="Embedding types to request; int8/ubinary are stored for quantized search",
+    )
+    parser.add_argument("--rpm", type=float, default=None, help="Max embed requests per minute across the whole run")
+    parser.add_argument("--processes", type=int, default=None, help="Rasterization processes (default: all cores)")
+    parser.add_argument("--chunk_size", type=int, default=DEFAULT_CHUNK_SIZE, help="Pages rendered per pdf2image call")
+    parser.add_argument(
+        "--prefetch", type=int, default=None, help="Max rendered pages buffered ahead of the embedder (default: 2 chunks per process)"
+    )
+    parser.add_argument(
+        "--page_store", default=DEFAULT_STORE_DIR, help="Directory for per-document page image stores ('' to skip)"
+    )
+    parser.add_argument(
+        "--lexical_index", default=DEFAULT_INDEX_DIR, help="Directory for per-document BM25 text index shards ('' to skip)"
+    )
+    parser.add_argument(
+        "--page_text", default=DEFAULT_TEXT_DIR, help="Directory for per-document page text and layout files ('' to skip)"
+    )
+    parser.add_argument("--checkpoint", default=None, help="JSON file recording finished PDFs, for resuming a run")
+    parser.add_argument("--cache_path", default=DEFAULT_CACHE_PATH, help="On-disk embedding cache (SQLite)")
+    parser.add_argument("--cache_max_entries", type=int, default=50_000, help="LRU bound for the embedding cache")
+    parser.add_argument("--no_cache", action="store_true", help="Always call the embed API")
+    parser.add_argument(
+        "--sync", action="store_true", help="Only write new/changed pages and delete pages that no longer exist"
+    )
+
+
+def run(args: argparse.Namespace) -> None:
+    from clients import get_cohere_client
+
+    api_key = os.environ.get("COHERE_API_KEY")
+    if not api_key:
+        print("Please set COHERE_API_KEY in the environment.", flush=True)
+        sys.exit(1)
+
+    try:
+        sources = pdf_sources(args.pdf)
+    except ValueError as exc:
+        print(exc, flush=True)
+        sys.exit(1)
+    pdf_paths = list(sources)
+    if not pdf_paths:
+        print(f"No PDFs found for: {' '.join(args.pdf)}", flush=True)
+        sys.exit(1)
+
+    profile = PROFILES[args.encoding]
+    overrides = {"quality": args.quality, "max_dim": args.max_dim}
+    profile = replace(profile, **{k: v for k, v in overrides.items() if v is not None})
+    if args.grayscale or args.crop_whitespace:
+        profile = replace(
+            profile,
+            grayscale=profile.grayscale or args.grayscale,
+            crop_whitespace=profile.crop_whitespace or args.crop_whitespace,
+        )
+
+    co_client = get_cohere_client(api_key)
+    cache = None if args.no_cache else EmbeddingCache(args.cache_path, max_entries=args.cache_max_entries)
+
+    print(f"Ingesting {len(pdf_paths)} PDFs with model {args.model}", flush=True)
+    collection, pages = ingest_pdfs(
+        co_client,
+        pdf_paths,
+        args.model,
+        args.collection,
+        persist_dir=args.persist_dir,
+        dpi=args.dpi,
+        chunk_size=args.chunk_size,
+        processes=args.processes,
+        max_in_flight=max(1, args.prefetch // args.chunk_size) if args.prefetch else None,
+        checkpoint=IngestCheckpoint(args.checkpoint) if args.checkpoint else None,
+        profile=profile,
+        page_store_dir=args.page_store or None,
+        lexical_index_dir=args.lexical_index or None,
+        page_text_dir=args.page_text or None,
+        sources=sources,
+        batch_size=args.batch_size,
+        max_workers=args.workers,
+        cache=cache,
+        sync=args.sync,
+        embedding_types=args.embedding_types,
+        rate_limiter=RateLimiter(args.rpm) if args.rpm else None,
+    )
+    print(f"Stored {pages} page embeddings in Chroma collection '{args.collection}'.", flush=True)
+    if args.persist_dir:
+        print(f"Chroma DB persisted to: {args.persist_dir}", flush=True)
+
+    # if args.query:
+    #     print(f"Running query: {args.query}")
+    #     results = query_collection(co_client, collection, args.query, args.model, top_k=args.top_k)
+    #     print("Top result ids:", results.get("ids"))
+    # else:
+    #     print("No query provided. Done.")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=DESCRIPTION)
+    add_arguments(parser)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
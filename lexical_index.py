@@ -0,0 +1,338 @@
+"""
+lexical_index.py
+
+Local BM25 index over the PDF text layer, fused with vector search by reciprocal rank.
+
+Embedding search is weakest exactly where users type what they see: "impressum", an
+error code, a part number. ``LexicalIndex`` scores those with BM25 over the page text
+extracted at ingest time, without any API call.
+
+Each document is one shard, ``<index_dir>/<doc fingerprint>.npz`` (compressed), holding
+the sorted vocabulary and CSR postings -- per term, the pages that contain it and the
+term frequency there -- plus page lengths, the document's page count and the page texts
+(for ``reranking``). Re-ingesting a
+document rewrites only its shard. BM25 statistics (N, average length, document
+frequency) are summed over all shards at query time, so scores are corpus-wide.
+
+``search`` returns the same Chroma-shaped result as ``collection.query`` (``ids`` /
+``distances`` / ``metadatas``, one list per query), so lexical hits can be fused with
+vector hits by ``fuse_results`` and fed to ``context_assembly`` unchanged.
+
+Build shards for already ingested PDFs (``cli.py ingest`` does this while ingesting):
+  python lexical_index.py --pdf ./manuals
+  python lexical_index.py --query impressum "XR-2040"
+"""
+import argparse
+import glob
+import os
+import re
+import unicodedata
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from page_ids import document_id, page_id, parse_page_id, pdf_sources
+
+DEFAULT_INDEX_DIR = "./lexical_index"
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60
+
+# words and codes such as "XR-2040", "v1.2" or "10/2023" stay one token
+_TOKEN = re.compile(r"\w+(?:[-./]\w+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """Casefolded word tokens; a code like "XR-2040" also yields its parts "xr" and "2040"."""
+    tokens = []
+    for match in _TOKEN.finditer(unicodedata.normalize("NFKC", text).casefold()):
+        token = match.group()
+        tokens.append(token)
+        parts = re.split(r"[-./]", token)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+def _words(text: str) -> List[str]:
+    """Casefolded words and whole codes in reading order, without ``tokenize``'s code parts."""
+    return _TOKEN.findall(unicodedata.normalize("NFKC", text).casefold())
+
+
+def _contains(words: Sequence[str], phrase: Sequence[str]) -> bool:
+    n = len(phrase)
+    return any(words[i : i + n] == phrase for i in range(len(words) - n + 1))
+
+
+def lexical_index_path(index_dir: str, source: str) -> str:
+    return os.path.join(index_dir, f"{document_id(source)}.npz")
+
+
+def write_shard(path: str, source: str, texts: Sequence[str], page_count: Optional[int] = None) -> None:
+    """Index the page ``texts`` of the document keyed ``source`` into a shard at ``path`` (replaced atomically)."""
+    counts = [Counter(tokenize(text)) for text in texts]
+    vocab = sorted(set().union(*counts)) if counts else []
+    term_ids = {term: i for i, term in enumerate(vocab)}
+
+    postings: List[List[Tuple[int, int]]] = [[] for _ in vocab]
+    for page, page_counts in enumerate(counts):
+        for term, tf in page_counts.items():
+            postings[term_ids[term]].append((page, tf))
+
+    offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(p) for p in postings])
+    flat = [pair for p in postings for pair in p]
+    pages = np.array([page for page, _ in flat], dtype=np.int32)
+    tfs = np.minimum(np.array([tf for _, tf in flat], dtype=np.int64), np.iinfo(np.uint16).max).astype(np.uint16)
+
+    # page texts as one UTF-8 buffer plus offsets, for rerankers that read the page text
+    encoded = [text.encode("utf-8") for text in texts]
+    text_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    text_offsets[1:] = np.cumsum([len(t) for t in encoded])
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp.npz"
+    np.savez_compressed(
+        tmp_path,
+        text=np.frombuffer(b"".join(encoded), dtype=np.uint8),
+        text_offsets=text_offsets,
+        vocab=np.array(vocab, dtype=str),
+        offsets=offsets,
+        pages=pages,
+        tfs=tfs,
+        page_len=np.array([sum(c.values()) for c in counts], dtype=np.int32),
+        doc=np.array([document_id(source), source]),
+        page_count=np.array(page_count if page_count is not None else len(texts), dtype=np.int64),
+    )
+    os.replace(tmp_path, path)
+
+
+class _Shard:
+    def __init__(self, path: str):
+        with np.load(path, allow_pickle=False) as data:
+            self.vocab = data["vocab"]
+            self.offsets = data["offsets"]
+            self.pages = data["pages"]
+            self.tfs = data["tfs"].astype(np.float32)
+            self.page_len = data["page_len"].astype(np.float32)
+            self.doc_id, self.source = (str(x) for x in data["doc"])
+            self.page_count = int(data["page_count"])
+            # shards written before the text was kept have no text arrays
+            self.text = data["text"].tobytes() if "text" in data else None
+            self.text_offsets = data["text_offsets"] if "text_offsets" in data else None
+
+    def postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        i = int(np.searchsorted(self.vocab, term))
+        if i == len(self.vocab) or self.vocab[i] != term:
+            return self.pages[:0], self.tfs[:0]
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.pages[start:end], self.tfs[start:end]
+
+    def page_text(self, page: int) -> Optional[str]:
+        if self.text is None or not 0 <= page < len(self.text_offsets) - 1:
+            return None
+        return self.text[self.text_offsets[page] : self.text_offsets[page + 1]].decode("utf-8")
+
+
+class LexicalIndex:
+    def __init__(self, index_dir: str = DEFAULT_INDEX_DIR, k1: float = BM25_K1, b: float = BM25_B):
+        self.index_dir = index_dir
+        self.k1 = k1
+        self.b = b
+        self.shards = [_Shard(p) for p in sorted(glob.glob(os.path.join(index_dir, "*.npz")))]
+        self.n_pages = sum(len(s.page_len) for s in self.shards)
+        self.avg_len = sum(float(s.page_len.sum()) for s in self.shards) / max(self.n_pages, 1)
+        self._by_doc = {shard.doc_id: i for i, shard in enumerate(self.shards)}
+
+    def __len__(self) -> int:
+        return self.n_pages
+
+    def _score(self, terms: Sequence[str]) -> List[Tuple[float, int, int]]:
+        """BM25 ``(score, shard, page)`` for every page containing at least one of ``terms``."""
+        looked_up = {term: [shard.postings(term) for shard in self.shards] for term in set(terms)}
+        per_shard = [np.zeros(len(s.page_len), dtype=np.float32) for s in self.shards]
+        for term, postings in looked_up.items():
+            df = sum(len(pages) for pages, _ in postings)
+            if not df:
+                continue
+            idf = np.log(1.0 + (self.n_pages - df + 0.5) / (df + 0.5))
+            for shard, (pages, tfs), scores in zip(self.shards, postings, per_shard):
+                norm = self.k1 * (1.0 - self.b + self.b * shard.page_len[pages] / self.avg_len)
+                scores[pages] += idf * tfs * (self.k1 + 1.0) / (tfs + norm)
+
+        scored: List[Tuple[float, int, int]] = []
+        for s, scores in enumerate(per_shard):
+            hit = np.flatnonzero(scores)
+            scored.extend(zip(scores[hit].tolist(), [s] * len(hit), hit.tolist()))
+        return scored
+
+    def score_pages(self, query: str, page_ids: Sequence[str]) -> np.ndarray:
+        """BM25 score of ``query`` for each of ``page_ids`` (0 for pages not in the index)."""
+        scores = np.zeros(len(page_ids), dtype=np.float32)
+        by_shard: Dict[int, List[Tuple[int, int]]] = {}
+        for i, pid in enumerate(page_ids):
+            doc_id, page = parse_page_id(pid)
+            if doc_id in self._by_doc:
+                by_shard.setdefault(self._by_doc[doc_id], []).append((i, page))
+
+        for term in set(tokenize(query)):
+            postings = [shard.postings(term) for shard in self.shards]
+            df = sum(len(pages) for pages, _ in postings)
+            if not df:
+                continue
+            idf = np.log(1.0 + (self.n_pages - df + 0.5) / (df + 0.5))
+            for s, wanted in by_shard.items():
+                pages, tfs = postings[s]
+                rows = np.array([i for i, _ in wanted])
+                targets = np.array([p for _, p in wanted])
+                # postings are sorted by page
+                at = np.minimum(np.searchsorted(pages, targets), max(len(pages) - 1, 0))
+                found = (pages[at] == targets) if len(pages) else np.zeros(len(targets), dtype=bool)
+                tf = tfs[at][found]
+                norm = self.k1 * (1.0 - self.b + self.b * self.shards[s].page_len[targets[found]] / self.avg_len)
+                scores[rows[found]] += idf * tf * (self.k1 + 1.0) / (tf + norm)
+        return scores
+
+    def page_text(self, pid: str) -> Optional[str]:
+        """Stored text layer of a page, if its shard keeps one."""
+        doc_id, page = parse_page_id(pid)
+        shard = self._by_doc.get(doc_id)
+        return None if shard is None else self.shards[shard].page_text(page)
+
+    def _metadata(self, shard: int, page: int) -> Dict[str, Any]:
+        s = self.shards[shard]
+        return {"doc_id": s.doc_id, "source": s.source, "page": page, "page_count": s.page_count}
+
+    def search(self, queries: Sequence[str], n_results: int = 5) -> Dict[str, List[List[Any]]]:
+        """BM25 top ``n_results`` per query; ``distances`` are negated scores (lower is better)."""
+        results: Dict[str, List[List[Any]]] = {"ids": [], "distances": [], "metadatas": []}
+        for query in queries:
+            best = sorted(self._score(tokenize(query)), key=lambda hit: -hit[0])[:n_results]
+            results["ids"].append([page_id(self.shards[s].doc_id, p) for _, s, p in best])
+            results["distances"].append([-score for score, _, _ in best])
+            results["metadatas"].append([self._metadata(s, p) for _, s, p in best])
+        return results
+
+    def exact_matches(self, query: str) -> List[str]:
+        """Ids of pages containing every token of ``query``."""
+        terms = set(tokenize(query))
+        if not terms or not self.shards:
+            return []
+        ids = []
+        for shard in self.shards:
+            common: Optional[np.ndarray] = None
+            for term in terms:
+                pages, _ = shard.postings(term)
+                common = pages if common is None else np.intersect1d(common, pages)
+            ids.extend(page_id(shard.doc_id, int(p)) for p in common)
+        return ids
+
+    def phrase_matches(self, phrase: str) -> List[str]:
+        """Ids of pages whose text has the words of ``phrase`` next to each other, in order.
+
+        Checked against the stored page text; shards written without it match nothing.
+        """
+        words = _words(phrase)
+        ids = []
+        for pid in self.exact_matches(phrase):
+            text = self.page_text(pid)
+            if text is not None and _contains(_words(text), words):
+                ids.append(pid)
+        return ids
+
+    def answers_locally(self, query: str) -> bool:
+        """Whether ``query`` is an exact-match lookup the index can answer without embeddings.
+
+        That is a quoted phrase that some page contains word for word, or nothing but
+        product/error codes (tokens with digits, such as "XR-2040" or "E17 E18") that some
+        page contains all of. Short keyword queries ("impressum", "warranty terms") are not
+        lookups: their wording may differ from the page's, so they go through BM25 and
+        vector search fused by RRF.
+        """
+        stripped = query.strip()
+        if len(stripped) > 2 and stripped[0] == stripped[-1] == '"':
+            return bool(self.phrase_matches(stripped[1:-1]))
+        words = _TOKEN.findall(stripped)
+        codes = bool(words) and all(any(c.isdigit() for c in w) for w in words)
+        return codes and bool(self.exact_matches(stripped))
+
+
+def fuse_results(
+    result_sets: Sequence[Dict[str, List[List[Any]]]], n_results: int = 5, rrf_k: int = RRF_K
+) -> Dict[str, List[List[Any]]]:
+    """Reciprocal rank fusion of Chroma-shaped results for the same queries.
+
+    ``distances`` of the fused result are negated RRF scores.
+    """
+    fused: Dict[str, List[List[Any]]] = {"ids": [], "distances": [], "metadatas": []}
+    n_queries = max((len(r.get("ids") or []) for r in result_sets), default=0)
+    for q in range(n_queries):
+        scores: Dict[str, float] = {}
+        metadatas: Dict[str, Any] = {}
+        for result in result_sets:
+            ids = (result.get("ids") or [])[q] if q < len(result.get("ids") or []) else []
+            metas = (result.get("metadatas") or [[]] * n_queries)[q] or [None] * len(ids)
+            for rank, (pid, meta) in enumerate(zip(ids, metas)):
+                scores[pid] = scores.get(pid, 0.0) + 1.0 / (rrf_k + rank + 1)
+                if metadatas.get(pid) is None:
+                    metadatas[pid] = meta
+        best = sorted(scores, key=lambda pid: -scores[pid])[:n_results]
+        fused["ids"].append(best)
+        fused["distances"].append([-scores[pid] for pid in best])
+        fused["metadatas"].append([metadatas[pid] for pid in best])
+    return fused
+
+
+def hybrid_search(
+    index: LexicalIndex,
+    queries: Sequence[str],
+    vector_search: Callable[[List[str]], Dict[str, List[List[Any]]]],
+    n_results: int = 5,
+) -> Dict[str, List[List[Any]]]:
+    """BM25 results fused with ``vector_search(queries)``; exact-match queries skip the vector side.
+
+    ``vector_search`` is only called (once, batched) for the queries the index cannot
+    answer locally, so a turn of pure lookups never reaches the embed API.
+    """
+    lexical = index.search(queries, n_results=n_results)
+    remote = [i for i, query in enumerate(queries) if not index.answers_locally(query)]
+    if not remote:
+        return lexical
+
+    vector = vector_search([queries[i] for i in remote])
+    # local queries get empty vector lists, so their fused ranking is the BM25 one
+    aligned: Dict[str, List[List[Any]]] = {"ids": [[] for _ in queries], "metadatas": [[] for _ in queries]}
+    for j, i in enumerate(remote):
+        aligned["ids"][i] = vector["ids"][j]
+        aligned["metadatas"][i] = (vector.get("metadatas") or [None] * len(remote))[j] or []
+    return fuse_results([aligned, lexical], n_results=n_results)
+
+
+def main() -> None:
+    from page_stream import extract_text
+
+    parser = argparse.ArgumentParser(description="Build or query the local BM25 index over PDF text.")
+    parser.add_argument("--pdf", nargs="*", default=[], help="PDF files, directories of PDFs or glob patterns to (re)index")
+    parser.add_argument("--index_dir", default=DEFAULT_INDEX_DIR, help="Directory holding one shard per document")
+    parser.add_argument("--poppler_path", default=None, help="Directory of the poppler binaries")
+    parser.add_argument("--query", nargs="*", default=[], help="Queries to run against the index")
+    parser.add_argument("--top_k", type=int, default=5, help="Number of results per query")
+    args = parser.parse_args()
+
+    # keyed like ``cli.py ingest`` keys the same patterns, so shards land under the ingested ids
+    for pdf_path, key in pdf_sources(args.pdf).items():
+        texts = extract_text(pdf_path, poppler_path=args.poppler_path)
+        write_shard(lexical_index_path(args.index_dir, key), key, texts)
+        print(f"Indexed {len(texts)} pages of {pdf_path}", flush=True)
+
+    if args.query:
+        index = LexicalIndex(args.index_dir)
+        results = index.search(args.query, n_results=args.top_k)
+        for query, ids, distances in zip(args.query, results["ids"], results["distances"]):
+            local = "local" if index.answers_locally(query) else "hybrid"
+            print(f"{query} [{local}]: " + ", ".join(f"{pid} ({-d:.2f})" for pid, d in zip(ids, distances)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,24 @@
+import asyncio
 import uuid
-from copy import deepcopy
-from typing import Annotated, List, Optional, cast
+from typing import Annotated, Any, Dict, List, Optional, Union, cast
 
 # from commonlib.knowledge_base.get_sources.get_sources import get_sources
 # from commonlib.companies.lib.aileen.lib.get_memory_without_tool_calls import exclude_tool_calls
 # from commonlib.knowledge_base import KnowledgeBase
 # from commonlib.companies.lib.company_repository.company_repository import CompanyData
-from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, SystemMessage
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, SystemMessage, ToolMessage
 from langchain_core.runnables import chain
 from langchain_core.tools import InjectedToolArg, tool
 from langchain_openai import ChatOpenAI
 from openai import BaseModel
 
-# from commonlib.count_time import elapsed_time
+from clients import get_chat_model
+from history_manager import SUMMARY_PREFIX, HistoryManager
+from retrieval_service import RetrievalPlan, RetrievalService, format_hits, get_page_texts, get_retrieval_service
+from stream_accumulator import StreamAccumulator
+from system_prompt import CompanyData, SystemPromptCache
+from tracing import span, start_span, use_span
 
 prompt = """
 You are an assistant for company {company} with the role of {role}. You have access to a powerful tool that allows you to search and retrieve information when you are not fully certain about your answer.
@@ -124,6 +130,10 @@ Remember:
 """
 
 
+# rendered once per company and reused while its data is unchanged (see system_prompt.py)
+system_prompts = SystemPromptCache(prompt)
+
+
 class SourcesArtifact(BaseModel):
     _sources: Optional[str] = None
 
@@ -141,6 +151,7 @@ async def search(
     # company_data: Annotated[CompanyData, InjectedToolArg],
     # knowledge_base: Annotated[Optional[KnowledgeBase], InjectedToolArg] = None,
     sources_artifact: Annotated[Optional[SourcesArtifact], InjectedToolArg] = None,
+    retrieval_plan: Annotated[Optional[RetrievalPlan], InjectedToolArg] = None,
 ) -> str:
     """
     Search the web for information.
@@ -149,6 +160,16 @@ async def search(
        queries: List of queries to be provided to the search engine.
     """
 
+    # All queries of the turn were embedded together and are searched concurrently by the plan
+    with span("search", queries=len(queries)):
+        plan = retrieval_plan or get_retrieval_service().plan(queries)
+        sources = format_hits(await plan.results(queries), get_page_texts())
+
+    if sources_artifact:
+        sources_artifact.save_sources(sources)
+
+    return sources
+
     # knowledge_base = knowledge_base or KnowledgeBase(
     #     company_uuid=company_data.uuid,
     # )
@@ -162,14 +183,18 @@ async def search(
     # return sources
 
 
-def inject_properties(sources_artifact: Optional[SourcesArtifact] = None):
+def inject_properties(
+    sources_artifact: Optional[SourcesArtifact] = None, retrieval_plan: Optional[RetrievalPlan] = None
+):
     @chain
     def inject_company_data(ai_msg):
+        # shallow copies: only the top-level args dict gains keys, the model's values are shared
         tool_calls = []
         for tool_call in ai_msg.tool_calls:
-            tool_call_copy = deepcopy(tool_call)
-            tool_call_copy["args"]["sources_artifact"] = sources_artifact
-            tool_calls.append(tool_call_copy)
+            args = {**tool_call["args"], "sources_artifact": sources_artifact}
+            if tool_call["name"] == "search":
+                args["retrieval_plan"] = retrieval_plan
+            tool_calls.append({**tool_call, "args": args})
         return tool_calls
 
     return inject_company_data
@@ -184,15 +209,107 @@ def tool_router(tool_call):
     }[tool_call_name]
 
 
+class ToolCallPipeline:
+    """Runs the tool calls of one model reply while the reply is still streaming.
+
+    ``start`` is called with each tool call as soon as its JSON arguments are complete
+    (``StreamAccumulator.add`` reports them), and the call runs concurrently with the
+    rest of the stream and with the other calls. Every ``search`` call of the reply adds
+    its queries to one open ``RetrievalPlan`` as it starts, so all of them are embedded
+    in batches, searched concurrently and bound by one time budget; the plan is sealed
+    once the reply is complete, and only then are pages handed out, each under the query
+    that ranks it best.
+    """
+
+    def __init__(
+        self,
+        sources_artifact: Optional[SourcesArtifact] = None,
+        retrieval_service: Optional[RetrievalService] = None,
+        parent: Any = None,
+    ):
+        self.sources_artifact = sources_artifact
+        self.retrieval_service = retrieval_service
+        self.parent = parent
+        self._tasks: Dict[str, asyncio.Future] = {}
+        self._plan: Optional[RetrievalPlan] = None
+
+    def start(self, tool_call: Dict[str, Any]) -> None:
+        # called from the stream loop, where no span is current: the plan's and the call's
+        # tasks are started under the stream span so their spans join the turn's trace
+        with use_span(self.parent):
+            if tool_call["name"] == "search":
+                queries = tool_call["args"].get("queries", [])
+                if self._plan is None:
+                    # the first search call opens the plan; later ones join it in stream order
+                    service = self.retrieval_service or get_retrieval_service()
+                    self._plan = service.plan(queries, sealed=False)
+                else:
+                    self._plan.add(queries)
+            self._tasks[tool_call["id"]] = asyncio.ensure_future(self._run(tool_call))
+
+    async def _run(self, tool_call: Dict[str, Any]) -> ToolMessage:
+        with span("tool", parent=self.parent, tool=tool_call["name"]):
+            [call] = inject_properties(self.sources_artifact, self._plan).invoke(AIMessage(content="", tool_calls=[tool_call]))
+            return await tool_router.ainvoke(call)
+
+    async def results(self, tool_calls: List[Dict[str, Any]]) -> List[ToolMessage]:
+        """Tool messages for the reply's final ``tool_calls``, starting any call that never parsed mid-stream."""
+        for tool_call in tool_calls:
+            if tool_call["id"] not in self._tasks:
+                self.start(tool_call)
+        if self._plan is not None:
+            self._plan.seal()
+        return list(await asyncio.gather(*(self._tasks[tool_call["id"]] for tool_call in tool_calls)))
+
+    def cancel(self) -> None:
+        for task in self._tasks.values():
+            task.cancel()
+        if self._plan is not None:
+            self._plan.cancel()
+
+
+def _without_system_prompts(messages: List[BaseMessage]) -> List[BaseMessage]:
+    # the company prompt replaces any system prompt of the history; its rolling summary stays
+    return [m for m in messages if not isinstance(m, SystemMessage) or str(m.content).startswith(SUMMARY_PREFIX)]
+
+
 async def company_assistant(
     user_message: HumanMessage,
-    history: Optional[List[BaseMessage]] = None,
+    history: Optional[Union[List[BaseMessage], HistoryManager]] = None,
     sources_artifact: Optional[SourcesArtifact] = None,
+    retrieval_service: Optional[RetrievalService] = None,
+    llm: Optional[BaseChatModel] = None,
+    max_tool_rounds: int = 3,
+    company: Optional[CompanyData] = None,
+    company_key: Optional[str] = None,
 ):
+    """Stream the answer to the last message of ``history``, one message id per model reply.
+
+    Tools start while the reply that requested them is still streaming
+    (``ToolCallPipeline``), and the follow-up reply streams as soon as their results are
+    in. The model may call tools again in the follow-up, up to ``max_tool_rounds`` rounds;
+    the reply after the last round is generated without tools. Pass ``llm`` to use another
+    chat model, e.g. ``fake_chat_model.FakeStreamingChatModel`` in tests and benchmarks.
+
+    ``history`` is either a list that is already within the token budget, sent as is, or a
+    ``HistoryManager`` holding the conversation up to the user's message: every request of
+    the turn then carries ``history.acontext()`` (rolling summary plus the recent turns that
+    fit its budget), and the turn's replies and tool results are appended to it.
+
+    With ``company``, the request starts with that company's cached system prompt followed
+    by the history (minus any system messages other than the summary), so consecutive turns
+    share a byte-identical prefix that the provider's prompt cache can reuse.
+    """
 
     # print(history, "historinha", flush=True)
 
-    llm = ChatOpenAI(model="gpt-4.1", temperature=0)
+    # shared, pooled clients (see clients.py); stream_usage: the last chunk of each stream
+    # carries the token counts for tracing
+    if llm is None:
+        llm = get_chat_model("gpt-4.1", stream_usage=True)
+        llm_with_tools = get_chat_model("gpt-4.1", tools=[search], stream_usage=True)
+    else:
+        llm_with_tools = llm.bind_tools([search])
     # llm = ChatOpenAI(model="gpt-5", temperature=0)
     # llm = get_chat_model("deepseek-reasoner")
     # llm = get_chat_model("gpt-4.1")
@@ -205,36 +322,81 @@ async def company_assistant(
     # )
     # llm = ChatOpenAI(model="gpt-4.1-mini", temperature=0)
 
-    llm_with_tools = llm.bind_tools([search])
-
-    first = True
-
-    gathered: Optional[AIMessageChunk] = None
-
-    first_message_id = str(uuid.uuid4())
-
-    accumulated_first_message_content = ""
+    # replies and tool results of this turn, for a plain list history
+    turn_messages: List[BaseMessage] = []
 
-    async for chunk in llm_with_tools.astream(history):
-        if first:
-            gathered = cast(AIMessageChunk, chunk)
-            first = False
+    async def request() -> List[BaseMessage]:
+        if isinstance(history, HistoryManager):
+            # the summarizer may call an LLM; acontext keeps it off the event loop
+            context = await history.acontext()
         else:
-            gathered = cast(AIMessageChunk, cast(AIMessageChunk, gathered) + chunk)
-
-        accumulated_first_message_content += cast(str, chunk.content)
-
-        yield AIMessageChunk(content=chunk.content, id=first_message_id)
-
-    accumulated_second_message_content = ""
-
-    if gathered and gathered.tool_calls:
-        tool_messages = await (inject_properties(sources_artifact=sources_artifact) | tool_router.map()).ainvoke(
-            AIMessage(content="", tool_calls=gathered.tool_calls)
-        )
-
-        if tool_messages:
-            second_message_id = str(uuid.uuid4())
-            async for chunk in llm.astream(history + [gathered] + tool_messages):  # type: ignore
-                accumulated_second_message_content += cast(str, chunk.content)
-                yield AIMessageChunk(content=chunk.content, id=second_message_id)
+            context = [*(history or []), *turn_messages]
+        if company is None:
+            return context
+        return [system_prompts.get(company, company_key), *_without_system_prompts(context)]
+
+    messages = await request()
+
+    # the turn and stream spans stay open across yields, so they are passed as explicit parents
+    turn = start_span("company_assistant", history_messages=len(messages))
+    turn_tokens = 0
+    tool_round = 0
+
+    # ended on every exit: a turn that fails or is cancelled (client gone, generator closed)
+    # is the one its trace has to explain
+    try:
+        for tool_round in range(max_tool_rounds + 1):
+            model = llm_with_tools if tool_round < max_tool_rounds else llm
+            message_id = str(uuid.uuid4())
+            stream = start_span(
+                "llm.first_stream" if tool_round == 0 else "llm.followup_stream", parent=turn, round=tool_round
+            )
+            pipeline = ToolCallPipeline(sources_artifact, retrieval_service, parent=stream)
+
+            # linear-time appends instead of re-merging ``gathered + chunk`` on every chunk
+            gathered = StreamAccumulator()
+
+            try:
+                async for chunk in model.astream(messages):
+                    chunk = cast(AIMessageChunk, chunk)
+                    if chunk.content:
+                        stream.mark("ttft_ms")
+                    if chunk.tool_call_chunks:
+                        stream.mark("tool_call_detected_ms")
+                    for tool_call in gathered.add(chunk):
+                        pipeline.start(tool_call)
+
+                    yield AIMessageChunk(content=chunk.content, id=message_id)
+            except BaseException:
+                pipeline.cancel()
+                raise
+            finally:
+                usage = gathered.usage_metadata
+                if usage:
+                    stream.set("input_tokens", usage["input_tokens"])
+                    stream.set("cached_input_tokens", (usage.get("input_token_details") or {}).get("cache_read", 0))
+                    stream.set("total_tokens", usage["total_tokens"])
+                    turn_tokens += usage["total_tokens"]
+                stream.end()
+
+            reply = gathered.message()
+            if not reply.tool_calls:
+                if isinstance(history, HistoryManager):
+                    history.append(reply)
+                break
+
+            with span("tools", parent=turn, round=tool_round, tool_calls=len(reply.tool_calls)):
+                tool_messages = await pipeline.results(reply.tool_calls)
+
+            if isinstance(history, HistoryManager):
+                history.extend([reply, *tool_messages])
+            else:
+                turn_messages.extend([reply, *tool_messages])
+            messages = await request()
+    except BaseException as exc:
+        turn.set("error", type(exc).__name__)
+        raise
+    finally:
+        turn.set("total_tokens", turn_tokens)
+        turn.set("tool_rounds", tool_round)
+        turn.end()
@@ -0,0 +1,86 @@
+"""
+page_ids.py
+
+Stable ids for stored pages: ``<document fingerprint>-p<page>``.
+
+The fingerprint is derived from the document key -- the PDF's path relative to the
+directory or glob it was ingested from -- rather than its bytes, so a revised edition
+of the same manual keeps its ids and can be synced page by page. Two PDFs of one
+ingest run never share a key: ``a/manual.pdf`` and ``b/manual.pdf`` under
+``./manuals/**/*.pdf`` are keyed by their folders, and ``pdf_sources`` refuses inputs
+whose keys would still collide (the same file name passed from two unrelated places).
+
+A PDF named on its own or found directly in an ingested directory is keyed by its file
+name, which is all the fingerprint covered before keys included folders; those ids are
+unchanged. PDFs that were ingested through a recursive glob from subfolders now get new
+ids: re-ingest them into a fresh collection (``--collection``/``--persist_dir``) together
+with fresh ``--page_store``/``--lexical_index``/``--page_text`` directories, since their
+old entries may mix the pages of same-named files and cannot be told apart.
+"""
+import glob
+import hashlib
+import os
+import posixpath
+from typing import Dict, Optional, Sequence, Tuple
+
+
+def document_key(path: str, root: Optional[str] = None) -> str:
+    """Key of the PDF at ``path``: its "/"-separated path relative to ``root``, or its file name without one."""
+    if root is None:
+        return os.path.basename(path)
+    return os.path.relpath(os.path.abspath(path), os.path.abspath(root)).replace(os.sep, "/")
+
+
+def document_id(key: str) -> str:
+    """Fingerprint of a ``document_key``."""
+    normalized = posixpath.normpath(key.replace("\\", "/"))
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:12]
+
+
+def _glob_root(pattern: str) -> str:
+    root = pattern
+    while glob.has_magic(root):
+        root = os.path.dirname(root)
+    return root or os.curdir
+
+
+def pdf_sources(patterns: Sequence[str]) -> Dict[str, str]:
+    """Resolve files, directories (their ``*.pdf``) and glob patterns into ``{path: document key}``, sorted by path.
+
+    A directory or glob is the root its PDFs are keyed relative to (a glob's root is its
+    directory part before the first wildcard); a file passed on its own is keyed by its
+    name. Raises ``ValueError`` if two different files would get the same key.
+    """
+    sources: Dict[str, str] = {}
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches, root = glob.glob(os.path.join(pattern, "*.pdf")), pattern
+        elif glob.has_magic(pattern):
+            matches = [p for p in glob.glob(pattern, recursive=True) if p.lower().endswith(".pdf")]
+            root = _glob_root(pattern)
+        else:
+            matches, root = [pattern], None
+        for path in sorted(matches):
+            sources.setdefault(path, document_key(path, root))
+
+    owners: Dict[str, str] = {}
+    for path, key in sources.items():
+        other = owners.setdefault(document_id(key), path)
+        if other != path and os.path.abspath(other) != os.path.abspath(path):
+            raise ValueError(
+                f"{other} and {path} would both be stored as {key!r}; "
+                "ingest them through a common directory or glob so their keys include their folders"
+            )
+    return dict(sorted(sources.items()))
+
+
+def page_id(doc_id: str, page: int) -> str:
+    return f"{doc_id}-p{page}"
+
+
+def parse_page_id(pid: str | int) -> Tuple[str, int]:
+    """Split a page id into ``(doc_id, page)``; legacy positional ids ("12") get an empty doc_id."""
+    doc_id, sep, page = str(pid).rpartition("-p")
+    if not sep:
+        return "", int(pid)
+    return doc_id, int(page)
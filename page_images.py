@@ -0,0 +1,134 @@
+"""
+page_images.py
+
+Page images for multimodal answers, loaded lazily from the page stores.
+
+``PageImageCache`` turns retrieved page ids into ``image_url`` content blocks:
+
+- each document's ``PageStore`` is opened (memory-mapped) on first use, so only the
+  retrieved pages are ever read -- never the whole book,
+- pages are downscaled and re-encoded with ``CHAT_PROFILE`` (longest side ``max_dim``)
+  before they are sent; a stored page that already fits is passed through unchanged,
+- the encoded data URLs of recently used pages are kept in an LRU, so follow-up
+  questions about the same pages skip the decode/resize/encode step.
+
+A turn's image payload is therefore bounded by its top-k pages at ``max_dim``. With the
+ingest-time ``page_text`` files (``texts``), ``page_blocks`` sends a page's text layer
+instead of its image unless the page was flagged figure-heavy, which is far fewer bytes
+and tokens and lets the model quote the page exactly.
+"""
+import base64
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from PIL import Image
+
+from page_encoding import EncodingProfile, encode_page
+from page_ids import parse_page_id
+from page_store import DEFAULT_STORE_DIR, PageStore
+from page_text import PageTexts
+from tracing import span
+
+CHAT_PROFILE = EncodingProfile(fmt="JPEG", quality=80, max_dim=1024, crop_whitespace=True)
+
+
+class PageImageCache:
+    def __init__(
+        self,
+        store_dir: str = DEFAULT_STORE_DIR,
+        profile: EncodingProfile = CHAT_PROFILE,
+        max_entries: int = 64,
+        texts: Optional[PageTexts] = None,
+        max_text_chars: int = 12_000,
+    ):
+        self.store_dir = store_dir
+        self.profile = profile
+        self.max_entries = max_entries
+        self.texts = texts
+        self.max_text_chars = max_text_chars
+        self.hits = self.misses = 0
+        self._lock = threading.Lock()
+        self._stores: Dict[str, Optional[PageStore]] = {}
+        self._entries: "OrderedDict[Tuple[str, int], str]" = OrderedDict()
+
+    def _store(self, doc_id: str) -> Optional[PageStore]:
+        with self._lock:
+            if doc_id not in self._stores:
+                path = os.path.join(self.store_dir, doc_id)
+                self._stores[doc_id] = PageStore(path) if doc_id and os.path.exists(f"{path}.idx") else None
+            return self._stores[doc_id]
+
+    def _encode(self, store: PageStore, page: int) -> str:
+        raw = store.get(page)
+        image = Image.open(BytesIO(raw))
+        profile = self.profile
+        fits = not profile.max_dim or max(image.size) <= profile.max_dim
+        if fits and store.mime_type == profile.mime_type and not (profile.grayscale or profile.crop_whitespace):
+            data, mime_type = raw, store.mime_type
+        else:
+            data, mime_type = encode_page(image, profile), profile.mime_type
+        return f"data:{mime_type};base64,{base64.b64encode(data).decode('utf-8')}"
+
+    def get(self, doc_id: str, page: int) -> Optional[str]:
+        """Data URL of a downscaled page, or ``None`` if the document has no page store."""
+        key = (doc_id, page)
+        with self._lock:
+            url = self._entries.get(key)
+            if url is not None:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return url
+
+        store = self._store(doc_id)
+        if store is None or not 0 <= page < len(store):
+            return None
+        url = self._encode(store, page)
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = url
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return url
+
+    def image_blocks(self, page_ids: Sequence[str]) -> List[Dict[str, Any]]:
+        """``image_url`` content blocks for the pages that have a stored image, in order."""
+        return self.page_blocks(page_ids, prefer_text=False)
+
+    def page_blocks(
+        self, page_ids: Sequence[str], labels: Optional[Sequence[str]] = None, prefer_text: bool = True
+    ) -> List[Dict[str, Any]]:
+        """Content blocks for the pages in order: the page text where it can stand in for the page, else its image.
+
+        Figure-heavy pages, pages without a page text file and pages over ``max_text_chars``
+        are sent as images; a text block starts with the page's label (default: its id).
+        """
+        blocks = []
+        with span("retrieval.page_fetch", pages=len(page_ids)) as s:
+            hits = self.hits
+            text_pages = 0
+            for n, pid in enumerate(page_ids):
+                layout = self.texts.get(pid) if prefer_text and self.texts is not None else None
+                if layout is not None and not layout.figure_heavy and len(layout.text) <= self.max_text_chars:
+                    label = labels[n] if labels is not None else pid
+                    blocks.append({"type": "text", "text": f"[{label}]\n{layout.text}"})
+                    text_pages += 1
+                    continue
+                url = self.get(*parse_page_id(pid))
+                if url is not None:
+                    blocks.append({"type": "image_url", "image_url": {"url": url}})
+            s.set("cache_hits", self.hits - hits)
+            s.set("text_pages", text_pages)
+            s.set("image_bytes", sum(len(b["image_url"]["url"]) for b in blocks if b["type"] == "image_url"))
+        return blocks
+
+    def close(self) -> None:
+        with self._lock:
+            for store in self._stores.values():
+                if store is not None:
+                    store.close()
+            self._stores.clear()
+            self._entries.clear()
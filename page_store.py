@@ -0,0 +1,126 @@
+"""
+page_store.py
+
+Binary page image store: raw image bytes of every page concatenated in ``<path>.bin``
+plus an offset index in ``<path>.idx``.
+
+Reading opens the data file with ``mmap``, so fetching one page is an index lookup
+and a slice -- nothing else is parsed or base64-decoded, unlike ``pages_base64.json``.
+
+Index layout (little-endian): ``PGSTORE1`` magic, uint32 mime type length, mime type
+(utf-8), uint32 page count, then one ``(uint64 offset, uint64 length)`` pair per page.
+"""
+import base64
+import mmap
+import os
+import struct
+from typing import List, Optional, Tuple
+
+from page_ids import document_id
+
+MAGIC = b"PGSTORE1"
+DEFAULT_STORE_DIR = "./page_store"
+_ENTRY = struct.Struct("<QQ")
+
+
+def page_store_path(store_dir: str, source: str) -> str:
+    """Store location for a document key (``page_ids.document_key``), named by its fingerprint."""
+    return os.path.join(store_dir, document_id(source))
+
+
+class PageStoreWriter:
+    """Appends pages to a new store; the files only replace an existing store on ``close``."""
+
+    def __init__(self, path: str, mime_type: str = "image/png"):
+        self.path = path
+        self.mime_type = mime_type
+        self._entries: List[Tuple[int, int]] = []
+        self._offset = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._data = open(f"{path}.bin.tmp", "wb")
+
+    def add(self, image_bytes: bytes) -> int:
+        self._data.write(image_bytes)
+        self._entries.append((self._offset, len(image_bytes)))
+        self._offset += len(image_bytes)
+        return len(self._entries) - 1
+
+    def close(self) -> None:
+        if self._data.closed:
+            return
+        self._data.close()
+        mime = self.mime_type.encode("utf-8")
+        with open(f"{self.path}.idx.tmp", "wb") as f:
+            f.write(MAGIC)
+            f.write(struct.pack("<I", len(mime)))
+            f.write(mime)
+            f.write(struct.pack("<I", len(self._entries)))
+            for entry in self._entries:
+                f.write(_ENTRY.pack(*entry))
+        os.replace(f"{self.path}.bin.tmp", f"{self.path}.bin")
+        os.replace(f"{self.path}.idx.tmp", f"{self.path}.idx")
+
+    def abort(self) -> None:
+        self._data.close()
+        for suffix in (".bin.tmp", ".idx.tmp"):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def __enter__(self) -> "PageStoreWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class PageStore:
+    """Read-only, memory-mapped view of a page store."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(f"{path}.idx", "rb") as f:
+            index = f.read()
+        if index[:8] != MAGIC:
+            raise ValueError(f"{path}.idx is not a page store index")
+        (mime_len,) = struct.unpack_from("<I", index, 8)
+        self.mime_type = index[12 : 12 + mime_len].decode("utf-8")
+        (count,) = struct.unpack_from("<I", index, 12 + mime_len)
+        self._index = memoryview(index)[16 + mime_len :]
+        self._count = count
+
+        self._file = open(f"{path}.bin", "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        # mmap cannot map an empty file
+        self._mmap: Optional[mmap.mmap] = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+
+    def __len__(self) -> int:
+        return self._count
+
+    def get(self, page: int) -> bytes:
+        """Raw image bytes of a 0-based page."""
+        if not 0 <= page < self._count:
+            raise IndexError(f"page {page} out of range for {self.path} ({self._count} pages)")
+        offset, length = _ENTRY.unpack_from(self._index, page * _ENTRY.size)
+        if not length:
+            return b""
+        return self._mmap[offset : offset + length]  # type: ignore[index]
+
+    def get_base64(self, page: int) -> str:
+        return base64.b64encode(self.get(page)).decode("utf-8")
+
+    def data_url(self, page: int) -> str:
+        return f"data:{self.mime_type};base64,{self.get_base64(page)}"
+
+    def close(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+        self._file.close()
+
+    def __enter__(self) -> "PageStore":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
@@ -0,0 +1,172 @@
+"""
+page_stream.py
+
+Streaming PDF rasterization helpers.
+
+``convert_from_path`` renders the whole document into memory at once; here pages
+are rendered in ``first_page``/``last_page`` chunks and yielded one by one, so peak
+memory depends on the chunk size instead of the page count. ``prefetch`` runs a
+producer in a background thread behind a bounded queue, letting rendering overlap
+with the (network-bound) consumer. ``extract_text`` reads the PDF text layer with
+poppler's ``pdftotext``, which pdf2image already depends on. pdf2image itself is
+imported on first use, so only the commands that render pages pay for it.
+"""
+import os
+import queue
+import subprocess
+import threading
+from collections import deque
+from concurrent.futures import Executor
+from io import BytesIO
+from itertools import islice
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+from PIL import Image
+
+from page_encoding import DEFAULT_PROFILE, EncodingProfile, encode_page
+
+T = TypeVar("T")
+
+DEFAULT_CHUNK_SIZE = 8
+
+
+def page_count(pdf_path: str, poppler_path: Optional[str] = None) -> int:
+    from pdf2image import pdfinfo_from_path
+
+    return int(pdfinfo_from_path(pdf_path, poppler_path=poppler_path)["Pages"])
+
+
+def iter_page_images(
+    pdf_path: str,
+    dpi: int = 200,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    poppler_path: Optional[str] = None,
+) -> Iterator[Tuple[int, Image.Image]]:
+    """Yield ``(page_index, image)`` for every page, rendering ``chunk_size`` pages at a time.
+
+    ``page_index`` is 0-based, matching the positional ids used elsewhere.
+    """
+    from pdf2image import convert_from_path
+
+    total = page_count(pdf_path, poppler_path=poppler_path)
+    for first in range(1, total + 1, chunk_size):
+        last = min(first + chunk_size - 1, total)
+        images = convert_from_path(pdf_path, dpi=dpi, first_page=first, last_page=last, poppler_path=poppler_path)
+        for offset, image in enumerate(images):
+            yield first - 1 + offset, image
+        del images
+
+
+def encode_image(image: Image.Image, fmt: str = "PNG") -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def render_pages(
+    pdf_path: str,
+    first_page: int,
+    last_page: int,
+    dpi: int = 200,
+    poppler_path: Optional[str] = None,
+    profile: EncodingProfile = DEFAULT_PROFILE,
+) -> List[bytes]:
+    """Render the 1-based page range ``[first_page, last_page]`` and encode it with ``profile``.
+
+    Module-level and returning plain bytes, so it can run in a process pool.
+    """
+    from pdf2image import convert_from_path
+
+    images = convert_from_path(pdf_path, dpi=dpi, first_page=first_page, last_page=last_page, poppler_path=poppler_path)
+    return [encode_page(image, profile) for image in images]
+
+
+def extract_text(
+    pdf_path: str, first_page: Optional[int] = None, last_page: Optional[int] = None, poppler_path: Optional[str] = None
+) -> List[str]:
+    """Text layer of each page in the 1-based range ``[first_page, last_page]`` (whole document by default).
+
+    Scanned pages without a text layer come back as empty strings. Module-level, so it
+    can run in the same process pool as ``render_pages``.
+    """
+    command = [os.path.join(poppler_path, "pdftotext") if poppler_path else "pdftotext", "-enc", "UTF-8"]
+    if first_page is not None:
+        command += ["-f", str(first_page)]
+    if last_page is not None:
+        command += ["-l", str(last_page)]
+    out = subprocess.run([*command, pdf_path, "-"], check=True, capture_output=True).stdout
+    # pdftotext ends every page with a form feed
+    text = out.decode("utf-8", errors="replace")
+    return text[:-1].split("\f") if text.endswith("\f") else text.split("\f")
+
+
+def chunked(iterable: Iterable[T], size: int) -> Iterator[List[T]]:
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def map_ordered(
+    pool: Executor, fn: Callable[..., T], tasks: Iterable[Tuple[Any, ...]], max_in_flight: int
+) -> Iterator[Tuple[Tuple[Any, ...], T]]:
+    """Like ``pool.map`` but lazy: at most ``max_in_flight`` tasks are submitted ahead of the consumer.
+
+    Yields ``(task_args, result)`` in task order.
+    """
+    pending: deque = deque()
+    for args in tasks:
+        pending.append((args, pool.submit(fn, *args)))
+        if len(pending) >= max_in_flight:
+            done_args, future = pending.popleft()
+            yield done_args, future.result()
+    while pending:
+        done_args, future = pending.popleft()
+        yield done_args, future.result()
+
+
+_DONE = object()
+
+
+def prefetch(iterable: Iterable[T], maxsize: int = DEFAULT_CHUNK_SIZE) -> Iterator[T]:
+    """Consume ``iterable`` in a background thread, buffering at most ``maxsize`` items.
+
+    Exceptions raised by the producer are re-raised in the consumer. Closing the
+    returned generator early stops the producer at its next put.
+    """
+    buffer: "queue.Queue" = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+        except BaseException as exc:  # forwarded to the consumer
+            put((_DONE, exc))
+            return
+        put((_DONE, None))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = buffer.get()
+            if isinstance(item, tuple) and len(item) == 2 and item[0] is _DONE:
+                if item[1] is not None:
+                    raise item[1]
+                return
+            yield item
+    finally:
+        stop.set()
@@ -0,0 +1,285 @@
+"""
+page_text.py
+
+Per-page text and layout, extracted once at ingest so prompts can carry text instead of images.
+
+``extract_layout`` reads a PDF's text layer with its boxes (``pdftotext -bbox-layout``)
+and the placed raster images (``pdfimages -list``) and returns one ``PageLayout`` per
+page: the text, heading candidates (lines set noticeably larger than the page's body
+text, largest first, so ``headings[0]`` is the page title) and the share of the page
+covered by images. A page is ``figure_heavy`` when images cover a large part of it or it
+has almost no text layer (scans, full-page figures); only those pages need their image
+in a prompt. Drawings made of vector paths carry no image and are not detected.
+
+``write_page_text`` keeps one document's pages in a columnar ``.npz`` (text and headings as
+UTF-8 buffers plus offsets, one array per numeric column); ``PageTexts`` opens a
+directory of them lazily per document and answers by page id.
+
+Build files for already ingested PDFs (``cli.py ingest`` does this while ingesting) and
+look up a page's title and headings without a multimodal call:
+  python page_text.py --pdf ./manuals
+  python page_text.py --page_id 3f2a9c1b7d4e-p59
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import threading
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from page_ids import document_id, parse_page_id, pdf_sources
+
+DEFAULT_TEXT_DIR = "./page_text"
+
+# a line is a heading candidate at this multiple of the page's median line height
+HEADING_SCALE = 1.25
+MAX_HEADINGS = 3
+MAX_HEADING_CHARS = 120
+# below this many characters the text layer cannot stand in for the page image
+MIN_TEXT_CHARS = 80
+FIGURE_IMAGE_FRACTION = 0.3
+
+# control characters from broken text layers are not valid XML
+_INVALID_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+@dataclass(frozen=True)
+class PageLayout:
+    text: str
+    headings: Tuple[str, ...] = ()
+    image_fraction: float = 0.0
+    figure_heavy: bool = False
+
+
+def is_figure_heavy(text: str, image_fraction: float) -> bool:
+    return image_fraction >= FIGURE_IMAGE_FRACTION or len(text.strip()) < MIN_TEXT_CHARS
+
+
+def _poppler(tool: str, poppler_path: Optional[str]) -> str:
+    return os.path.join(poppler_path, tool) if poppler_path else tool
+
+
+def _page_range(first_page: Optional[int], last_page: Optional[int]) -> List[str]:
+    args = []
+    if first_page is not None:
+        args += ["-f", str(first_page)]
+    if last_page is not None:
+        args += ["-l", str(last_page)]
+    return args
+
+
+def _headings(lines: List[Tuple[str, float, int]]) -> Tuple[str, ...]:
+    """Heading candidates from ``(text, height, block)`` lines in reading order."""
+    if not lines:
+        return ()
+    body = statistics.median(height for _, height, _ in lines)
+    large = [(text, height, block) for text, height, block in lines if height >= HEADING_SCALE * body]
+    if not large:
+        # uniform type (e.g. bold headings): a short first line standing alone in its block
+        text, _, block = lines[0]
+        alone = len(lines) == 1 or lines[1][2] != block
+        return (text,) if alone and len(text) <= MAX_HEADING_CHARS and any(c.isalpha() for c in text) else ()
+
+    # consecutive large lines of one block and size are one heading (titles wrapping over lines)
+    merged: List[Tuple[str, float]] = []
+    previous: Optional[Tuple[float, int]] = None
+    for text, height, block in large:
+        if merged and previous is not None and previous[1] == block and abs(previous[0] - height) <= 0.1 * height:
+            merged[-1] = (f"{merged[-1][0]} {text}", max(merged[-1][1], height))
+        else:
+            merged.append((text, height))
+        previous = (height, block)
+    candidates = [(text, height) for text, height in merged if len(text) <= MAX_HEADING_CHARS and any(c.isalpha() for c in text)]
+    # largest first; equal sizes keep reading order
+    ranked = sorted(range(len(candidates)), key=lambda i: -candidates[i][1])
+    return tuple(candidates[i][0] for i in ranked[:MAX_HEADINGS])
+
+
+def parse_bbox_layout(xhtml: str) -> List[Tuple[str, Tuple[str, ...], float]]:
+    """``(text, headings, page_area)`` per page of ``pdftotext -bbox-layout`` output."""
+    root = ET.fromstring(_INVALID_XML.sub("", xhtml))
+    pages = []
+    for page in root.iter():
+        if not page.tag.endswith("}page") and page.tag != "page":
+            continue
+        area = float(page.get("width", 0)) * float(page.get("height", 0))
+        blocks, lines = [], []
+        for b, block in enumerate(el for el in page.iter() if el.tag.endswith("block")):
+            block_lines = []
+            for line in (el for el in block.iter() if el.tag.endswith("line")):
+                words = [w.text or "" for w in line.iter() if w.tag.endswith("word")]
+                text = " ".join(w for w in words if w)
+                if text:
+                    block_lines.append(text)
+                    lines.append((text, float(line.get("yMax", 0)) - float(line.get("yMin", 0)), b))
+            if block_lines:
+                blocks.append("\n".join(block_lines))
+        pages.append(("\n\n".join(blocks), _headings(lines), area))
+    return pages
+
+
+def parse_image_list(listing: str) -> Dict[int, float]:
+    """Displayed image area (pt²) per 1-based page from ``pdfimages -list`` output.
+
+    Soft masks and masks are not counted: they belong to an image listed on its own row.
+    """
+    areas: Dict[int, float] = {}
+    for row in listing.splitlines()[2:]:
+        fields = row.split()
+        # page num type width height color comp bpc enc interp object ID x-ppi y-ppi size ratio;
+        # inline images print "[inline]" for "object ID", so the ppi are read from the right
+        if len(fields) < 15 or fields[2] not in ("image", "stencil"):
+            continue
+        try:
+            page, width, height, x_ppi, y_ppi = int(fields[0]), int(fields[3]), int(fields[4]), float(fields[-4]), float(fields[-3])
+        except ValueError:
+            continue
+        if x_ppi > 0 and y_ppi > 0:
+            areas[page] = areas.get(page, 0.0) + (width / x_ppi * 72) * (height / y_ppi * 72)
+    return areas
+
+
+def extract_layout(
+    pdf_path: str, first_page: Optional[int] = None, last_page: Optional[int] = None, poppler_path: Optional[str] = None
+) -> List[PageLayout]:
+    """``PageLayout`` of each page in the 1-based range ``[first_page, last_page]`` (whole document by default).
+
+    Module-level, so it can run in the same process pool as ``page_stream.render_pages``.
+    """
+    span_args = _page_range(first_page, last_page)
+    command = [_poppler("pdftotext", poppler_path), "-bbox-layout", "-enc", "UTF-8", *span_args, pdf_path, "-"]
+    out = subprocess.run(command, check=True, capture_output=True).stdout.decode("utf-8", errors="replace")
+    pages = parse_bbox_layout(out)
+
+    listing = subprocess.run(
+        [_poppler("pdfimages", poppler_path), "-list", *span_args, pdf_path], check=True, capture_output=True
+    ).stdout.decode("utf-8", errors="replace")
+    image_areas = parse_image_list(listing)
+
+    first = first_page or 1
+    layouts = []
+    for i, (text, headings, area) in enumerate(pages):
+        image_fraction = min(image_areas.get(first + i, 0.0) / area, 1.0) if area else 0.0
+        layouts.append(PageLayout(text, headings, image_fraction, is_figure_heavy(text, image_fraction)))
+    return layouts
+
+
+def page_text_path(text_dir: str, source: str) -> str:
+    return os.path.join(text_dir, f"{document_id(source)}.npz")
+
+
+def _pack(strings: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(e) for e in encoded])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def write_page_text(path: str, source: str, layouts: Sequence[PageLayout], page_count: Optional[int] = None) -> None:
+    """Store the ``layouts`` of the document keyed ``source`` at ``path`` (replaced atomically)."""
+    text, text_offsets = _pack([layout.text for layout in layouts])
+    headings, heading_offsets = _pack(["\n".join(layout.headings) for layout in layouts])
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp.npz"
+    np.savez_compressed(
+        tmp_path,
+        text=text,
+        text_offsets=text_offsets,
+        headings=headings,
+        heading_offsets=heading_offsets,
+        chars=np.array([len(layout.text) for layout in layouts], dtype=np.int32),
+        image_fraction=np.array([layout.image_fraction for layout in layouts], dtype=np.float32),
+        figure_heavy=np.array([layout.figure_heavy for layout in layouts], dtype=bool),
+        doc=np.array([document_id(source), source]),
+        page_count=np.array(page_count if page_count is not None else len(layouts), dtype=np.int64),
+    )
+    os.replace(tmp_path, path)
+
+
+class PageTextFile:
+    def __init__(self, path: str):
+        with np.load(path, allow_pickle=False) as data:
+            self.text = data["text"].tobytes()
+            self.text_offsets = data["text_offsets"]
+            self.headings = data["headings"].tobytes()
+            self.heading_offsets = data["heading_offsets"]
+            self.chars = data["chars"]
+            self.image_fraction = data["image_fraction"]
+            self.figure_heavy = data["figure_heavy"]
+            self.doc_id, self.source = (str(x) for x in data["doc"])
+            self.page_count = int(data["page_count"])
+
+    def __len__(self) -> int:
+        return len(self.chars)
+
+    def layout(self, page: int) -> Optional[PageLayout]:
+        if not 0 <= page < len(self):
+            return None
+        text = self.text[self.text_offsets[page] : self.text_offsets[page + 1]].decode("utf-8")
+        headings = self.headings[self.heading_offsets[page] : self.heading_offsets[page + 1]].decode("utf-8")
+        return PageLayout(
+            text,
+            tuple(h for h in headings.split("\n") if h),
+            float(self.image_fraction[page]),
+            bool(self.figure_heavy[page]),
+        )
+
+
+class PageTexts:
+    """Every document's ``PageTextFile`` in ``text_dir``, each loaded on first use."""
+
+    def __init__(self, text_dir: str = DEFAULT_TEXT_DIR):
+        self.text_dir = text_dir
+        self._lock = threading.Lock()
+        self._files: Dict[str, Optional[PageTextFile]] = {}
+
+    def _file(self, doc_id: str) -> Optional[PageTextFile]:
+        with self._lock:
+            if doc_id not in self._files:
+                path = os.path.join(self.text_dir, f"{doc_id}.npz")
+                self._files[doc_id] = PageTextFile(path) if doc_id and os.path.exists(path) else None
+            return self._files[doc_id]
+
+    def get(self, pid: str) -> Optional[PageLayout]:
+        """Layout of a page id, or ``None`` if its document has no page text file."""
+        doc_id, page = parse_page_id(pid)
+        file = self._file(doc_id)
+        return file.layout(page) if file is not None else None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build or read the per-page text and layout files.")
+    parser.add_argument("--pdf", nargs="*", default=[], help="PDF files, directories of PDFs or glob patterns to (re)extract")
+    parser.add_argument("--text_dir", default=DEFAULT_TEXT_DIR, help="Directory holding one file per document")
+    parser.add_argument("--poppler_path", default=None, help="Directory of the poppler binaries")
+    parser.add_argument("--page_id", nargs="*", default=[], help="Pages to print the headings of")
+    parser.add_argument("--text", action="store_true", help="Also print the page text")
+    args = parser.parse_args()
+
+    # keyed like ``cli.py ingest`` keys the same patterns, so files land under the ingested ids
+    for pdf_path, key in pdf_sources(args.pdf).items():
+        layouts = extract_layout(pdf_path, poppler_path=args.poppler_path)
+        write_page_text(page_text_path(args.text_dir, key), key, layouts)
+        figures = sum(layout.figure_heavy for layout in layouts)
+        print(f"Extracted {len(layouts)} pages of {pdf_path} ({figures} figure-heavy)", flush=True)
+
+    texts = PageTexts(args.text_dir)
+    for pid in args.page_id:
+        layout = texts.get(pid)
+        if layout is None:
+            print(f"{pid}: no page text")
+            continue
+        kind = "figure-heavy" if layout.figure_heavy else "text"
+        print(f"{pid} [{kind}]: " + (" | ".join(layout.headings) or "(no headings)"))
+        if args.text:
+            print(layout.text)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,7 @@
 # from typing import Dict, List
 
 
-# def query_collection(co_client: cohere.ClientV2, collection: chromadb.api.models.Collection, queries: str, model: str, top_k: int = 5) -> Dict[str, List]:
+# def query_collection(co_client: "cohere.ClientV2", collection: "chromadb.api.models.Collection", queries: str, model: str, top_k: int = 5) -> Dict[str, List]:
 #     query_input = [{"content": [{"type": "text", "text": query}]} for query in queries]
 
 #     query_emb = co_client.embed(
@@ -39,27 +39,58 @@
 
 #     # asyncio.run(main())
 
-import chromadb
-import cohere
-from typing import Dict, List, Any
+import argparse
+import os
+from typing import Dict, List, Any, Optional
 
+from lexical_index import LexicalIndex, hybrid_search
+from query_embedder import QueryEmbedder, get_query_embedder
+from reranking import RERANKERS, Reranker, make_reranker
 
-def query_collection(
-    co_client: cohere.ClientV2, collection: chromadb.api.models.Collection, queries: List[str], model: str, top_k: int = 5  # <- era str; agora é List[str]
+
+def query_results(
+    co_client: "cohere.ClientV2",
+    collection: "chromadb.api.models.Collection",
+    queries: List[str],
+    model: str,
+    top_k: int = 5,
+    embedder: Optional[QueryEmbedder] = None,
+    lexical_index: Optional[LexicalIndex] = None,
+    reranker: Optional[Reranker] = None,
 ) -> Dict[str, List[Any]]:
-    # Gere embeddings de texto (query) em float
-    res = co_client.embed(
-        texts=queries,  # <- use texts para texto puro
-        model="embed-v4.0",
-        input_type="search_query",  # tipo otimizado para consultas
-        embedding_types=["float"],  # pedimos floats
-    )
+    # collection: coleção do Chroma ou vector_store.NumpyVectorStore (mesma interface de query)
+    # Embeddings das queries (search_query, float) via cache LRU + coalescing: queries repetidas
+    # não chamam a API de novo e chamadas concorrentes viram um único request
+    embedder = embedder or get_query_embedder(co_client, model)
+    # Dois estágios: com reranker, busca mais candidatos e deixa o reranker escolher os top_k
+    n_results = reranker.fetch_k(top_k) if reranker is not None else top_k
+
+    def vector_search(texts: List[str]) -> Dict[str, List[Any]]:
+        query_embs: List[List[float]] = embedder.embed(texts)
+        # Busque no Chroma com várias queries de uma vez (ids, distances e metadatas por query)
+        return collection.query(query_embeddings=query_embs, n_results=n_results)
+
+    if lexical_index is None:
+        results = vector_search(queries)
+    else:
+        # Híbrido: BM25 local + vetores por RRF; buscas exatas (frases entre aspas, códigos) nem chamam a API
+        results = hybrid_search(lexical_index, queries, vector_search, n_results=n_results)
+    if reranker is None:
+        return results
+    return reranker.rerank(queries, results, top_k)
 
-    # Vetores já vêm como List[List[float]]
-    query_embs: List[List[float]] = res.embeddings.float  # <- acesso correto
 
-    # Busque no Chroma com várias queries de uma vez
-    results = collection.query(query_embeddings=query_embs, n_results=top_k)
+def query_collection(
+    co_client: "cohere.ClientV2",
+    collection: "chromadb.api.models.Collection",
+    queries: List[str],  # <- era str; agora é List[str]
+    model: str,
+    top_k: int = 5,
+    embedder: Optional[QueryEmbedder] = None,
+    lexical_index: Optional[LexicalIndex] = None,
+    reranker: Optional[Reranker] = None,
+) -> Dict[str, List[Any]]:
+    results = query_results(co_client, collection, queries, model, top_k, embedder, lexical_index, reranker)
     return results.get("ids")
 
 
@@ -79,47 +110,104 @@ def query_collection(
 
 #     print(out)
 
-from typing import Iterable, List, Tuple
-
-
-def expand_pages(pages: Iterable[str | int], min_page: int = 0, max_page: int = 167) -> List[Tuple[int, ...]]:
-    """Expande cada página para (n-1, n, n+1), cortando no limite [min_page, max_page]."""
-    out: List[Tuple[int, ...]] = []
-    for p in pages:
-        n = int(p)
-        start = max(n - 1, min_page)
-        end = min(n + 1, max_page)
-        out.append(tuple(range(start, end + 1)))
-    return out
-
-
-def all_pages(pages: List[Iterable[str | int]], min_page: int = 0, max_page: int = 167) -> List[Tuple[int, ...]]:
-    return [expand_pages(page, min_page, max_page) for page in pages]
-
-
-def pair_search(co_client: cohere.ClientV2, collection: chromadb.api.models.Collection, queries: List[str], model: str, top_k: int = 5) -> Dict[str, List[Any]]:
-    # zipped_pages = all_pages(queries)
-
-    result = query_collection(co_client, collection, queries, model, top_k)
-
-    zipped_pages = zip(queries, all_pages(result))
-
-    print(list(zipped_pages))
-
-    # pass
-
-
-# # exemplos:
-# first = ["2", "0", "49", "24", "126"]
-# second = ["166", "127", "22", "3", "141"]
+from context_assembly import DEFAULT_RADIUS, ContextRange, assemble_context
+
+
+def pair_search(
+    co_client: "cohere.ClientV2",
+    collection: "chromadb.api.models.Collection",
+    queries: List[str],
+    model: str,
+    top_k: int = 5,
+    token_budget: Optional[int] = None,
+    lexical_index: Optional[LexicalIndex] = None,
+    reranker: Optional[Reranker] = None,
+) -> List[ContextRange]:
+    # Vizinhos (n-1, n+1) limitados pelo page_count real do documento; faixas sobrepostas
+    # entre queries são unidas, então cada página é buscada uma vez só.
+    # Com reranker os vizinhos já competiram como candidatos: só as páginas escolhidas entram
+    result = query_results(co_client, collection, queries, model, top_k, lexical_index=lexical_index, reranker=reranker)
+    radius = 0 if reranker is not None else DEFAULT_RADIUS
+    return assemble_context(result, radius=radius, token_budget=token_budget)
+
+
+# chromadb e cohere só são importados quando o comando roda (open_vector_store/get_cohere_client),
+# então "cli.py query --help" e o modo --server não pagam pelos dois
+DESCRIPTION = "Query the page index."
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--query", nargs="+", default=["fluss", "impressum"], help="Queries to run")
+    parser.add_argument("--top_k", type=int, default=5, help="Pages per query")
+    parser.add_argument("--model", default="embed-v4.0", help="Cohere embed model to use")
+    parser.add_argument(
+        "--server",
+        default=os.environ.get("RETRIEVAL_SERVER_URL"),
+        help="Query a running retrieval_server.py (http://host:port or unix:///path) instead of the local index",
+    )
+    parser.add_argument("--backend", default="chroma", choices=["chroma", "numpy"], help="Vector store backend")
+    parser.add_argument("--persist_dir", default="./chroma_db", help="Chroma DB directory")
+    parser.add_argument("--collection", default="pdf_pages", help="Chroma collection name")
+    parser.add_argument("--index_path", default=None, help="NumPy index path (see vector_store.py)")
+    parser.add_argument("--lexical_index", default=None, help="BM25 index directory for hybrid search (see lexical_index.py)")
+    parser.add_argument("--token_budget", type=int, default=None, help="Prompt token budget for the assembled pages")
+    parser.add_argument("--rerank", default=None, choices=RERANKERS, help="Rerank over-fetched candidates (needs --lexical_index)")
+    parser.add_argument("--overfetch", type=int, default=4, help="First-stage hits per final page when reranking")
+    parser.add_argument("--rerank_budget", type=float, default=1.0, help="Seconds allowed for reranking")
+    parser.add_argument("--import_only", action="store_true", help="Load the code this query would run, then exit (startup profiling)")
+
+
+def _remote_context(args: argparse.Namespace) -> List[ContextRange]:
+    from retrieval_service import RemoteRetrievalService
+
+    service = RemoteRetrievalService(args.server, top_k=args.top_k)
+    if args.import_only:
+        return []
+    ranges = service.query(args.query, context=True, token_budget=args.token_budget).get("ranges", [])
+    return [
+        ContextRange(r["doc_id"], r["source"], r["first_page"], r["last_page"], r["score"], tuple(r["hit_pages"]))
+        for r in ranges
+    ]
+
+
+def run(args: argparse.Namespace) -> None:
+    if args.server:
+        # índice já aquecido em outro processo: nem chromadb nem cohere são carregados aqui
+        context = _remote_context(args)
+    else:
+        from clients import get_cohere_client
+        from vector_store import open_vector_store
+
+        if args.import_only:
+            # o que a primeira query carregaria: o SDK da Cohere e, no backend chroma, o chromadb
+            import cohere  # noqa: F401
+
+            if args.backend == "chroma":
+                import chromadb  # noqa: F401
+            return
+        co_client = get_cohere_client(os.environ.get("COHERE_API_KEY"))
+        collection = open_vector_store(args.backend, args.persist_dir, args.collection, index_path=args.index_path)
+
+        lexical_index = LexicalIndex(args.lexical_index) if args.lexical_index else None
+        reranker = make_reranker(
+            args.rerank, lexical_index, co_client, overfetch=args.overfetch, budget=args.rerank_budget
+        )
+
+        context = pair_search(
+            co_client,
+            collection,
+            args.query,
+            args.model,
+            top_k=args.top_k,
+            token_budget=args.token_budget,
+            lexical_index=lexical_index,
+            reranker=reranker,
+        )
+    for r in context:
+        print(f"{r.source or r.doc_id}: {r.first_page}-{r.last_page} (hits {list(r.hit_pages)}, score {r.score:.4f})")
 
-# print(all_pages([first, second]))
 
 if __name__ == "__main__":
-    import os
-
-    api_key = os.environ.get("COHERE_API_KEY")
-    co_client = cohere.ClientV2(api_key=api_key)
-    collection = chromadb.PersistentClient(path="./chroma_db").get_collection("pdf_pages")
-
-    pair_search(co_client, collection, ["fluss", "impressum"], "embed-v4.0", top_k=5)
+    parser = argparse.ArgumentParser(description=DESCRIPTION)
+    add_arguments(parser)
+    run(parser.parse_args())
@@ -0,0 +1,177 @@
+"""
+query_embedder.py
+
+Cached, coalescing query embeddings for ``query_collection``.
+
+- Vectors are cached in-process in an LRU keyed by (model, input_type, normalized text),
+  with a TTL and a size limit, and optionally in an on-disk ``EmbeddingCache``.
+- Concurrent callers asking for the same uncached query share one in-flight request.
+- Callers arriving within ``batch_window`` seconds are micro-batched: the first one waits
+  that long, then sends every pending query in a single embed call.
+"""
+import hashlib
+import threading
+import time
+import unicodedata
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+from embed_batching import MAX_INPUTS_PER_CALL, embed_inputs
+from embedding_cache import EmbeddingCache, cache_key
+
+
+def normalize_query(text: str) -> str:
+    """NFC, casefolded, with whitespace collapsed -- "Impressum " and "impressum" share a vector."""
+    return " ".join(unicodedata.normalize("NFC", text).casefold().split())
+
+
+class QueryEmbedder:
+    def __init__(
+        self,
+        co_client: Any,
+        model: str = "embed-v4.0",
+        input_type: str = "search_query",
+        max_entries: int = 4096,
+        ttl: float = 24 * 3600,
+        batch_window: float = 0.005,
+        disk_cache: Optional[EmbeddingCache] = None,
+    ):
+        self.co_client = co_client
+        self.model = model
+        self.input_type = input_type
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.batch_window = batch_window
+        self.disk_cache = disk_cache
+        self.hits = self.misses = self.api_calls = 0
+
+        self._lock = threading.Lock()
+        self._lru: "OrderedDict[str, Tuple[List[float], float]]" = OrderedDict()
+        self._in_flight: Dict[str, Future] = {}
+        self._pending: List[Tuple[str, str]] = []
+        self._flush_scheduled = False
+
+    def _key(self, text: str) -> str:
+        return f"{self.model}:{self.input_type}:{normalize_query(text)}"
+
+    def _disk_key(self, key: str) -> str:
+        return cache_key(hashlib.sha256(key.encode("utf-8")).hexdigest(), self.model, self.input_type, None)
+
+    def _lru_get(self, key: str) -> Optional[List[float]]:
+        item = self._lru.get(key)
+        if item is None:
+            return None
+        vector, expires = item
+        if expires < time.monotonic():
+            del self._lru[key]
+            return None
+        self._lru.move_to_end(key)
+        return vector
+
+    def _lru_put(self, key: str, vector: List[float]) -> None:
+        self._lru[key] = (vector, time.monotonic() + self.ttl)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def embed(self, queries: List[str]) -> List[List[float]]:
+        """Float embeddings for ``queries``, in order."""
+        keys = [self._key(q) for q in queries]
+        results: Dict[str, List[float]] = {}
+        waits: Dict[str, Future] = {}
+        unseen: List[Tuple[str, str]] = []
+
+        with self._lock:
+            for text, key in zip(queries, keys):
+                if key in results or key in waits:
+                    continue
+                vector = self._lru_get(key)
+                if vector is not None:
+                    self.hits += 1
+                    results[key] = vector
+                elif key in self._in_flight:
+                    self.hits += 1
+                    waits[key] = self._in_flight[key]
+                else:
+                    unseen.append((key, text))
+
+        if unseen and self.disk_cache is not None:
+            stored = self.disk_cache.get_many([self._disk_key(key) for key, _ in unseen])
+            with self._lock:
+                for key, _ in unseen:
+                    vector = stored.get(self._disk_key(key))
+                    if vector is not None:
+                        self._lru_put(key, vector)
+                        results[key] = vector
+            unseen = [(key, text) for key, text in unseen if key not in results]
+
+        leader = False
+        with self._lock:
+            for key, text in unseen:
+                # another caller may have scheduled it since the first check
+                future = self._in_flight.get(key)
+                if future is None:
+                    self.misses += 1
+                    future = self._in_flight[key] = Future()
+                    self._pending.append((key, text))
+                waits[key] = future
+            if self._pending and not self._flush_scheduled:
+                self._flush_scheduled = leader = True
+
+        if leader:
+            # give concurrent callers a moment to join this batch
+            time.sleep(self.batch_window)
+            self._flush()
+
+        for key, future in waits.items():
+            results[key] = future.result()
+        return [results[key] for key in keys]
+
+    def _flush(self) -> None:
+        with self._lock:
+            batch, self._pending = self._pending, []
+            self._flush_scheduled = False
+        if not batch:
+            return
+
+        futures = [self._in_flight[key] for key, _ in batch]
+        try:
+            self.api_calls += 1
+            vectors = embed_inputs(
+                self.co_client,
+                [{"content": [{"type": "text", "text": text}]} for _, text in batch],
+                self.model,
+                input_type=self.input_type,
+                max_inputs=MAX_INPUTS_PER_CALL,
+            )
+        except Exception as exc:
+            with self._lock:
+                for key, _ in batch:
+                    self._in_flight.pop(key, None)
+            for future in futures:
+                future.set_exception(exc)
+            return
+
+        with self._lock:
+            for (key, _), vector in zip(batch, vectors):
+                self._lru_put(key, vector)
+                self._in_flight.pop(key, None)
+        if self.disk_cache is not None:
+            self.disk_cache.put_many({self._disk_key(key): vector for (key, _), vector in zip(batch, vectors)})
+        for future, vector in zip(futures, vectors):
+            future.set_result(vector)
+
+
+_EMBEDDERS: "weakref.WeakKeyDictionary[Any, Dict[str, QueryEmbedder]]" = weakref.WeakKeyDictionary()
+_EMBEDDERS_LOCK = threading.Lock()
+
+
+def get_query_embedder(co_client: Any, model: str = "embed-v4.0", **kwargs: Any) -> QueryEmbedder:
+    """Process-wide ``QueryEmbedder`` per (client, model), so its cache outlives single calls."""
+    with _EMBEDDERS_LOCK:
+        per_client = _EMBEDDERS.setdefault(co_client, {})
+        if model not in per_client:
+            per_client[model] = QueryEmbedder(co_client, model=model, **kwargs)
+        return per_client[model]
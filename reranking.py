@@ -0,0 +1,212 @@
+"""
+reranking.py
+
+Second retrieval stage: rerank over-fetched candidates before they reach the prompt.
+
+The first stage (vector or hybrid search) is cheap but coarse, and neighbor expansion in
+``context_assembly`` puts every neighbor page into the context. With a ``Reranker`` the
+first stage fetches ``overfetch`` times more hits per query, each hit's neighbor pages
+(``radius``) join them as candidates, and a pluggable scorer orders the candidates so only
+the best ``top_k`` pages per query are kept. Scorers:
+
+- ``LexicalScorer``: BM25 of the query on each candidate page, from the local
+  ``LexicalIndex`` (no API call),
+- ``ApiRerankScorer``: Cohere rerank over the pages' stored text, one request per query
+  for all of its candidates, with an LRU of (query, page) scores so repeated candidates
+  are not sent again.
+
+Neither scorer's recall gain is verified on real embeddings yet: ``bench-retrieval.py
+--rerank`` measures it with ``FakeEmbedClient``, whose hashed bag-of-words vectors agree
+with BM25 by construction, so its numbers are an upper bound for ``LexicalScorer`` and say
+nothing about ``ApiRerankScorer``. Measure against recorded Cohere embeddings before
+turning reranking on by default.
+
+Queries are scored in parallel, and the stage has a latency budget: a query whose
+scoring has not finished in ``budget`` seconds keeps its first-stage order. Both steps
+are traced (``rerank.candidates``, ``rerank.score``); set ``TRACE_PATH`` and use
+``tracing.py`` for per-stage timings.
+"""
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Protocol, Sequence, Tuple
+
+import numpy as np
+
+from lexical_index import LexicalIndex
+from page_ids import page_id, parse_page_id
+from query_embedder import normalize_query
+from tracing import span
+
+Hit = Dict[str, Any]
+
+
+class Scorer(Protocol):
+    def score(self, query: str, candidates: List[Hit]) -> List[float]:
+        """Relevance of each candidate (``{"id", "metadata"}``) to ``query``; higher is better."""
+        ...
+
+
+class LexicalScorer:
+    """BM25 of the query on each candidate page (gain over the first stage unverified, see above)."""
+
+    def __init__(self, index: LexicalIndex):
+        self.index = index
+
+    def score(self, query: str, candidates: List[Hit]) -> List[float]:
+        return self.index.score_pages(query, [c["id"] for c in candidates]).tolist()
+
+
+class ApiRerankScorer:
+    """Cohere rerank over page text; pages without text score ``-inf`` (first-stage order)."""
+
+    def __init__(
+        self,
+        co_client: Any,
+        page_text: Callable[[str], Optional[str]],
+        model: str = "rerank-v3.5",
+        max_entries: int = 20_000,
+        max_tokens_per_doc: int = 1024,
+    ):
+        self.co_client = co_client
+        self.page_text = page_text
+        self.model = model
+        self.max_entries = max_entries
+        self.max_tokens_per_doc = max_tokens_per_doc
+        self.hits = self.misses = self.api_calls = 0
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+
+    def score(self, query: str, candidates: List[Hit]) -> List[float]:
+        key = normalize_query(query)
+        scores: Dict[str, float] = {}
+        with self._lock:
+            for c in candidates:
+                cached = self._cache.get((key, c["id"]))
+                if cached is not None:
+                    self._cache.move_to_end((key, c["id"]))
+                    scores[c["id"]] = cached
+            self.hits += len(scores)
+
+        missing = [(c["id"], self.page_text(c["id"])) for c in candidates if c["id"] not in scores]
+        missing = [(pid, text) for pid, text in missing if text]
+        if missing:
+            response = self.co_client.rerank(
+                model=self.model,
+                query=query,
+                documents=[text for _, text in missing],
+                max_tokens_per_doc=self.max_tokens_per_doc,
+            )
+            fresh = {missing[r.index][0]: float(r.relevance_score) for r in response.results}
+            scores.update(fresh)
+            with self._lock:
+                self.api_calls += 1
+                self.misses += len(fresh)
+                for pid, value in fresh.items():
+                    self._cache[(key, pid)] = value
+                while len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+        return [scores.get(c["id"], float("-inf")) for c in candidates]
+
+
+def expand_candidates(hits: List[Hit], radius: int = 1) -> List[Hit]:
+    """``hits`` followed by their neighbor pages within ``radius`` (clipped to ``page_count``)."""
+    seen = {h["id"] for h in hits}
+    out = list(hits)
+    for hit in hits:
+        meta = hit.get("metadata") or {}
+        doc_id, page = parse_page_id(hit["id"])
+        doc_id, page = meta.get("doc_id", doc_id), int(meta.get("page", page))
+        if not doc_id:
+            continue
+        # legacy entries without page_count: never expand past the hit itself
+        last = int(meta.get("page_count", page + 1)) - 1
+        for neighbor in range(max(page - radius, 0), min(page + radius, last) + 1):
+            pid = page_id(doc_id, neighbor)
+            if pid not in seen:
+                seen.add(pid)
+                location = {k: meta[k] for k in ("source", "page_count") if k in meta}
+                out.append({"id": pid, "distance": None, "metadata": {**location, "doc_id": doc_id, "page": neighbor}})
+    return out
+
+
+class Reranker:
+    def __init__(
+        self,
+        scorer: Scorer,
+        overfetch: int = 4,
+        radius: int = 1,
+        budget: float = 1.0,
+        max_workers: int = 4,
+    ):
+        self.scorer = scorer
+        self.overfetch = overfetch
+        self.radius = radius
+        self.budget = budget
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rerank")
+
+    def fetch_k(self, top_k: int) -> int:
+        """First-stage hits to fetch for ``top_k`` final pages."""
+        return top_k * self.overfetch
+
+    def _order(self, query: str, candidates: List[Hit]) -> List[int]:
+        scores = np.asarray(self.scorer.score(query, candidates), dtype=np.float64)
+        # stable sort: equal scores keep first-stage order (hits before neighbors)
+        return np.argsort(-scores, kind="stable").tolist()
+
+    def rerank(self, queries: Sequence[str], results: Dict[str, List[List[Any]]], top_k: int) -> Dict[str, List[List[Any]]]:
+        """Chroma-shaped ``results`` (over-fetched) -> the ``top_k`` reranked pages per query.
+
+        ``distances`` of the output are negated positions (lower is better), as the scorers'
+        scales are not comparable.
+        """
+        ids = results.get("ids") or []
+        metadatas = results.get("metadatas") or [None] * len(ids)
+        with span("rerank.candidates", queries=len(queries), radius=self.radius) as s:
+            candidates = [
+                expand_candidates(
+                    [{"id": pid, "metadata": (metas[n] if metas else None) or {}} for n, pid in enumerate(query_ids)],
+                    self.radius,
+                )
+                for query_ids, metas in zip(ids, metadatas)
+            ]
+            s.set("candidates", sum(len(c) for c in candidates))
+
+        with span("rerank.score", budget=self.budget) as s:
+            futures = [self._pool.submit(self._order, q, c) for q, c in zip(queries, candidates)]
+            done, _ = wait(futures, timeout=self.budget)
+            s.set("timed_out", len(futures) - len(done))
+
+        out: Dict[str, List[List[Any]]] = {"ids": [], "distances": [], "metadatas": []}
+        for future, cands in zip(futures, candidates):
+            if future in done and future.exception() is None:
+                order = future.result()[:top_k]
+            else:
+                future.cancel()
+                # over budget or failed: first-stage order, hits only
+                order = list(range(min(top_k, len(cands))))
+            out["ids"].append([cands[i]["id"] for i in order])
+            out["distances"].append([-float(rank) for rank in range(1, len(order) + 1)])
+            out["metadatas"].append([cands[i]["metadata"] for i in order])
+        return out
+
+
+RERANKERS = ("lexical", "cohere")
+
+
+def make_reranker(
+    kind: Optional[str],
+    lexical_index: Optional[LexicalIndex] = None,
+    co_client: Any = None,
+    **kwargs: Any,
+) -> Optional[Reranker]:
+    """``Reranker`` for a CLI/env choice (``None``/"" -> no second stage); both need the lexical index."""
+    if not kind:
+        return None
+    if kind not in RERANKERS:
+        raise ValueError(f"unknown reranker {kind!r}, expected one of {RERANKERS}")
+    if lexical_index is None:
+        raise ValueError(f"the {kind} reranker needs a lexical index (page texts and BM25 statistics)")
+    if kind == "lexical":
+        return Reranker(LexicalScorer(lexical_index), **kwargs)
+    return Reranker(ApiRerankScorer(co_client, lexical_index.page_text), **kwargs)
@@ -0,0 +1,352 @@
+"""
+retrieval_server.py
+
+Long-running retrieval server: the page index is opened once and stays warm, and every
+client (``chat.py``, the ``search`` tool in ``ok.py``) queries it over HTTP instead of
+opening Chroma and a Cohere client per process.
+
+Endpoints (HTTP/1.1 with keep-alive, over TCP or a Unix socket):
+
+- ``POST /query`` ``{"queries": [...], "top_k": 5, "context": false, "token_budget": null}``
+  returns ``{"results": {query: [{"id", "distance", "metadata"}, ...]}}``; with
+  ``"context": true`` also ``"ranges"``, the pages ``pair_search`` would assemble.
+  ``top_k`` must be an integer from 1 to ``--max_top_k`` (400 otherwise), as a batch is
+  searched with the largest ``top_k`` among its requests,
+- ``GET /health``: index size and uptime,
+- ``GET /metrics``: Prometheus text -- requests, batches, latency quantiles, embed cache.
+
+Concurrent ``/query`` requests arriving within ``batch_window`` are micro-batched: their
+queries are de-duplicated and served by one ``query_results`` call, i.e. one embed
+request and one vectorized index search for the whole batch.
+
+Usage:
+  python cli.py serve --port 8765
+  python retrieval_server.py --port 8765
+  python retrieval_server.py --uds /tmp/retrieval.sock --backend numpy --lexical_index ./lexical_index
+  RETRIEVAL_SERVER_URL=http://127.0.0.1:8765 streamlit run chat.py
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from dataclasses import asdict
+from http import HTTPStatus
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
+
+from context_assembly import assemble_context
+from lexical_index import LexicalIndex
+from query_collection import query_results
+from query_embedder import QueryEmbedder, get_query_embedder
+from reranking import RERANKERS, Reranker, make_reranker
+from tracing import span
+
+MAX_BODY_BYTES = 1 << 20
+MAX_TOP_K = 50
+LATENCY_WINDOW = 2048
+
+
+class QueryBatcher:
+    """Collects the queries of concurrent requests and searches them in one call."""
+
+    def __init__(self, server: "RetrievalServer", batch_window: float = 0.005, max_batch: int = 64):
+        self.server = server
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self._pending: List[Tuple[List[str], int, asyncio.Future]] = []
+        self._pending_queries = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._running: Set[asyncio.Task] = set()
+
+    async def submit(self, queries: List[str], top_k: int) -> Dict[str, Any]:
+        """Chroma-shaped results for ``queries`` (one list per query), at most ``top_k`` hits each."""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((queries, top_k, future))
+        self._pending_queries += len(queries)
+        if self._pending_queries >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.batch_window, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending, self._pending_queries = self._pending, [], 0
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            # the loop only keeps weak references to tasks
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch: List[Tuple[List[str], int, asyncio.Future]]) -> None:
+        unique = list(dict.fromkeys(q for queries, _, _ in batch for q in queries))
+        top_k = max(k for _, k, _ in batch)
+        server = self.server
+        try:
+            with span("retrieval.batch", requests=len(batch), queries=len(unique)):
+                results = await asyncio.to_thread(
+                    query_results,
+                    server.co_client,
+                    server.collection,
+                    unique,
+                    server.model,
+                    top_k,
+                    server.embedder,
+                    server.lexical_index,
+                    server.reranker,
+                )
+        except Exception as exc:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+
+        server.batches += 1
+        server.batched_queries += len(unique)
+        row = {query: i for i, query in enumerate(unique)}
+        keys = [key for key in ("ids", "distances", "metadatas") if results.get(key) is not None]
+        for queries, k, future in batch:
+            if not future.done():
+                future.set_result({key: [results[key][row[q]][:k] for q in queries] for key in keys})
+
+
+class RetrievalServer:
+    def __init__(
+        self,
+        co_client: Any,
+        collection: Any,
+        model: str = "embed-v4.0",
+        top_k: int = 5,
+        embedder: Optional[QueryEmbedder] = None,
+        lexical_index: Optional[LexicalIndex] = None,
+        reranker: Optional[Reranker] = None,
+        batch_window: float = 0.005,
+        max_batch: int = 64,
+        max_top_k: int = MAX_TOP_K,
+    ):
+        if not 1 <= top_k <= max_top_k:
+            raise ValueError(f"top_k must be from 1 to max_top_k ({max_top_k}), got {top_k}")
+        self.co_client = co_client
+        self.collection = collection
+        self.model = model
+        self.top_k = top_k
+        self.max_top_k = max_top_k
+        self.embedder = embedder or get_query_embedder(co_client, model)
+        self.lexical_index = lexical_index
+        self.reranker = reranker
+        self.batcher = QueryBatcher(self, batch_window, max_batch)
+        self.started = time.time()
+        self.requests: Dict[str, int] = {}
+        self.errors = self.batches = self.batched_queries = 0
+        self._latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+    def warm_up(self) -> None:
+        """Touch the index once, so the first request does not pay for loading it."""
+        if not self.collection.count():
+            return
+        # NumpyVectorStore keeps its matrix in ``embeddings``; for Chroma, fetch one vector
+        vectors = getattr(self.collection, "embeddings", None)
+        if vectors is None:
+            vectors = self.collection.get(limit=1, include=["embeddings"])["embeddings"]
+        self.collection.query(query_embeddings=[list(vectors[0])], n_results=1)
+
+    async def query(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        if not isinstance(body, dict):
+            raise ValueError("expected a JSON object")
+        queries = body.get("queries")
+        if isinstance(queries, str):
+            queries = [queries]
+        if not isinstance(queries, list) or not all(isinstance(q, str) for q in queries):
+            raise ValueError('"queries" must be a list of strings')
+        top_k = body.get("top_k")
+        if top_k is None:
+            top_k = self.top_k
+        if isinstance(top_k, bool) or not isinstance(top_k, int) or not 1 <= top_k <= self.max_top_k:
+            raise ValueError(f'"top_k" must be an integer from 1 to {self.max_top_k}')
+        results = await self.batcher.submit(queries, top_k) if queries else {"ids": []}
+
+        out: Dict[str, Any] = {"results": {}}
+        for i, query in enumerate(queries):
+            out["results"][query] = [
+                {
+                    "id": pid,
+                    "distance": results["distances"][i][n] if "distances" in results else None,
+                    "metadata": (results["metadatas"][i][n] if "metadatas" in results else None) or {},
+                }
+                for n, pid in enumerate(results["ids"][i])
+            ]
+        if body.get("context"):
+            ranges = assemble_context(results, token_budget=body.get("token_budget"))
+            out["ranges"] = [{**asdict(r), "hit_pages": list(r.hit_pages), "page_ids": r.page_ids} for r in ranges]
+        return out
+
+    def health(self) -> Dict[str, Any]:
+        return {
+            "status": "ok",
+            "pages": self.collection.count(),
+            "lexical_index": self.lexical_index is not None,
+            "uptime_s": round(time.time() - self.started, 1),
+        }
+
+    def metrics(self) -> str:
+        lines = ["# TYPE retrieval_requests_total counter"]
+        lines += [f'retrieval_requests_total{{path="{path}"}} {n}' for path, n in sorted(self.requests.items())]
+        lines += [
+            "# TYPE retrieval_errors_total counter",
+            f"retrieval_errors_total {self.errors}",
+            "# TYPE retrieval_batches_total counter",
+            f"retrieval_batches_total {self.batches}",
+            "# TYPE retrieval_batched_queries_total counter",
+            f"retrieval_batched_queries_total {self.batched_queries}",
+            "# TYPE retrieval_query_seconds summary",
+        ]
+        latencies = sorted(self._latencies)
+        for q in (0.5, 0.95, 0.99):
+            value = latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else 0.0
+            lines.append(f'retrieval_query_seconds{{quantile="{q}"}} {value:.6f}')
+        lines.append(f"retrieval_query_seconds_count {len(latencies)}")
+        embedder = self.embedder
+        lines += [
+            "# TYPE retrieval_embed_cache_hits_total counter",
+            f"retrieval_embed_cache_hits_total {embedder.hits}",
+            "# TYPE retrieval_embed_cache_misses_total counter",
+            f"retrieval_embed_cache_misses_total {embedder.misses}",
+            "# TYPE retrieval_embed_api_calls_total counter",
+            f"retrieval_embed_api_calls_total {embedder.api_calls}",
+            "# TYPE retrieval_index_pages gauge",
+            f"retrieval_index_pages {self.collection.count()}",
+        ]
+        return "\n".join(lines) + "\n"
+
+    async def _route(self, method: str, path: str, body: bytes) -> Tuple[int, str, bytes]:
+        label = path if path in ("/query", "/health", "/metrics") else "other"
+        self.requests[label] = self.requests.get(label, 0) + 1
+        if method == "POST" and path == "/query":
+            started = time.perf_counter()
+            try:
+                payload = await self.query(json.loads(body or b"{}"))
+            except (ValueError, TypeError) as exc:
+                self.errors += 1
+                return HTTPStatus.BAD_REQUEST, "application/json", json.dumps({"error": str(exc)}).encode("utf-8")
+            self._latencies.append(time.perf_counter() - started)
+            return HTTPStatus.OK, "application/json", json.dumps(payload).encode("utf-8")
+        if method == "GET" and path == "/health":
+            return HTTPStatus.OK, "application/json", json.dumps(self.health()).encode("utf-8")
+        if method == "GET" and path == "/metrics":
+            return HTTPStatus.OK, "text/plain; version=0.0.4", self.metrics().encode("utf-8")
+        return HTTPStatus.NOT_FOUND, "application/json", b'{"error": "not found"}'
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Serve HTTP/1.1 requests on one connection until the client closes it."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, version = request_line.decode("latin-1").split()
+                headers: Dict[str, str] = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY_BYTES:
+                    status, content_type, payload = HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "application/json", b"{}"
+                    headers["connection"] = "close"
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    try:
+                        status, content_type, payload = await self._route(method, urlsplit(target).path, body)
+                    except Exception as exc:
+                        self.errors += 1
+                        status, content_type = HTTPStatus.INTERNAL_SERVER_ERROR, "application/json"
+                        payload = json.dumps({"error": f"{type(exc).__name__}: {exc}"}).encode("utf-8")
+
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                writer.write(
+                    f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                    f"Content-Type: {content_type}\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1")
+                    + payload
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8765, uds: Optional[str] = None) -> None:
+        if uds:
+            if os.path.exists(uds):
+                os.remove(uds)
+            server = await asyncio.start_unix_server(self.handle, path=uds)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+        where = uds or f"http://{host}:{port}"
+        print(f"Retrieval server on {where} ({self.collection.count()} pages)", flush=True)
+        async with server:
+            await server.serve_forever()
+
+
+DESCRIPTION = "Serve the page index over HTTP with micro-batched queries."
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=8765, help="TCP port")
+    parser.add_argument("--uds", default=None, help="Listen on this Unix socket instead of TCP")
+    parser.add_argument("--backend", default="chroma", choices=["chroma", "numpy"], help="Vector store backend")
+    parser.add_argument("--persist_dir", default="./chroma_db", help="Chroma DB directory")
+    parser.add_argument("--collection", default="pdf_pages", help="Chroma collection name")
+    parser.add_argument("--index_path", default=None, help="NumPy index path (see vector_store.py)")
+    parser.add_argument("--lexical_index", default=None, help="BM25 index directory for hybrid search")
+    parser.add_argument("--rerank", default=None, choices=RERANKERS, help="Rerank over-fetched candidates (needs --lexical_index)")
+    parser.add_argument("--overfetch", type=int, default=4, help="First-stage hits per final page when reranking")
+    parser.add_argument("--rerank_budget", type=float, default=1.0, help="Seconds allowed for reranking a batch")
+    parser.add_argument("--model", default="embed-v4.0", help="Cohere embed model")
+    parser.add_argument("--top_k", type=int, default=5, help="Default hits per query")
+    parser.add_argument("--max_top_k", type=int, default=MAX_TOP_K, help="Largest top_k a request may ask for")
+    parser.add_argument("--batch_window", type=float, default=0.005, help="Seconds to collect concurrent requests")
+    parser.add_argument("--max_batch", type=int, default=64, help="Flush a batch early at this many queries")
+
+
+def run(args: argparse.Namespace) -> None:
+    from clients import get_cohere_client
+    from vector_store import open_vector_store
+
+    collection = open_vector_store(args.backend, args.persist_dir, args.collection, index_path=args.index_path)
+    co_client = get_cohere_client(os.environ.get("COHERE_API_KEY"))
+    lexical_index = LexicalIndex(args.lexical_index) if args.lexical_index else None
+    server = RetrievalServer(
+        co_client,
+        collection,
+        model=args.model,
+        top_k=args.top_k,
+        lexical_index=lexical_index,
+        reranker=make_reranker(args.rerank, lexical_index, co_client, overfetch=args.overfetch, budget=args.rerank_budget),
+        batch_window=args.batch_window,
+        max_batch=args.max_batch,
+        max_top_k=args.max_top_k,
+    )
+    server.warm_up()
+    asyncio.run(server.serve(args.host, args.port, args.uds))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=DESCRIPTION)
+    add_arguments(parser)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,407 @@
+"""
+retrieval_service.py
+
+Async retrieval behind the ``search`` tool in ``ok.py``.
+
+One assistant turn may issue several ``search`` tool calls, each with several
+queries. ``RetrievalService.plan`` takes every query of the turn at once and starts a
+``RetrievalPlan``; queries of later tool calls may join it with ``add`` until it is
+``seal``ed. The plan:
+
+- embeds all queries in one batched request (through the shared ``QueryEmbedder``),
+- runs the vector searches concurrently (at most ``max_concurrency`` per turn),
+- with a ``LexicalIndex``, fuses BM25 hits into every query and answers exact-match
+  lookups from the index alone, leaving them out of the embed request,
+- hands each page to the query that ranks it best (the earlier query on a tie), once
+  every query of the turn is in, so overlapping hits are not repeated across queries or
+  tool calls and the outcome does not depend on which search finished first,
+- with a ``Reranker``, over-fetches candidates and keeps the reranked top-k per query,
+- enforces a per-turn time budget: whatever has not finished by the deadline is
+  reported as timed out and cancelled instead of stalling the turn.
+
+Tool latency is then that of the slowest query instead of the sum of all of them.
+
+``RemoteRetrievalService`` offers the same ``plan``/``search`` interface on top of a
+long-running ``retrieval_server.py``, which keeps the index warm across processes.
+``format_hits`` renders the hits for the model; with the ingest-time ``page_text`` files
+each hit carries its page title and text, so the tool answer has content and not only
+page numbers.
+"""
+import asyncio
+import os
+import weakref
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple, Union
+
+import httpx
+
+from clients import HTTP_TIMEOUT, async_http_client, get_cohere_client, http_client
+from lexical_index import DEFAULT_INDEX_DIR, LexicalIndex, fuse_results
+from page_text import DEFAULT_TEXT_DIR, PageTexts
+from query_embedder import QueryEmbedder, get_query_embedder
+from reranking import Reranker, make_reranker
+from tracing import span
+
+
+def _assign(
+    order: List[str], ranked: Dict[str, Optional[List[Dict[str, Any]]]], claimed: Set[str]
+) -> Dict[str, Optional[List[Dict[str, Any]]]]:
+    """Each page under the query that ranks it best, ties going to the query earlier in ``order``.
+
+    Timed out queries (``None``) stay ``None``; pages in ``claimed`` were returned before and
+    are left out. Claims the pages it hands out.
+    """
+    best: Dict[str, Tuple[int, int]] = {}
+    for position, query in enumerate(order):
+        for rank, hit in enumerate(ranked[query] or []):
+            if hit["id"] not in claimed:
+                best[hit["id"]] = min(best.get(hit["id"], (rank, position)), (rank, position))
+    out: Dict[str, Optional[List[Dict[str, Any]]]] = {}
+    for position, query in enumerate(order):
+        hits = ranked[query]
+        out[query] = None if hits is None else [h for rank, h in enumerate(hits) if best.get(h["id"]) == (rank, position)]
+    claimed.update(best)
+    return out
+
+
+class _TurnPlan(ABC):
+    """Queries of one turn, their deadline and the page deduplication shared by both plan kinds.
+
+    Subclasses start the searches of the queries passed to ``_start``, report the unfinished
+    ones in ``_pending``, read a finished query's hits in ``_hits`` and stop what is left in
+    ``cancel``. A plan opened with ``sealed=False`` may still gain queries (``add``);
+    ``results`` then waits for ``seal`` (or the deadline) so that pages are assigned once,
+    over every query of the turn, whatever order the searches finish in.
+    """
+
+    def __init__(self, queries: Sequence[str], budget: float, sealed: bool = True):
+        self.queries: List[str] = []
+        self.deadline = asyncio.get_running_loop().time() + budget
+        self._claimed: Set[str] = set()
+        self._assigned: Dict[str, Optional[List[Dict[str, Any]]]] = {}
+        self._sealed = asyncio.Event()
+        if sealed:
+            self._sealed.set()
+        self.add(queries)
+
+    @abstractmethod
+    def _start(self, queries: List[str]) -> None:
+        """Start searching ``queries``, which just joined the plan."""
+
+    @abstractmethod
+    def _pending(self) -> Set[asyncio.Future]:
+        """Futures of the searches that have not finished yet."""
+
+    @abstractmethod
+    def _hits(self, query: str) -> Optional[List[Dict[str, Any]]]:
+        """Ranked hits of ``query``, or ``None`` if its search did not finish."""
+
+    @abstractmethod
+    def cancel(self) -> None:
+        """Stop every search that has not finished."""
+
+    def add(self, queries: Sequence[str]) -> None:
+        """Start the searches of the queries the plan does not have yet."""
+        new = [q for q in dict.fromkeys(queries) if q not in self.queries]
+        if new:
+            self.queries.extend(new)
+            self._start(new)
+
+    def seal(self) -> None:
+        """No more queries will join before ``results`` hands out pages."""
+        self._sealed.set()
+
+    def _remaining(self) -> float:
+        return max(self.deadline - asyncio.get_running_loop().time(), 0.0)
+
+    async def results(self, queries: Sequence[str]) -> Dict[str, Optional[List[Dict[str, Any]]]]:
+        """Hits per query, waiting at most until the turn deadline.
+
+        Each hit is ``{"id", "distance", "metadata"}``. A page found by several queries of the
+        plan is returned only under the one that ranks it best (the earliest such query on a
+        tie), so the outcome does not depend on which search finished first; pages returned
+        before are left out. A query that missed the deadline maps to ``None``.
+        """
+        queries = list(dict.fromkeys(queries))
+        self.add(queries)
+        if not self._sealed.is_set():
+            try:
+                await asyncio.wait_for(self._sealed.wait(), self._remaining())
+            except asyncio.TimeoutError:
+                pass
+        pending = self._pending()
+        if pending:
+            _, late = await asyncio.wait(pending, timeout=self._remaining())
+            if late:
+                # past the deadline: their results would be thrown away, so no further stage
+                # (vector query, rerank, ...) is scheduled for them
+                self.cancel()
+
+        unassigned = [q for q in self.queries if q not in self._assigned]
+        if unassigned:
+            self._assigned.update(_assign(unassigned, {q: self._hits(q) for q in unassigned}, self._claimed))
+        return {q: self._assigned[q] for q in queries}
+
+
+def _finished(future: asyncio.Future) -> bool:
+    return future.done() and not future.cancelled() and future.exception() is None
+
+
+class RetrievalPlan(_TurnPlan):
+    def __init__(self, service: "RetrievalService", queries: Sequence[str], budget: float, sealed: bool = True):
+        self.service = service
+        self._semaphore = asyncio.Semaphore(service.max_concurrency)
+        self._local: Set[str] = set()
+        self._embeddings: Dict[str, Tuple[asyncio.Future, int]] = {}
+        self._searches: Dict[str, asyncio.Future] = {}
+        super().__init__(queries, budget, sealed)
+
+    def _start(self, queries: List[str]) -> None:
+        lexical = self.service.lexical_index
+        self._local.update(q for q in queries if lexical is not None and lexical.answers_locally(q))
+        embedded = [q for q in queries if q not in self._local]
+        if embedded:
+            # one batched embed request per group of queries joining the plan
+            batch = asyncio.ensure_future(self._embed(embedded))
+            self._embeddings.update((query, (batch, i)) for i, query in enumerate(embedded))
+        self._searches.update((q, asyncio.ensure_future(self._search(q))) for q in queries)
+
+    def _pending(self) -> Set[asyncio.Future]:
+        return {future for future in self._searches.values() if not future.done()}
+
+    async def _embed(self, queries: List[str]) -> List[List[float]]:
+        with span("retrieval.embed", queries=len(queries)):
+            return await asyncio.to_thread(self.service.embedder.embed, queries)
+
+    async def _vector_search(self, query: str) -> Dict[str, List[List[Any]]]:
+        batch, i = self._embeddings[query]
+        embedding = (await batch)[i]
+        async with self._semaphore:
+            with span("retrieval.vector_query", top_k=self.service.fetch_k):
+                return await asyncio.to_thread(
+                    self.service.collection.query, query_embeddings=[embedding], n_results=self.service.fetch_k
+                )
+
+    async def _search(self, query: str) -> Dict[str, List[Any]]:
+        service = self.service
+        lexical = service.lexical_index
+        if lexical is None:
+            results = await self._vector_search(query)
+        else:
+            with span("retrieval.lexical", local=query in self._local):
+                lexical_results = await asyncio.to_thread(lexical.search, [query], service.fetch_k)
+            if query in self._local:
+                results = lexical_results
+            else:
+                results = fuse_results([await self._vector_search(query), lexical_results], service.fetch_k)
+        if service.reranker is not None:
+            results = await asyncio.to_thread(service.reranker.rerank, [query], results, service.top_k)
+        return {key: (value[0] if value else []) for key, value in results.items() if key != "included"}
+
+    def _hits(self, query: str) -> Optional[List[Dict[str, Any]]]:
+        future = self._searches[query]
+        if not _finished(future):
+            return None
+        result = future.result()
+        distances = result.get("distances") or [None] * len(result.get("ids", []))
+        metadatas = result.get("metadatas") or [None] * len(result.get("ids", []))
+        return [
+            {"id": pid, "distance": distance, "metadata": metadata or {}}
+            for pid, distance, metadata in zip(result.get("ids", []), distances, metadatas)
+        ]
+
+    def cancel(self) -> None:
+        for future in [*(batch for batch, _ in self._embeddings.values()), *self._searches.values()]:
+            future.cancel()
+
+
+class RetrievalService:
+    def __init__(
+        self,
+        co_client: Any,
+        collection: Any,
+        model: str = "embed-v4.0",
+        top_k: int = 5,
+        turn_budget: float = 8.0,
+        max_concurrency: int = 8,
+        embedder: Optional[QueryEmbedder] = None,
+        lexical_index: Optional[LexicalIndex] = None,
+        reranker: Optional[Reranker] = None,
+    ):
+        self.co_client = co_client
+        self.collection = collection
+        self.model = model
+        self.top_k = top_k
+        self.turn_budget = turn_budget
+        self.max_concurrency = max_concurrency
+        self.embedder = embedder or get_query_embedder(co_client, model)
+        self.lexical_index = lexical_index
+        self.reranker = reranker
+        # first-stage hits per query: over-fetched when a reranker picks the final top_k
+        self.fetch_k = reranker.fetch_k(top_k) if reranker is not None else top_k
+
+    def plan(self, queries: Sequence[str], budget: Optional[float] = None, sealed: bool = True) -> RetrievalPlan:
+        """Start retrieval for every query of a turn; must be called from a running event loop.
+
+        With ``sealed=False`` more queries may ``add`` themselves until the plan is ``seal``ed.
+        """
+        return RetrievalPlan(self, queries, self.turn_budget if budget is None else budget, sealed)
+
+    async def search(self, queries: Sequence[str]) -> Dict[str, Optional[List[Dict[str, Any]]]]:
+        return await self.plan(queries).results(queries)
+
+
+class RemoteRetrievalPlan(_TurnPlan):
+    """``RetrievalPlan`` counterpart that sends the turn's queries to a ``retrieval_server``."""
+
+    def __init__(self, service: "RemoteRetrievalService", queries: Sequence[str], budget: float, sealed: bool = True):
+        self.service = service
+        self._requests: Dict[str, asyncio.Future] = {}
+        super().__init__(queries, budget, sealed)
+
+    def _start(self, queries: List[str]) -> None:
+        # one request per group of queries joining the plan; the server batches it with other clients
+        request = asyncio.ensure_future(self.service.aquery(queries))
+        self._requests.update((query, request) for query in queries)
+
+    def _pending(self) -> Set[asyncio.Future]:
+        return {future for future in self._requests.values() if not future.done()}
+
+    def _hits(self, query: str) -> Optional[List[Dict[str, Any]]]:
+        future = self._requests[query]
+        return future.result()["results"].get(query, []) if _finished(future) else None
+
+    def cancel(self) -> None:
+        for future in set(self._requests.values()):
+            future.cancel()
+
+
+class RemoteRetrievalService:
+    """Client of ``retrieval_server.py`` at ``url`` (``http://host:port`` or ``unix:///path.sock``)."""
+
+    def __init__(self, url: str, top_k: int = 5, turn_budget: float = 8.0):
+        self.uds = url[len("unix://") :] if url.startswith("unix://") else None
+        self.base_url = "http://retrieval" if self.uds else url.rstrip("/")
+        self.top_k = top_k
+        self.turn_budget = turn_budget
+        self._client: Optional[httpx.Client] = None
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def _sync_client(self) -> httpx.Client:
+        if self.uds is None:
+            return http_client()
+        if self._client is None:
+            self._client = httpx.Client(transport=httpx.HTTPTransport(uds=self.uds), timeout=HTTP_TIMEOUT)
+        return self._client
+
+    def _async_client(self) -> httpx.AsyncClient:
+        if self.uds is None:
+            return async_http_client()  # type: ignore[return-value]
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            transport = httpx.AsyncHTTPTransport(uds=self.uds)
+            client = self._async_clients[loop] = httpx.AsyncClient(transport=transport, timeout=HTTP_TIMEOUT)
+        return client
+
+    def _payload(self, queries: Sequence[str], top_k: Optional[int], options: Dict[str, Any]) -> Dict[str, Any]:
+        return {"queries": list(queries), "top_k": top_k or self.top_k, **options}
+
+    def query(self, queries: Sequence[str], top_k: Optional[int] = None, **options: Any) -> Dict[str, Any]:
+        """``/query`` response: ``{"results": {query: hits}}`` (plus ``"ranges"`` with ``context=True``)."""
+        response = self._sync_client().post(f"{self.base_url}/query", json=self._payload(queries, top_k, options))
+        response.raise_for_status()
+        return response.json()
+
+    async def aquery(self, queries: Sequence[str], top_k: Optional[int] = None, **options: Any) -> Dict[str, Any]:
+        with span("retrieval.remote", queries=len(queries)):
+            response = await self._async_client().post(
+                f"{self.base_url}/query", json=self._payload(queries, top_k, options)
+            )
+            response.raise_for_status()
+            return response.json()
+
+    def plan(self, queries: Sequence[str], budget: Optional[float] = None, sealed: bool = True) -> RemoteRetrievalPlan:
+        return RemoteRetrievalPlan(self, queries, self.turn_budget if budget is None else budget, sealed)
+
+    async def search(self, queries: Sequence[str]) -> Dict[str, Optional[List[Dict[str, Any]]]]:
+        return await self.plan(queries).results(queries)
+
+
+def format_hits(
+    results: Dict[str, Optional[List[Dict[str, Any]]]], texts: Optional[PageTexts] = None, max_chars: int = 1500
+) -> str:
+    """Render search results as the tool output the model reads.
+
+    With ``texts``, each page gets its title and up to ``max_chars`` of its text; figure-heavy
+    pages are marked instead, as their text layer does not carry their content.
+    """
+    lines = []
+    for query, hits in results.items():
+        lines.append(f"## {query}")
+        if hits is None:
+            lines.append("- (search timed out)")
+        elif not hits:
+            lines.append("- (no new pages)")
+        for hit in hits or []:
+            meta = hit["metadata"]
+            where = f"{meta.get('source', '?')}, page {meta['page'] + 1}" if "page" in meta else hit["id"]
+            layout = texts.get(hit["id"]) if texts is not None else None
+            if layout is not None and layout.headings:
+                where = f"{where}: {layout.headings[0]}"
+            lines.append(f"- {where} [id={hit['id']}]")
+            if layout is None:
+                continue
+            if layout.figure_heavy:
+                lines.append("  (mostly figures or scanned; no usable text)")
+                continue
+            text = " ".join(layout.text.split())
+            lines.append(f"  {text[:max_chars]}{'…' if len(text) > max_chars else ''}")
+    return "\n".join(lines)
+
+
+_DEFAULT_TEXTS: Optional[PageTexts] = None
+
+
+def get_page_texts() -> Optional[PageTexts]:
+    """Process-wide ``PageTexts`` over ``PAGE_TEXT_DIR`` (``None`` if nothing was extracted)."""
+    global _DEFAULT_TEXTS
+    text_dir = os.environ.get("PAGE_TEXT_DIR", DEFAULT_TEXT_DIR)
+    if _DEFAULT_TEXTS is None and os.path.isdir(text_dir):
+        _DEFAULT_TEXTS = PageTexts(text_dir)
+    return _DEFAULT_TEXTS
+
+
+_DEFAULT_SERVICE: Optional[Union[RetrievalService, RemoteRetrievalService]] = None
+
+
+def get_retrieval_service() -> Union[RetrievalService, RemoteRetrievalService]:
+    """Process-wide service over ``./chroma_db`` (or ``RETRIEVAL_BACKEND=numpy``) and ``COHERE_API_KEY``.
+
+    Hybrid search is enabled when the BM25 index directory (``LEXICAL_INDEX_DIR``) exists,
+    and ``RERANKER=lexical|cohere`` adds the reranking stage on top of it.
+    With ``RETRIEVAL_SERVER_URL`` set, queries go to that ``retrieval_server`` instead.
+    """
+    global _DEFAULT_SERVICE
+    if _DEFAULT_SERVICE is None and os.environ.get("RETRIEVAL_SERVER_URL"):
+        _DEFAULT_SERVICE = RemoteRetrievalService(os.environ["RETRIEVAL_SERVER_URL"])
+    if _DEFAULT_SERVICE is None:
+        from vector_store import open_vector_store
+
+        collection = open_vector_store(
+            os.environ.get("RETRIEVAL_BACKEND", "chroma"),
+            os.environ.get("CHROMA_DIR", "./chroma_db"),
+            os.environ.get("CHROMA_COLLECTION", "pdf_pages"),
+        )
+        lexical_dir = os.environ.get("LEXICAL_INDEX_DIR", DEFAULT_INDEX_DIR)
+        lexical_index = LexicalIndex(lexical_dir) if os.path.isdir(lexical_dir) else None
+        co_client = get_cohere_client(os.environ.get("COHERE_API_KEY"))
+        _DEFAULT_SERVICE = RetrievalService(
+            co_client,
+            collection,
+            lexical_index=lexical_index,
+            reranker=make_reranker(os.environ.get("RERANKER"), lexical_index, co_client),
+        )
+    return _DEFAULT_SERVICE
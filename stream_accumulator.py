@@ -0,0 +1,106 @@
+"""
+stream_accumulator.py
+
+Linear-time accumulation of a streamed chat model reply.
+
+``gathered = gathered + chunk`` re-merges the whole message on every chunk: the content
+string is copied and every tool-call fragment list is rebuilt, so a long reply costs
+O(n^2). ``StreamAccumulator`` appends content pieces and tool-call argument fragments to
+lists and joins them once, when the message is read. It also reports each tool call
+the moment its JSON arguments are complete, which is what ``ok.ToolCallPipeline`` needs
+to start tools mid-stream. A parse is only attempted when a fragment closes an object,
+so that check stays cheap too.
+"""
+import json
+from typing import Any, Dict, List, Optional
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+
+class _ToolCallBuffer:
+    __slots__ = ("name", "id", "args", "done")
+
+    def __init__(self) -> None:
+        self.name: Optional[str] = None
+        self.id: Optional[str] = None
+        self.args: List[str] = []
+        self.done = False
+
+
+class StreamAccumulator:
+    def __init__(self) -> None:
+        self.id: Optional[str] = None
+        self.usage_metadata: Optional[Dict[str, int]] = None
+        self.response_metadata: Dict[str, Any] = {}
+        self.chunks = 0
+        self._content: List[str] = []
+        self._tool_calls: Dict[int, _ToolCallBuffer] = {}
+
+    def add(self, chunk: AIMessageChunk) -> List[Dict[str, Any]]:
+        """Append ``chunk``; returns the tool calls whose arguments it completed."""
+        self.chunks += 1
+        self.id = self.id or chunk.id
+        if chunk.content:
+            if isinstance(chunk.content, str):
+                self._content.append(chunk.content)
+            else:
+                self._content.extend(p if isinstance(p, str) else p.get("text", "") for p in chunk.content)
+        if chunk.usage_metadata:
+            self.usage_metadata = dict(chunk.usage_metadata)
+        if chunk.response_metadata:
+            self.response_metadata.update(chunk.response_metadata)
+
+        completed = []
+        for fragment in chunk.tool_call_chunks:
+            index = fragment.get("index") or 0
+            buffer = self._tool_calls.get(index)
+            if buffer is None:
+                buffer = self._tool_calls[index] = _ToolCallBuffer()
+            buffer.name = buffer.name or fragment.get("name")
+            buffer.id = buffer.id or fragment.get("id")
+            args = fragment.get("args") or ""
+            buffer.args.append(args)
+            if not buffer.done and buffer.name and buffer.id and args.rstrip().endswith("}"):
+                tool_call = self._parse(buffer)
+                if tool_call is not None:
+                    buffer.done = True
+                    completed.append(tool_call)
+        return completed
+
+    @staticmethod
+    def _parse(buffer: _ToolCallBuffer) -> Optional[Dict[str, Any]]:
+        try:
+            args = json.loads("".join(buffer.args) or "{}")
+        except ValueError:
+            return None
+        if not isinstance(args, dict):
+            return None
+        return {"name": buffer.name, "args": args, "id": buffer.id, "type": "tool_call"}
+
+    @property
+    def content(self) -> str:
+        if len(self._content) > 1:
+            self._content = ["".join(self._content)]
+        return self._content[0] if self._content else ""
+
+    @property
+    def tool_calls(self) -> List[Dict[str, Any]]:
+        """Every tool call whose arguments parse, in stream order."""
+        calls = (self._parse(self._tool_calls[index]) for index in sorted(self._tool_calls))
+        return [call for call in calls if call is not None]
+
+    def message(self) -> AIMessage:
+        """The whole reply, for the conversation history."""
+        invalid = [
+            {"name": b.name, "args": "".join(b.args), "id": b.id, "error": None, "type": "invalid_tool_call"}
+            for _, b in sorted(self._tool_calls.items())
+            if self._parse(b) is None
+        ]
+        return AIMessage(
+            content=self.content,
+            id=self.id,
+            tool_calls=self.tool_calls,
+            invalid_tool_calls=invalid,
+            usage_metadata=self.usage_metadata,
+            response_metadata=self.response_metadata,
+        )
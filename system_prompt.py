@@ -0,0 +1,87 @@
+"""
+system_prompt.py
+
+Compiled, per-company system prompts.
+
+The assistant's system prompt is an ~8 KB template filled with the company's
+institutional info and manager instructions. ``CompiledTemplate`` parses the template
+once into literal segments and field names, and ``SystemPromptCache`` keeps the
+rendered ``SystemMessage`` per company, re-rendering only when the company's data
+fingerprint changes. Every turn of a conversation therefore starts with the very same
+message object -- a byte-identical prefix, which is what provider-side prompt caching
+keys on.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from string import Formatter
+from typing import List, Optional, Tuple
+
+from langchain_core.messages import SystemMessage
+
+
+@dataclass(frozen=True)
+class CompanyData:
+    company: str
+    role: str
+    institutional_info: str
+    agent_name: str
+    manager_custom_instructions: str = ""
+
+    def fingerprint(self) -> str:
+        digest = hashlib.sha256()
+        for value in asdict(self).values():
+            digest.update(value.encode("utf-8") + b"\x1f")
+        return digest.hexdigest()
+
+
+class CompiledTemplate:
+    """A ``str.format`` template split once into ``(literal, field)`` pairs."""
+
+    def __init__(self, template: str):
+        self._parts: List[Tuple[str, Optional[str]]] = []
+        for literal, field, spec, conversion in Formatter().parse(template):
+            if spec or conversion:
+                raise ValueError(f"format specs are not supported in prompt templates: {{{field}}}")
+            self._parts.append((literal, field))
+        self.fields = {field for _, field in self._parts if field is not None}
+
+    def render(self, **values: str) -> str:
+        missing = self.fields - values.keys()
+        if missing:
+            raise KeyError(f"missing prompt fields: {sorted(missing)}")
+        return "".join(literal + (str(values[field]) if field is not None else "") for literal, field in self._parts)
+
+
+class SystemPromptCache:
+    def __init__(self, template: str, max_entries: int = 1024):
+        self.template = CompiledTemplate(template)
+        self.max_entries = max_entries
+        self.hits = self.misses = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[str, SystemMessage]]" = OrderedDict()
+
+    def get(self, company: CompanyData, key: Optional[str] = None) -> SystemMessage:
+        """System message for ``company`` (cached under ``key``, the company name by default)."""
+        key = key or company.company
+        fingerprint = company.fingerprint()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == fingerprint:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        message = SystemMessage(content=self.template.render(**asdict(company)))
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = (fingerprint, message)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return message
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
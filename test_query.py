@@ -1,44 +1,21 @@
 import argparse
+import os
 
+from clients import get_cohere_client
 from query_collection import query_collection
-
-
-parser = argparse.ArgumentParser(description="Convert PDF to embeddings using Cohere embed-v4 and store in ChromaDB.")
-
-
-from pdf2image import convert_from_path
-from io import BytesIO
-import base64
-import chromadb
-import cohere
-import argparse
-import os
-from typing import Tuple, Optional
+from vector_store import open_vector_store
 
 
 if __name__ == "__main__":
 
-    parser = argparse.ArgumentParser(description="Convert PDF to embeddings using Cohere embed-v4 and store in ChromaDB.")
+    parser = argparse.ArgumentParser(description="Run one query against the page index and print the top page ids.")
     parser.add_argument("--query", required=True, help="Query to run")
     args = parser.parse_args()
 
-    api_key = os.environ.get("COHERE_API_KEY")
-    co_client = cohere.ClientV2(api_key=api_key)
-    collection = chromadb.PersistentClient(path="./chroma_db").get_collection("pdf_pages")
-
-    if args.query:
-
-        print(f"Running query: {args.query}")
-        results = query_collection(co_client, collection, args.query, "embed-v4.0", top_k=5)
-        print("Top result ids:", results.get("ids"))
-    else:
-        print("No query provided. Done.")
-
-    # asyncio.run(main())
+    co_client = get_cohere_client(os.environ.get("COHERE_API_KEY"))
+    collection = open_vector_store("chroma", "./chroma_db", "pdf_pages")
 
-    # if args.query:
-    #     print(f"Running query: {args.query}")
-    #     results = query_collection(co_client, collection, args.query, args.model, top_k=args.top_k)
-    #     print("Top result ids:", results.get("ids"))
-    # else:
-    #     print("No query provided. Done.")
+    print(f"Running query: {args.query}")
+    # query_collection takes a list of queries and returns one list of ids per query
+    results = query_collection(co_client, collection, [args.query], "embed-v4.0", top_k=5)
+    print("Top result ids:", results[0])
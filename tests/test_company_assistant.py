@@ -0,0 +1,247 @@
+import asyncio
+import os
+import re
+import threading
+import time
+
+import numpy as np
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, ToolMessage  # noqa: E402
+
+from fake_chat_model import FakeStreamingChatModel, ScriptedReply  # noqa: E402
+from fake_embed import FakeEmbedClient, hash_vector  # noqa: E402
+from ok import company_assistant  # noqa: E402
+from retrieval_service import RetrievalService  # noqa: E402
+
+
+class ScriptedCollection:
+    """Scripted page ids per query; a query is recognised by its fake embedding."""
+
+    def __init__(self, hits, delays=None):
+        self.hits = hits
+        self.delays = delays or {}
+        self.started = {}
+        self._lock = threading.Lock()
+        self._queries = list(hits)
+        self._vectors = np.stack([hash_vector(q) for q in self._queries])
+
+    def query(self, query_embeddings, n_results):
+        query = self._queries[int(np.argmax(self._vectors @ np.asarray(query_embeddings[0], dtype=np.float32)))]
+        with self._lock:
+            self.started[query] = time.monotonic()
+        time.sleep(self.delays.get(query, 0.0))
+        ids = self.hits[query][:n_results]
+        return {
+            "ids": [ids],
+            "distances": [[float(rank) for rank in range(len(ids))]],
+            "metadatas": [[{"source": "manual.pdf", "page": int(pid.rpartition("-p")[2])} for pid in ids]],
+        }
+
+
+HITS = {
+    "pumpe wartung": ["m-p1", "m-p2", "m-p3"],
+    "pumpe reinigung": ["m-p2", "m-p1", "m-p4"],
+    "garantie bedingungen": ["m-p7", "m-p5", "m-p9"],
+    "garantie dauer": ["m-p5", "m-p7", "m-p8"],
+}
+
+
+@pytest.fixture(autouse=True)
+def no_page_texts(monkeypatch):
+    monkeypatch.setattr("ok.get_page_texts", lambda: None)
+
+
+def search_call(call_id, *queries):
+    return {"id": call_id, "name": "search", "args": {"queries": list(queries)}}
+
+
+def run_turn(llm, service):
+    """Drive one turn; returns ``[(message id, text, received at)]`` of the streamed chunks."""
+
+    async def turn():
+        chunks = []
+        history = [HumanMessage("Wie warte ich die Pumpe?")]
+        async for chunk in company_assistant(history[-1], history, retrieval_service=service, llm=llm):
+            chunks.append((chunk.id, chunk.content, time.monotonic()))
+        return chunks
+
+    return asyncio.run(turn())
+
+
+def tool_messages(llm):
+    return [m for m in llm.calls[-1] if isinstance(m, ToolMessage)]
+
+
+def sections(content):
+    """``{query: [page ids]}`` of a ``format_hits`` tool answer."""
+    out, query = {}, None
+    for line in content.splitlines():
+        if line.startswith("## "):
+            query = line[3:]
+            out[query] = []
+        elif "[id=" in line:
+            out[query].append(re.search(r"\[id=([^\]]+)\]", line).group(1))
+    return out
+
+
+def test_tool_call_stream_is_accumulated_into_calls_and_answers():
+    llm = FakeStreamingChatModel(
+        [
+            ScriptedReply("Ich schaue nach. ", [search_call("c1", "pumpe wartung"), search_call("c2", "garantie dauer")]),
+            ScriptedReply("Hier ist die Antwort."),
+        ],
+        chunk_size=3,
+    )
+    chunks = run_turn(llm, RetrievalService(FakeEmbedClient(), ScriptedCollection(HITS)))
+
+    assert "".join(text for _, text, _ in chunks) == "Ich schaue nach. Hier ist die Antwort."
+    assert len({message_id for message_id, _, _ in chunks}) == 2
+    [reply] = [m for m in llm.calls[-1] if isinstance(m, AIMessage)]
+    assert [(c["id"], c["args"]) for c in reply.tool_calls] == [
+        ("c1", {"queries": ["pumpe wartung"]}),
+        ("c2", {"queries": ["garantie dauer"]}),
+    ]
+    answers = tool_messages(llm)
+    assert [m.tool_call_id for m in answers] == ["c1", "c2"]
+    assert sections(answers[0].content) == {"pumpe wartung": ["m-p1", "m-p2", "m-p3"]}
+
+
+def test_tool_calls_run_while_the_reply_is_still_streaming():
+    # the second call's long arguments keep the stream going after the first call is complete
+    long_queries = [f"garantie dauer {'x' * 40} {i}" for i in range(4)]
+    hits = {**HITS, **{q: [] for q in long_queries}}
+    collection = ScriptedCollection(hits)
+    llm = FakeStreamingChatModel(
+        [ScriptedReply("", [search_call("c1", "pumpe wartung"), search_call("c2", *long_queries)]), ScriptedReply("Fertig.")],
+        chunk_delay=0.005,
+    )
+    chunks = run_turn(llm, RetrievalService(FakeEmbedClient(), collection))
+
+    first_reply = chunks[0][0]
+    stream_end = max(at for message_id, _, at in chunks if message_id == first_reply)
+    assert collection.started["pumpe wartung"] < stream_end
+
+
+def test_pages_are_deduplicated_across_search_calls_by_rank():
+    expected = [
+        {"pumpe wartung": ["m-p1", "m-p3"], "garantie bedingungen": ["m-p7", "m-p9"]},
+        {"pumpe reinigung": ["m-p2", "m-p4"], "garantie dauer": ["m-p5", "m-p8"]},
+    ]
+    script = [
+        ScriptedReply(
+            "",
+            [
+                search_call("c1", "pumpe wartung", "garantie bedingungen"),
+                search_call("c2", "pumpe reinigung", "garantie dauer"),
+            ],
+        ),
+        ScriptedReply("Fertig."),
+    ]
+    # the outcome must not depend on which search finishes first
+    for delays in ({}, {"pumpe wartung": 0.05, "garantie bedingungen": 0.05}, {"pumpe reinigung": 0.05}):
+        llm = FakeStreamingChatModel(script)
+        run_turn(llm, RetrievalService(FakeEmbedClient(), ScriptedCollection(HITS, delays)))
+        assert [sections(m.content) for m in tool_messages(llm)] == expected
+
+
+def test_searches_past_the_turn_deadline_time_out():
+    llm = FakeStreamingChatModel(
+        [ScriptedReply("", [search_call("c1", "pumpe wartung"), search_call("c2", "garantie dauer")]), ScriptedReply("Fertig.")]
+    )
+    service = RetrievalService(FakeEmbedClient(), ScriptedCollection(HITS, {"garantie dauer": 0.5}), turn_budget=0.1)
+    chunks = run_turn(llm, service)
+
+    assert chunks[-1][2] - chunks[0][2] < 0.4
+    fast, slow = tool_messages(llm)
+    assert sections(fast.content) == {"pumpe wartung": ["m-p1", "m-p2", "m-p3"]}
+    assert "(search timed out)" in slow.content
+
+
+def test_history_manager_budgets_every_request_behind_a_stable_prefix():
+    from history_manager import HistoryManager, extractive_summarizer
+    from system_prompt import CompanyData
+
+    company = CompanyData("Muster GmbH", "support", "Pumpen und Zubehör", "Mia")
+    history = HistoryManager(token_budget=1000, summarizer=extractive_summarizer(max_tokens=100))
+    for i in range(20):
+        history.append(HumanMessage(f"Frage {i}: " + "wie funktioniert die Pumpe " * 5))
+        history.append(AIMessage(f"Antwort {i}: " + "die Pumpe funktioniert so " * 5))
+    history.append(HumanMessage("Wie warte ich die Pumpe?"))
+
+    async def turn(llm):
+        async for _ in company_assistant(
+            history.messages[-1], history, retrieval_service=service, llm=llm, company=company
+        ):
+            pass
+
+    service = RetrievalService(FakeEmbedClient(), ScriptedCollection(HITS))
+    llm = FakeStreamingChatModel([ScriptedReply("", [search_call("c1", "pumpe wartung")]), ScriptedReply("Fertig.")])
+    asyncio.run(turn(llm))
+
+    first, followup = llm.calls
+    # the whole conversation is 41 messages; each request is the budgeted context only
+    assert len(first) < 20 and followup[: len(first)] == first
+    assert first[0].content.startswith("\nYou are an assistant for company Muster GmbH")
+    assert first[1].content.startswith("Summary of the earlier conversation:")
+    assert first[-1].content == "Wie warte ich die Pumpe?"
+    assert isinstance(followup[-1], ToolMessage)
+    # the turn's reply, tool result and answer were recorded
+    assert [type(m) for m in history.messages[-3:]] == [AIMessage, ToolMessage, AIMessage]
+    assert history.messages[-1].content == "Fertig."
+
+    history.append(HumanMessage("Und die Garantie?"))
+    llm = FakeStreamingChatModel([ScriptedReply("Zwei Jahre.")])
+    asyncio.run(turn(llm))
+    assert llm.calls[0][0] is first[0]
+
+
+class ListSink:
+    def __init__(self):
+        self.spans = []
+
+    def export(self, span):
+        self.spans.append(span.to_dict())
+
+
+def test_retrieval_spans_belong_to_the_turn_trace(monkeypatch):
+    sink = ListSink()
+    monkeypatch.setattr("tracing._SINK", sink)
+    llm = FakeStreamingChatModel(
+        [ScriptedReply("", [search_call("c1", "pumpe wartung"), search_call("c2", "garantie dauer")]), ScriptedReply("Fertig.")]
+    )
+    run_turn(llm, RetrievalService(FakeEmbedClient(), ScriptedCollection(HITS)))
+
+    [turn] = [s for s in sink.spans if s["name"] == "company_assistant"]
+    retrieval = [s for s in sink.spans if s["name"].startswith("retrieval.")]
+    assert {s["name"] for s in retrieval} == {"retrieval.embed", "retrieval.vector_query"}
+    assert all(s["parentSpanId"] is not None for s in sink.spans if s is not turn)
+    assert {s["traceId"] for s in sink.spans} == {turn["traceId"]}
+
+
+class BrokenChatModel(FakeStreamingChatModel):
+    async def astream(self, messages):
+        yield AIMessageChunk(content="Ich ")
+        raise RuntimeError("model unavailable")
+
+
+def test_turns_that_fail_or_are_closed_are_still_traced(monkeypatch):
+    sink = ListSink()
+    monkeypatch.setattr("tracing._SINK", sink)
+    service = RetrievalService(FakeEmbedClient(), ScriptedCollection(HITS))
+    with pytest.raises(RuntimeError):
+        run_turn(BrokenChatModel([]), service)
+
+    async def first_chunk_only():
+        history = [HumanMessage("Wie warte ich die Pumpe?")]
+        llm = FakeStreamingChatModel([ScriptedReply("Ich schaue nach, einen Moment.")])
+        turn = company_assistant(history[-1], history, retrieval_service=service, llm=llm)
+        await turn.__anext__()
+        await turn.aclose()
+
+    asyncio.run(first_chunk_only())
+    turns = [s for s in sink.spans if s["name"] == "company_assistant"]
+    assert [s["attributes"]["error"] for s in turns] == ["RuntimeError", "GeneratorExit"]
+    assert all(s["endTimeUnixNano"] is not None for s in turns)
@@ -0,0 +1,145 @@
+import threading
+
+import numpy as np
+import pytest
+
+from embed_batching import embed_inputs, embed_inputs_by_type, embed_with_retry, pack_batches
+from fake_embed import FakeApiError, FakeEmbedClient, hash_vector
+
+
+class ScriptedClient(FakeEmbedClient):
+    """``FakeEmbedClient`` whose calls fail with the scripted status codes first."""
+
+    def __init__(self, failures=(), fail_when=None, **kwargs):
+        super().__init__(**kwargs)
+        self.failures = list(failures)
+        self.fail_when = fail_when
+        self.batches = []
+        self._script_lock = threading.Lock()
+
+    def embed(self, texts=None, inputs=None, **kwargs):
+        items = list(inputs or texts or [])
+        with self._script_lock:
+            self.batches.append(items)
+            status = self.failures.pop(0) if self.failures else None
+        if status is None and self.fail_when is not None and self.fail_when(items):
+            status = 400
+        if status is not None:
+            raise FakeApiError(status, "scripted failure", {"retry-after": "0"})
+        return super().embed(texts=texts, inputs=inputs, **kwargs)
+
+
+def entries(n):
+    return [{"content": [{"type": "text", "text": f"page {i} word{i}"}]} for i in range(n)]
+
+
+def expected(entry):
+    return hash_vector(entry["content"][0]["text"]).tolist()
+
+
+def test_pack_batches_bounds_count_and_bytes():
+    inputs = entries(10)
+    assert pack_batches(inputs, max_inputs=4) == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+    big = [{"content": [{"type": "text", "text": "x" * 100}]} for _ in range(3)]
+    # an entry over the byte budget still gets a batch of its own
+    assert pack_batches(big, max_bytes=150) == [[0], [1], [2]]
+
+
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_output_order_across_batches(max_workers):
+    inputs = entries(23)
+    client = ScriptedClient()
+    vectors = embed_inputs(client, inputs, "embed-v4.0", max_inputs=5, max_workers=max_workers)
+    assert len(client.batches) == 5
+    np.testing.assert_allclose(vectors, [expected(e) for e in inputs], rtol=1e-6)
+
+
+def test_all_embedding_types_keep_order():
+    inputs = entries(7)
+    out = embed_inputs_by_type(FakeEmbedClient(), inputs, "embed-v4.0", embedding_types=("float", "int8"), max_inputs=3)
+    assert set(out) == {"float", "int8"}
+    np.testing.assert_allclose(out["float"], [expected(e) for e in inputs], rtol=1e-6)
+    assert len(out["int8"]) == 7
+
+
+@pytest.mark.parametrize("status", [429, 500, 503])
+def test_retryable_errors_are_retried(status):
+    client = ScriptedClient(failures=[status, status])
+    vectors = embed_inputs(client, entries(3), "embed-v4.0", max_workers=1)
+    assert len(client.batches) == 3
+    assert len(vectors) == 3 and all(v is not None for v in vectors)
+
+
+def test_backoff_grows_exponentially_without_retry_after():
+    class NoHeader(ScriptedClient):
+        def embed(self, **kwargs):
+            try:
+                return super().embed(**kwargs)
+            except FakeApiError as exc:
+                exc.headers = {}
+                raise
+
+    delays = []
+    client = NoHeader(failures=[503, 503, 503])
+    embed_with_retry(client, entries(1), "embed-v4.0", base_delay=1.0, max_delay=30.0, sleep=delays.append)
+    assert len(delays) == 3
+    # jitter keeps each delay in [0.5, 1] x base * 2**attempt
+    for attempt, delay in enumerate(delays):
+        assert 0.5 * 2**attempt <= delay <= 2**attempt
+
+
+def test_retry_after_header_is_honored():
+    delays = []
+    embed_with_retry(ScriptedClient(failures=[429]), entries(1), "embed-v4.0", sleep=delays.append)
+    assert delays == [0.0]
+
+
+@pytest.mark.parametrize("retry_after, delay", [("86400", 30.0), ("-5", 0.0)])
+def test_retry_after_is_capped_at_max_delay(retry_after, delay):
+    class LongRetryAfter(ScriptedClient):
+        def embed(self, **kwargs):
+            try:
+                return super().embed(**kwargs)
+            except FakeApiError as exc:
+                exc.headers = {"retry-after": retry_after}
+                raise
+
+    delays = []
+    embed_with_retry(LongRetryAfter(failures=[429]), entries(1), "embed-v4.0", max_delay=30.0, sleep=delays.append)
+    assert delays == [delay]
+
+
+def test_gives_up_after_max_retries():
+    client = ScriptedClient(failures=[429] * 10)
+    with pytest.raises(FakeApiError) as err:
+        embed_with_retry(client, entries(1), "embed-v4.0", max_retries=2, sleep=lambda _: None)
+    assert err.value.status_code == 429
+    assert len(client.batches) == 3
+
+
+def test_client_errors_are_not_retried():
+    client = ScriptedClient(failures=[400])
+    with pytest.raises(FakeApiError):
+        embed_with_retry(client, entries(1), "embed-v4.0", sleep=lambda _: None)
+    assert len(client.batches) == 1
+
+
+def failing_page(page):
+    return lambda items: any(e["content"][0]["text"].startswith(f"page {page} ") for e in items)
+
+
+def test_partial_failure_raises_after_the_other_batches_ran():
+    # the last batch fails for good; the batches before it were sent and succeeded
+    client = ScriptedClient(fail_when=failing_page(9))
+    with pytest.raises(FakeApiError):
+        embed_inputs(client, entries(12), "embed-v4.0", max_inputs=4, max_workers=3)
+    assert len(client.batches) == 3
+    assert client.calls == 2
+
+
+def test_partial_failure_stops_sequential_batches():
+    client = ScriptedClient(fail_when=failing_page(5))
+    with pytest.raises(FakeApiError):
+        embed_inputs(client, entries(12), "embed-v4.0", max_inputs=4, max_workers=1)
+    # no partial result is returned and the batch after the failed one is never sent
+    assert len(client.batches) == 2
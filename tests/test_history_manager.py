@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import threading
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from history_manager import TRUNCATED_SUFFIX, HistoryManager, extractive_summarizer
+from token_counting import message_tokens
+
+
+def tool_turn(history, question, output):
+    history.append(HumanMessage(question))
+    history.append(AIMessage("", tool_calls=[{"id": "c1", "name": "search", "args": {"queries": [question]}}]))
+    history.append(ToolMessage(output, tool_call_id="c1"))
+
+
+def test_a_tool_output_larger_than_the_budget_is_truncated_to_fit(caplog):
+    history = HistoryManager(token_budget=300, summarizer=extractive_summarizer(max_tokens=50))
+    history.append(HumanMessage("Hallo"))
+    history.append(AIMessage("Hallo, wie kann ich helfen?"))
+    tool_turn(history, "Wie warte ich die Pumpe?", "Filter reinigen und Dichtungen prüfen. " * 400)
+
+    with caplog.at_level(logging.WARNING, logger="history_manager"):
+        context = history.context()
+
+    assert sum(message_tokens(m) for m in context) <= 300
+    tool = context[-1]
+    assert tool.content.startswith("Filter reinigen") and tool.content.endswith(TRUNCATED_SUFFIX)
+    assert "Truncated 1 tool outputs" in caplog.text
+    # the truncated copy is kept, so the follow-up request of the turn starts the same way
+    history.append(AIMessage("Filter alle 500 Stunden reinigen."))
+    assert history.context()[: len(context)] == context
+
+
+def test_small_tool_outputs_of_the_latest_turn_are_kept_whole():
+    history = HistoryManager(token_budget=400, summarizer=extractive_summarizer(max_tokens=50))
+    history.append(HumanMessage("Wie warte ich die Pumpe?"))
+    calls = [{"id": f"c{i}", "name": "search", "args": {"queries": ["pumpe"]}} for i in range(2)]
+    history.append(AIMessage("", tool_calls=calls))
+    history.append(ToolMessage("Seite 4: Wartung", tool_call_id="c0"))
+    history.append(ToolMessage("Wartungsplan. " * 500, tool_call_id="c1"))
+
+    small, large = history.context()[-2:]
+    assert small.content == "Seite 4: Wartung"
+    assert large.content.endswith(TRUNCATED_SUFFIX)
+
+
+def test_acontext_summarizes_off_the_event_loop():
+    threads = []
+
+    def slow_summarizer(previous, messages):
+        threads.append(threading.current_thread())
+        time.sleep(0.2)
+        return "earlier turns"
+
+    history = HistoryManager(token_budget=200, summarizer=slow_summarizer)
+    for i in range(10):
+        history.append(HumanMessage(f"Frage {i}: " + "wie funktioniert die Pumpe " * 5))
+        history.append(AIMessage(f"Antwort {i}: " + "die Pumpe funktioniert so " * 5))
+
+    async def turn():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.ensure_future(tick())
+        context = await history.acontext()
+        ticker.cancel()
+        return context, ticks
+
+    context, ticks = asyncio.run(turn())
+    assert threads and threads[0] is not threading.main_thread()
+    assert ticks >= 5
+    assert context[0].content.endswith("earlier turns")
@@ -0,0 +1,166 @@
+import os
+import uuid
+
+import pytest
+
+import ingest
+from fake_embed import FakeEmbedClient
+from page_ids import document_id, page_id, pdf_sources
+
+
+def pages(name, n, edition=""):
+    return [{"content": [{"type": "text", "text": f"{name} {edition}page {i} word{i}"}]} for i in range(n)]
+
+
+def collection():
+    return ingest.open_collection(f"test_{uuid.uuid4().hex[:8]}")[1]
+
+
+def store(client, coll, key, entries, sync=True):
+    _, ids = ingest.embed_pages_and_store(
+        client, iter(entries), "embed-v4.0", collection=coll, source=key, total_pages=len(entries), sync=sync
+    )
+    return ids
+
+
+def test_pdf_sources_key_nested_files_by_folder(tmp_path):
+    for rel in ("manuals/a/manual.pdf", "manuals/b/manual.pdf", "manuals/top.pdf"):
+        os.makedirs(tmp_path / os.path.dirname(rel), exist_ok=True)
+        (tmp_path / rel).write_bytes(b"%PDF")
+    manuals = tmp_path / "manuals"
+
+    keys = sorted(pdf_sources([str(manuals / "**" / "*.pdf")]).values())
+    assert keys == ["a/manual.pdf", "b/manual.pdf", "top.pdf"]
+    # files named directly or found in an ingested directory keep their file-name ids
+    assert list(pdf_sources([str(manuals)]).values()) == ["top.pdf"]
+    assert list(pdf_sources([str(manuals / "a" / "manual.pdf")]).values()) == ["manual.pdf"]
+
+    with pytest.raises(ValueError):
+        pdf_sources([str(manuals / "a" / "manual.pdf"), str(manuals / "b" / "manual.pdf")])
+
+
+def test_same_file_name_in_two_folders_does_not_collide():
+    client, coll = FakeEmbedClient(), collection()
+    a = store(client, coll, "a/manual.pdf", pages("a", 3))
+    b = store(client, coll, "b/manual.pdf", pages("b", 2))
+    assert not set(a) & set(b)
+    assert coll.count() == 5
+    assert {m["source"] for m in coll.get(ids=b, include=["metadatas"])["metadatas"]} == {"b/manual.pdf"}
+
+
+def test_sync_deletes_only_stale_pages_of_the_same_document():
+    client, coll = FakeEmbedClient(), collection()
+    store(client, coll, "a/manual.pdf", pages("a", 3))
+    b = store(client, coll, "b/manual.pdf", pages("b", 2))
+    inputs = client.inputs
+
+    # a's new edition dropped its last page and changed its second one
+    edition = pages("a", 2)
+    edition[1] = pages("a", 2, "revised ")[1]
+    a = store(client, coll, "a/manual.pdf", edition)
+
+    stored = set(coll.get()["ids"])
+    assert page_id(document_id("a/manual.pdf"), 2) not in stored
+    assert set(a) | set(b) == stored
+    # both of a's pages are re-embedded (its page_count changed), none of b's
+    assert client.inputs - inputs == 2
+    assert coll.get(ids=b)["ids"] == b
+
+
+def test_sync_skips_unchanged_pages():
+    client, coll = FakeEmbedClient(), collection()
+    store(client, coll, "manual.pdf", pages("m", 4))
+    calls = client.calls
+    store(client, coll, "manual.pdf", pages("m", 4))
+    assert client.calls == calls
+    assert coll.count() == 4
+
+
+def fake_renderer(rendered, fail_on=None):
+    def iter_rendered_documents(pool, pdf_paths, **kwargs):
+        for pdf_path in pdf_paths:
+            rendered.append(pdf_path)
+            if pdf_path == fail_on:
+                raise RuntimeError("interrupted")
+            yield pdf_path, 2, iter(pages(os.path.basename(pdf_path), 2))
+
+    return iter_rendered_documents
+
+
+def test_checkpoint_resumes_at_the_first_unfinished_pdf(tmp_path, monkeypatch):
+    pdfs = []
+    for name in ("one.pdf", "two.pdf", "three.pdf"):
+        (tmp_path / name).write_bytes(b"%PDF")
+        pdfs.append(str(tmp_path / name))
+    name = f"test_{uuid.uuid4().hex[:8]}"
+    checkpoint_path = str(tmp_path / "ingest.json")
+
+    rendered = []
+    monkeypatch.setattr(ingest, "iter_rendered_documents", fake_renderer(rendered, fail_on=pdfs[1]))
+    with pytest.raises(RuntimeError):
+        ingest.ingest_pdfs(FakeEmbedClient(), pdfs, "embed-v4.0", name, processes=1, checkpoint=ingest.IngestCheckpoint(checkpoint_path))
+    assert rendered == pdfs[:2]
+
+    rendered.clear()
+    monkeypatch.setattr(ingest, "iter_rendered_documents", fake_renderer(rendered))
+    coll, stored = ingest.ingest_pdfs(
+        FakeEmbedClient(), pdfs, "embed-v4.0", name, processes=1, checkpoint=ingest.IngestCheckpoint(checkpoint_path)
+    )
+    assert rendered == pdfs[1:]
+    assert stored == 4
+    assert coll.count() == 6
+
+    # a PDF whose size or mtime changed since it was recorded is ingested again
+    (tmp_path / "one.pdf").write_bytes(b"%PDF-1.7")
+    rendered.clear()
+    ingest.ingest_pdfs(FakeEmbedClient(), pdfs, "embed-v4.0", name, processes=1, checkpoint=ingest.IngestCheckpoint(checkpoint_path))
+    assert rendered == pdfs[:1]
+
+
+def test_sync_rewrites_pages_stored_with_another_model_or_without_requested_types():
+    client, coll = FakeEmbedClient(), collection()
+    entries = pages("m", 3)
+    ids = store(client, coll, "manual.pdf", entries)
+    calls = client.calls
+
+    ingest.embed_pages_and_store(
+        client, iter(entries), "embed-v4.1", collection=coll, source="manual.pdf", total_pages=3, sync=True
+    )
+    assert client.calls > calls
+    assert {m["model"] for m in coll.get(ids=ids, include=["metadatas"])["metadatas"]} == {"embed-v4.1"}
+
+    calls = client.calls
+    kwargs = dict(collection=coll, source="manual.pdf", total_pages=3, sync=True, embedding_types=("float", "int8"))
+    ingest.embed_pages_and_store(client, iter(entries), "embed-v4.1", **kwargs)
+    assert client.calls > calls
+    assert all("int8" in m for m in coll.get(ids=ids, include=["metadatas"])["metadatas"])
+
+    # up to date now, also for a run that no longer asks for int8
+    calls = client.calls
+    ingest.embed_pages_and_store(client, iter(entries), "embed-v4.1", **kwargs)
+    kwargs["embedding_types"] = ("float",)
+    ingest.embed_pages_and_store(client, iter(entries), "embed-v4.1", **kwargs)
+    assert client.calls == calls
+
+
+def test_sync_of_a_document_without_pages_deletes_its_old_pages():
+    client, coll = FakeEmbedClient(), collection()
+    store(client, coll, "a/manual.pdf", pages("a", 2))
+    b = store(client, coll, "b/manual.pdf", pages("b", 2))
+    assert store(client, coll, "a/manual.pdf", []) == []
+    assert sorted(coll.get()["ids"]) == sorted(b)
+
+
+def test_documents_without_pages_are_still_yielded_in_order(monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+
+    counts = {"empty-first.pdf": 0, "a.pdf": 3, "empty.pdf": 0, "b.pdf": 1, "empty-last.pdf": 0}
+    monkeypatch.setattr(ingest, "page_count", lambda pdf_path, poppler_path=None: counts[pdf_path])
+    monkeypatch.setattr(ingest, "render_pages", lambda pdf_path, first, last, *args: [b"page"] * (last - first + 1))
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        documents = [
+            (pdf_path, total, len(list(entries)))
+            for pdf_path, total, entries in ingest.iter_rendered_documents(pool, list(counts), chunk_size=2)
+        ]
+    assert documents == [(pdf_path, n, n) for pdf_path, n in counts.items()]
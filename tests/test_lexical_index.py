@@ -0,0 +1,47 @@
+import pytest
+
+from lexical_index import LexicalIndex, hybrid_search, lexical_index_path, write_shard
+
+PAGES = [
+    "Impressum: Muster GmbH, Hauptstrasse 1",
+    "Error E17 means the XR-2040 pump is blocked",
+    "Warranty terms and conditions for all devices",
+]
+
+
+@pytest.fixture
+def index(tmp_path):
+    write_shard(lexical_index_path(str(tmp_path), "manual.pdf"), "manual.pdf", PAGES)
+    return LexicalIndex(str(tmp_path))
+
+
+@pytest.mark.parametrize("query", ['"Muster GmbH"', "XR-2040", "E17 XR-2040"])
+def test_quoted_phrases_and_codes_are_answered_locally(index, query):
+    assert index.answers_locally(query)
+
+
+@pytest.mark.parametrize(
+    "query", ["impressum", "warranty terms", "reset XR-2040", '"Beispiel AG"', "XR-9999", '"GmbH Muster"', '"Muster Hauptstrasse"']
+)
+def test_keyword_queries_and_misses_are_not(index, query):
+    assert not index.answers_locally(query)
+
+
+def test_phrase_matches_need_the_words_next_to_each_other(index):
+    assert index.phrase_matches("muster gmbh") == index.exact_matches("muster gmbh") != []
+    assert index.phrase_matches("pump is blocked") != []
+    # every word is on the page, but not in this order or not adjacent
+    assert index.phrase_matches("blocked pump") == []
+    assert index.phrase_matches("E17 blocked") == []
+
+
+def test_hybrid_search_sends_keyword_queries_to_the_vector_side(index):
+    sent = []
+
+    def vector_search(queries):
+        sent.extend(queries)
+        return {"ids": [[] for _ in queries], "metadatas": [[] for _ in queries]}
+
+    results = hybrid_search(index, ["impressum", "XR-2040", '"Muster GmbH"'], vector_search, n_results=3)
+    assert sent == ["impressum"]
+    assert [ids[0].rpartition("-p")[2] for ids in results["ids"]] == ["0", "1", "0"]
@@ -0,0 +1,90 @@
+import os
+import subprocess
+
+import pytest
+
+import page_text
+from page_ids import document_id, page_id
+from page_text import PageTexts, extract_layout, page_text_path, parse_bbox_layout, parse_image_list, write_page_text
+
+# pdftotext -bbox-layout / pdfimages -list output of a four-page manual: a text page with a
+# large title, a figure page with a caption, a scanned page without a text layer and a
+# text page with a small inline image
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "poppler")
+A4_AREA = 595.276 * 841.89
+
+
+def fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def test_parse_bbox_layout_reads_text_headings_and_page_size():
+    pages = parse_bbox_layout(fixture("manual.bbox.xhtml"))
+    assert len(pages) == 4
+    assert all(area == pytest.approx(A4_AREA) for _, _, area in pages)
+
+    text, headings, _ = pages[0]
+    assert headings == ("Wartung der Pumpe XR-2040",)
+    assert text.split("\n\n")[1].splitlines() == [
+        "Vor der Wartung Pumpe vom Netz trennen & abkühlen lassen.",
+        "Filter alle 500 Betriebsstunden reinigen.",
+    ]
+    assert text.endswith("Fehlercode E17: Pumpe blockiert.")
+
+    # uniform type: a short first line standing alone in its block
+    assert pages[1][1] == ("Kapitel 3",)
+    assert pages[1][0] == "Kapitel 3\n\nAbbildung 3: Explosionszeichnung"
+    assert pages[2][:2] == ("", ())
+    assert pages[3][1] == ("Technische Daten",)
+
+
+def test_parse_image_list_sums_displayed_area_per_page():
+    areas = parse_image_list(fixture("manual.images.txt"))
+    assert set(areas) == {2, 3, 4}
+    # the soft mask of page 2's figure is not counted again
+    assert areas[2] == pytest.approx((1654 / 200 * 72) * (1240 / 200 * 72))
+    assert areas[3] == pytest.approx((2480 / 300 * 72) * (3508 / 300 * 72))
+    # inline images have no object number; their ppi columns are read from the right
+    assert areas[4] == pytest.approx(64 * 64)
+
+
+def test_parse_image_list_ignores_headers_and_garbage():
+    assert parse_image_list("") == {}
+    assert parse_image_list(fixture("manual.images.txt").splitlines()[0] + "\n---\nSyntax Warning: bad image\n") == {}
+
+
+@pytest.fixture
+def poppler(monkeypatch):
+    calls = []
+
+    def run(command, check, capture_output):
+        calls.append(command)
+        name = "manual.bbox.xhtml" if os.path.basename(command[0]) == "pdftotext" else "manual.images.txt"
+        return subprocess.CompletedProcess(command, 0, stdout=fixture(name).encode("utf-8"), stderr=b"")
+
+    monkeypatch.setattr(page_text.subprocess, "run", run)
+    return calls
+
+
+def test_extract_layout_marks_figure_and_scanned_pages(poppler):
+    layouts = extract_layout("manual.pdf", poppler_path="/opt/poppler/bin")
+    assert [layout.figure_heavy for layout in layouts] == [False, True, True, False]
+    assert layouts[0].image_fraction == 0.0
+    assert layouts[1].image_fraction == pytest.approx((1654 / 200 * 72) * (1240 / 200 * 72) / A4_AREA)
+    assert layouts[2].image_fraction == pytest.approx(1.0, abs=1e-3)
+    assert layouts[3].image_fraction < 0.01
+    assert [c[0] for c in poppler] == ["/opt/poppler/bin/pdftotext", "/opt/poppler/bin/pdfimages"]
+
+
+def test_page_text_file_round_trip(poppler, tmp_path):
+    layouts = extract_layout("manual.pdf")
+    write_page_text(page_text_path(str(tmp_path), "manual.pdf"), "manual.pdf", layouts)
+    texts = PageTexts(str(tmp_path))
+    doc_id = document_id("manual.pdf")
+    for p, layout in enumerate(layouts):
+        stored = texts.get(page_id(doc_id, p))
+        assert (stored.text, stored.headings, stored.figure_heavy) == (layout.text, layout.headings, layout.figure_heavy)
+        assert stored.image_fraction == pytest.approx(layout.image_fraction, rel=1e-6)
+    assert texts.get(page_id(doc_id, 4)) is None
+    assert texts.get(page_id("unknown", 0)) is None
@@ -0,0 +1,74 @@
+from types import SimpleNamespace
+
+from reranking import ApiRerankScorer, Reranker
+
+TEXTS = {
+    "d-p0": "Impressum Muster GmbH",
+    "d-p1": "Pumpe warten: Filter reinigen",
+    "d-p2": "Garantie zwei Jahre",
+    "d-p3": None,
+}
+
+
+class FakeRerankClient:
+    """``ClientV2.rerank`` stand-in: relevance is the share of query words in the document."""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = []
+
+    def rerank(self, model, query, documents, max_tokens_per_doc):
+        self.calls.append({"model": model, "query": query, "documents": list(documents), "max_tokens_per_doc": max_tokens_per_doc})
+        if self.fail:
+            raise RuntimeError("rerank unavailable")
+        words = query.casefold().split()
+        scored = [(sum(w in doc.casefold() for w in words) / len(words), i) for i, doc in enumerate(documents)]
+        # like the API: results sorted by relevance, pointing back at the documents by index
+        results = [SimpleNamespace(index=i, relevance_score=score) for score, i in sorted(scored, reverse=True)]
+        return SimpleNamespace(results=results)
+
+
+def candidates(*ids):
+    return [{"id": pid, "metadata": {}} for pid in ids]
+
+
+def test_scores_map_back_to_candidates_and_pages_without_text_are_not_sent():
+    client = FakeRerankClient()
+    scorer = ApiRerankScorer(client, TEXTS.get, model="rerank-v3.5", max_tokens_per_doc=256)
+    scores = scorer.score("pumpe filter", candidates("d-p0", "d-p1", "d-p3", "d-p2"))
+
+    assert scores == [0.0, 1.0, float("-inf"), 0.0]
+    [call] = client.calls
+    assert call["documents"] == [TEXTS["d-p0"], TEXTS["d-p1"], TEXTS["d-p2"]]
+    assert call["model"] == "rerank-v3.5" and call["max_tokens_per_doc"] == 256
+
+
+def test_cached_query_page_scores_are_not_sent_again():
+    client = FakeRerankClient()
+    scorer = ApiRerankScorer(client, TEXTS.get)
+    scorer.score("Garantie", candidates("d-p0", "d-p2"))
+    # same query up to case and spacing; only the new page goes out
+    scores = scorer.score(" garantie ", candidates("d-p2", "d-p1"))
+
+    assert scores == [1.0, 0.0]
+    assert [c["documents"] for c in client.calls] == [[TEXTS["d-p0"], TEXTS["d-p2"]], [TEXTS["d-p1"]]]
+    assert (scorer.api_calls, scorer.hits, scorer.misses) == (2, 1, 3)
+
+
+def test_lru_keeps_at_most_max_entries():
+    scorer = ApiRerankScorer(FakeRerankClient(), TEXTS.get, max_entries=2)
+    scorer.score("pumpe", candidates("d-p0", "d-p1", "d-p2"))
+    assert len(scorer._cache) == 2
+
+
+def test_reranker_orders_candidates_by_api_scores():
+    reranker = Reranker(ApiRerankScorer(FakeRerankClient(), TEXTS.get), radius=0)
+    results = {"ids": [["d-p0", "d-p2", "d-p1"]], "metadatas": [[{}, {}, {}]]}
+    out = reranker.rerank(["pumpe filter"], results, top_k=2)
+    assert out["ids"] == [["d-p1", "d-p0"]]
+
+
+def test_reranker_keeps_first_stage_order_when_the_api_fails():
+    reranker = Reranker(ApiRerankScorer(FakeRerankClient(fail=True), TEXTS.get), radius=0)
+    results = {"ids": [["d-p0", "d-p2", "d-p1"]], "metadatas": [[{}, {}, {}]]}
+    assert reranker.rerank(["pumpe filter"], results, top_k=2)["ids"] == [["d-p0", "d-p2"]]
@@ -0,0 +1,51 @@
+import asyncio
+import json
+
+import pytest
+
+from fake_embed import FakeEmbedClient
+from retrieval_server import RetrievalServer
+
+
+class Collection:
+    def __init__(self):
+        self.n_results = []
+
+    def count(self):
+        return 3
+
+    def query(self, query_embeddings, n_results):
+        self.n_results.append(n_results)
+        ids = [f"doc-p{i}" for i in range(min(n_results, 3))]
+        return {"ids": [ids for _ in query_embeddings], "distances": [[0.0] * len(ids) for _ in query_embeddings]}
+
+
+def post(server, body):
+    status, _, payload = asyncio.run(server._route("POST", "/query", json.dumps(body).encode("utf-8")))
+    return status, json.loads(payload)
+
+
+@pytest.fixture
+def server():
+    return RetrievalServer(FakeEmbedClient(), Collection(), top_k=2, max_top_k=10)
+
+
+@pytest.mark.parametrize("top_k", [0, -1, 11, 10**9, "5", 2.5, True])
+def test_top_k_outside_the_allowed_range_is_rejected(server, top_k):
+    status, payload = post(server, {"queries": ["impressum"], "top_k": top_k})
+    assert status == 400
+    assert "top_k" in payload["error"]
+    assert server.collection.n_results == []
+
+
+@pytest.mark.parametrize("top_k, hits", [(None, 2), (1, 1), (10, 3)])
+def test_valid_top_k_is_served(server, top_k, hits):
+    body = {"queries": ["impressum"]} if top_k is None else {"queries": ["impressum"], "top_k": top_k}
+    status, payload = post(server, body)
+    assert status == 200
+    assert len(payload["results"]["impressum"]) == hits
+
+
+def test_default_top_k_must_fit_the_maximum():
+    with pytest.raises(ValueError):
+        RetrievalServer(FakeEmbedClient(), Collection(), top_k=20, max_top_k=10)
@@ -0,0 +1,127 @@
+import asyncio
+import threading
+import time
+
+from retrieval_service import RetrievalService
+
+
+class ScriptedEmbedder:
+    """Stands in for ``QueryEmbedder``: the "vector" of a query is the query itself."""
+
+    def __init__(self):
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def embed(self, queries):
+        with self._lock:
+            self.batches.append(list(queries))
+        return [[query] for query in queries]
+
+
+class ScriptedCollection:
+    """``collection.query`` returning scripted page ids per query, after a per-query delay."""
+
+    def __init__(self, hits, delays=None):
+        self.hits = hits
+        self.delays = delays or {}
+        self.queried = []
+
+    def query(self, query_embeddings, n_results):
+        [[query]] = query_embeddings
+        self.queried.append(query)
+        time.sleep(self.delays.get(query, 0.0))
+        ids = self.hits.get(query, [])[:n_results]
+        return {
+            "ids": [ids],
+            "distances": [[float(rank) for rank in range(len(ids))]],
+            "metadatas": [[{"page": int(pid[1:])} for pid in ids]],
+        }
+
+
+def service(hits, delays=None, **kwargs):
+    embedder = ScriptedEmbedder()
+    return RetrievalService(None, ScriptedCollection(hits, delays), embedder=embedder, **kwargs), embedder
+
+
+def ids(results):
+    return {query: None if hits is None else [h["id"] for h in hits] for query, hits in results.items()}
+
+
+HITS = {
+    "topic 1": ["p1", "p2", "p3"],
+    "topic 2": ["p2", "p1", "p4"],
+    "topic 5": ["p5", "p7", "p8"],
+    "topic 7": ["p7", "p5", "p9"],
+}
+
+
+def test_pages_go_to_the_query_that_ranks_them_best_whatever_finishes_first():
+    expected = {
+        "topic 1": ["p1", "p3"],
+        "topic 2": ["p2", "p4"],
+        "topic 5": ["p5", "p8"],
+        "topic 7": ["p7", "p9"],
+    }
+    for delays in ({}, {"topic 1": 0.05, "topic 5": 0.05}, {"topic 2": 0.05, "topic 7": 0.05}):
+        svc, _ = service(HITS, delays)
+        assert ids(asyncio.run(svc.search(list(HITS)))) == expected
+
+
+def test_rank_ties_go_to_the_earlier_query():
+    svc, _ = service({"a": ["p1", "p2"], "b": ["p1", "p3"]}, {"a": 0.05})
+    assert ids(asyncio.run(svc.search(["a", "b"]))) == {"a": ["p1", "p2"], "b": ["p3"]}
+
+
+def test_later_calls_share_one_embed_batch_and_skip_returned_pages():
+    async def turn(svc):
+        plan = svc.plan(["topic 1"])
+        first = await plan.results(["topic 1"])
+        second = await plan.results(["topic 2", "topic 5"])
+        return first, second
+
+    svc, embedder = service(HITS)
+    first, second = asyncio.run(turn(svc))
+    assert embedder.batches == [["topic 1"], ["topic 2", "topic 5"]]
+    assert ids(first) == {"topic 1": ["p1", "p2", "p3"]}
+    assert ids(second) == {"topic 2": ["p4"], "topic 5": ["p5", "p7", "p8"]}
+
+
+def test_open_plan_assigns_pages_after_it_is_sealed():
+    async def turn(svc):
+        plan = svc.plan(["topic 1"], sealed=False)
+        first = asyncio.ensure_future(plan.results(["topic 1"]))
+        await asyncio.sleep(0.05)
+        assert not first.done()
+        plan.add(["topic 2"])
+        second = asyncio.ensure_future(plan.results(["topic 2"]))
+        plan.seal()
+        return await first, await second
+
+    svc, _ = service(HITS, {"topic 2": 0.02})
+    first, second = asyncio.run(turn(svc))
+    assert ids(first) == {"topic 1": ["p1", "p3"]}
+    assert ids(second) == {"topic 2": ["p2", "p4"]}
+
+
+def test_queries_past_the_deadline_time_out():
+    async def turn(svc):
+        started = time.monotonic()
+        results = await svc.search(["topic 1", "topic 2"])
+        return results, time.monotonic() - started
+
+    svc, _ = service(HITS, {"topic 2": 0.5}, turn_budget=0.1)
+    results, elapsed = asyncio.run(turn(svc))
+    assert elapsed < 0.4
+    assert ids(results) == {"topic 1": ["p1", "p2", "p3"], "topic 2": None}
+
+
+def test_searches_past_the_deadline_are_cancelled():
+    async def turn(svc):
+        results = await svc.search(["topic 1", "topic 2", "topic 5"])
+        # the slow query's thread finishes meanwhile; the query queued behind it must not start
+        await asyncio.sleep(0.4)
+        return results
+
+    svc, _ = service(HITS, {"topic 2": 0.3}, turn_budget=0.1, max_concurrency=1)
+    assert ids(asyncio.run(turn(svc))) == {"topic 1": ["p1", "p2", "p3"], "topic 2": None, "topic 5": None}
+    assert svc.collection.queried == ["topic 1", "topic 2"]
@@ -0,0 +1,68 @@
+"""
+token_counting.py
+
+Token counts for prompt budgeting and reports.
+
+Uses tiktoken's ``o200k_base`` encoding (the gpt-4.1 tokenizer) when it is available
+locally; tiktoken downloads encodings on first use, so offline this falls back to an
+estimate of four characters per token. Messages may be LangChain messages or the
+``{"role", "content"}`` dicts kept by ``chat.py``.
+"""
+import json
+import threading
+from typing import Any, Optional
+
+ENCODING_NAME = "o200k_base"
+# fixed per-message framing (role, separators) in the chat format
+MESSAGE_OVERHEAD = 4
+# a page image at the default detail level
+IMAGE_TOKENS = 765
+
+_encoding: Any = None
+_encoding_loaded = False
+_lock = threading.Lock()
+
+
+def _get_encoding() -> Optional[Any]:
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        with _lock:
+            if not _encoding_loaded:
+                try:
+                    import tiktoken
+
+                    _encoding = tiktoken.get_encoding(ENCODING_NAME)
+                except Exception:
+                    _encoding = None
+                _encoding_loaded = True
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def message_tokens(message: Any) -> int:
+    """Prompt tokens of one message: content, tool calls and framing."""
+    if isinstance(message, dict):
+        content, tool_calls = message.get("content", ""), message.get("tool_calls") or []
+    else:
+        content, tool_calls = message.content, getattr(message, "tool_calls", None) or []
+
+    tokens = MESSAGE_OVERHEAD
+    if isinstance(content, str):
+        tokens += count_tokens(content)
+    else:
+        for part in content:
+            if isinstance(part, str):
+                tokens += count_tokens(part)
+            elif part.get("type") == "text":
+                tokens += count_tokens(part.get("text", ""))
+            else:
+                tokens += IMAGE_TOKENS
+    for tool_call in tool_calls:
+        tokens += count_tokens(tool_call.get("name", "")) + count_tokens(json.dumps(tool_call.get("args", {})))
+    return tokens
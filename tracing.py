@@ -0,0 +1,230 @@
+"""
+tracing.py
+
+Lightweight spans for the chat turn pipeline.
+
+``span(name, **attributes)`` times a block and records it under the current trace; the
+parent is tracked in a ``contextvars`` variable, so spans opened inside asyncio tasks or
+``asyncio.to_thread`` calls started within a turn nest under that turn. Finished spans
+go to a sink:
+
+- ``JsonlSink`` appends one JSON object per span, with OpenTelemetry field names
+  (``traceId``, ``spanId``, ``parentSpanId``, ``startTimeUnixNano``, ...),
+- ``OTelSink`` re-emits spans through the ``opentelemetry`` SDK, if it is installed,
+- no sink (the default) makes ``span`` a near no-op.
+
+Spans that stay open across ``yield``s of an async generator should use ``start_span`` /
+``Span.end`` and pass themselves as ``parent`` to inner spans, because a context
+variable set inside a generator does not survive being resumed from another context.
+
+Set ``TRACE_PATH=traces.jsonl`` (or call ``set_sink``) to turn it on, then summarize:
+  python tracing.py traces.jsonl
+  python tracing.py traces.jsonl --name company_assistant --json
+"""
+import argparse
+import contextvars
+import json
+import os
+import secrets
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+
+class Span:
+    __slots__ = ("sink", "name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes")
+
+    def __init__(self, sink: Any, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.sink = sink
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+
+    def set(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def elapsed_ms(self) -> float:
+        """Milliseconds since the span started; use it to stamp milestones like time to first token."""
+        return (time.time_ns() - self.start_ns) / 1e6
+
+    def mark(self, key: str) -> None:
+        """Record ``elapsed_ms()`` under ``key`` the first time it is called."""
+        self.attributes.setdefault(key, round(self.elapsed_ms(), 3))
+
+    def end(self) -> None:
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            self.sink.export(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "durationMs": (self.end_ns - self.start_ns) / 1e6 if self.end_ns else None,
+            "attributes": self.attributes,
+        }
+
+
+class _NoopSpan:
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+    def elapsed_ms(self) -> float:
+        return 0.0
+
+    def mark(self, key: str) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+
+class JsonlSink:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", buffering=1)
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class OTelSink:
+    """Forwards spans to the globally configured OpenTelemetry tracer provider."""
+
+    def __init__(self, instrumentation_name: str = "company_assistant"):
+        from opentelemetry import trace
+
+        self._tracer = trace.get_tracer(instrumentation_name)
+
+    def export(self, span: Span) -> None:
+        # the SDK assigns its own ids; keep ours as attributes so both views can be joined
+        attributes = {k: v for k, v in span.attributes.items() if isinstance(v, (str, bool, int, float))}
+        attributes.update({"trace.id": span.trace_id, "span.id": span.span_id, "span.parent_id": span.parent_id or ""})
+        otel_span = self._tracer.start_span(span.name, start_time=span.start_ns, attributes=attributes)
+        otel_span.end(end_time=span.end_ns)
+
+
+_SINK: Any = JsonlSink(os.environ["TRACE_PATH"]) if os.environ.get("TRACE_PATH") else None
+_CURRENT: "contextvars.ContextVar[Optional[Span]]" = contextvars.ContextVar("current_span", default=None)
+_NOOP = _NoopSpan()
+
+
+def set_sink(sink: Any) -> None:
+    """Install a sink (anything with ``export(span)``); ``None`` turns tracing off."""
+    global _SINK
+    _SINK = sink
+
+
+def start_span(name: str, parent: Any = None, **attributes: Any) -> Any:
+    """Open a span (call ``.end()`` on it); a child of ``parent``, else of the current span, else a new trace."""
+    sink = _SINK
+    if sink is None:
+        return _NOOP
+    if not isinstance(parent, Span):
+        parent = _CURRENT.get()
+    if parent is None:
+        return Span(sink, name, secrets.token_hex(16), None, attributes)
+    return Span(sink, name, parent.trace_id, parent.span_id, attributes)
+
+
+@contextmanager
+def span(name: str, parent: Any = None, **attributes: Any) -> Iterator[Any]:
+    """Time the enclosed block as a span; spans opened inside it become its children."""
+    current = start_span(name, parent, **attributes)
+    if current is _NOOP:
+        yield current
+        return
+    token = _CURRENT.set(current)
+    try:
+        yield current
+    except BaseException as exc:
+        current.set("error", type(exc).__name__)
+        raise
+    finally:
+        _CURRENT.reset(token)
+        current.end()
+
+
+@contextmanager
+def use_span(current: Any) -> Iterator[None]:
+    """Make ``current`` the current span inside the block without ending it.
+
+    Tasks created in the block (``asyncio.ensure_future`` copies the context) open their
+    spans under ``current``; for code running where no span is current, e.g. an async
+    generator's loop, that would otherwise start a trace of its own.
+    """
+    if not isinstance(current, Span):
+        yield
+        return
+    token = _CURRENT.set(current)
+    try:
+        yield
+    finally:
+        _CURRENT.reset(token)
+
+
+def load_spans(path: str) -> List[Dict[str, Any]]:
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize(spans: List[Dict[str, Any]]) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """p50/p95/p99 of each span's duration and of its numeric ``*_ms``/``*tokens`` attributes, per span name."""
+    samples: Dict[str, Dict[str, List[float]]] = defaultdict(lambda: defaultdict(list))
+    for s in spans:
+        if s.get("durationMs") is not None:
+            samples[s["name"]]["duration_ms"].append(s["durationMs"])
+        for key, value in (s.get("attributes") or {}).items():
+            if (key.endswith("_ms") or key.endswith("tokens")) and isinstance(value, (int, float)):
+                samples[s["name"]][key].append(value)
+
+    report: Dict[str, Dict[str, Dict[str, float]]] = {}
+    for name, metrics in sorted(samples.items()):
+        report[name] = {}
+        for metric, values in sorted(metrics.items()):
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            report[name][metric] = {"count": len(values), "p50": float(p50), "p95": float(p95), "p99": float(p99)}
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Latency percentiles from a JSONL span file.")
+    parser.add_argument("path", help="JSONL file written by JsonlSink (TRACE_PATH)")
+    parser.add_argument("--name", default=None, help="Only spans with this name")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    spans = [s for s in load_spans(args.path) if args.name is None or s["name"] == args.name]
+    report = summarize(spans)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    for name, metrics in report.items():
+        print(name)
+        for metric, stats in metrics.items():
+            print(
+                f"  {metric:<28} n={stats['count']:<6} p50={stats['p50']:>10.1f}"
+                f"  p95={stats['p95']:>10.1f}  p99={stats['p99']:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
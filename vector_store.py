@@ -0,0 +1,318 @@
+"""
+vector_store.py
+
+In-process vector index for page-scale corpora.
+
+``NumpyVectorStore`` keeps every embedding as one contiguous, L2-normalized float32
+matrix (optionally memory-mapped from disk) and answers a batch of queries with a
+single matrix multiply plus ``argpartition`` for the top k. For large corpora an
+IVF (inverted file) index can be built: vectors are clustered with spherical
+k-means and reordered so every cluster is a contiguous slice of the matrix, and a
+query only scores the ``n_probe`` closest clusters.
+
+Quantized copies of the matrix -- ``int8`` (4x smaller) or packed sign bits
+``ubinary`` (32x smaller) -- allow a cheap first pass (int8 dot products or Hamming
+distance) whose top ``rescore_multiplier * k`` candidates are then rescored with the
+float vectors. Saved float matrices are memory-mapped, so only those candidate rows
+are paged in. Quantized vectors come from the embed API when ingest requested them
+(stored base64-packed in the page metadata) and are otherwise derived from the floats.
+
+It answers ``query(query_embeddings=..., n_results=...)`` with the same result shape
+as a Chroma collection (``ids``/``distances``/``metadatas``, one list per query), so
+it can be passed to ``query_collection`` wherever a Chroma collection is accepted.
+
+Build an index from an existing Chroma collection:
+  python vector_store.py --persist_dir ./chroma_db --collection pdf_pages --out ./vector_index/pdf_pages --ivf_lists 64
+  python vector_store.py --collection pdf_pages --quantization ubinary
+"""
+import argparse
+import base64
+import json
+import os
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+def normalize(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indexes of the ``k`` highest scores per row, best first."""
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1)
+    return np.take_along_axis(part, order, axis=1)
+
+
+QUANTIZATIONS = ("int8", "ubinary")
+
+
+def quantize_int8(matrix: np.ndarray) -> "tuple[np.ndarray, np.ndarray]":
+    """Per-dimension symmetric int8 quantization; returns ``(codes, scale)``."""
+    scale = np.maximum(np.abs(matrix).max(axis=0), 1e-12) / 127.0
+    codes = np.clip(np.rint(matrix / scale), -127, 127).astype(np.int8)
+    return codes, scale.astype(np.float32)
+
+
+def quantize_ubinary(matrix: np.ndarray) -> np.ndarray:
+    """Sign bits packed 8 dimensions per byte, first dimension in the most significant bit."""
+    return np.packbits(np.asarray(matrix) > 0, axis=-1)
+
+
+def pack_quantized(kind: str, vector: Sequence[int]) -> str:
+    """Compact base64 form of an API ``int8``/``ubinary`` vector, for page metadata."""
+    dtype = np.int8 if kind == "int8" else np.uint8
+    return base64.b64encode(np.asarray(vector, dtype=dtype).tobytes()).decode("ascii")
+
+
+def unpack_quantized(kind: str, value: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(value), dtype=np.int8 if kind == "int8" else np.uint8)
+
+
+class NumpyVectorStore:
+    def __init__(
+        self,
+        ids: Sequence[str],
+        embeddings: np.ndarray,
+        metadatas: Optional[Sequence[Optional[Dict[str, Any]]]] = None,
+        normalized: bool = False,
+    ):
+        self.ids = list(ids)
+        self.embeddings = embeddings if normalized else normalize(embeddings)
+        self.metadatas = list(metadatas) if metadatas is not None else [None] * len(self.ids)
+        self.centroids: Optional[np.ndarray] = None
+        # rows list_offsets[c]:list_offsets[c + 1] of the matrix belong to IVF list c
+        self.list_offsets: Optional[np.ndarray] = None
+        # lists scored per query by default once an IVF index exists; None means exact search
+        self.n_probe: Optional[int] = None
+        self.int8: Optional[np.ndarray] = None
+        # per-dimension scale of locally quantized int8 codes; None for API-provided codes
+        self.int8_scale: Optional[np.ndarray] = None
+        self.ubinary: Optional[np.ndarray] = None
+        # first-pass mode used by query() by default ("int8", "ubinary" or None for float)
+        self.quantization: Optional[str] = None
+        self.rescore_multiplier = 10
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def from_chroma(cls, collection: Any) -> "NumpyVectorStore":
+        """Load a Chroma collection, picking up API-quantized vectors stored in the metadata."""
+        data = collection.get(include=["embeddings", "metadatas"])
+        metadatas = [dict(m or {}) for m in data["metadatas"]]
+        packed = {kind: [m.pop(kind, None) for m in metadatas] for kind in QUANTIZATIONS}
+        store = cls(data["ids"], np.asarray(data["embeddings"], dtype=np.float32), metadatas)
+        if packed["int8"] and all(packed["int8"]):
+            store.int8 = np.stack([unpack_quantized("int8", v) for v in packed["int8"]])
+        if packed["ubinary"] and all(packed["ubinary"]):
+            store.ubinary = np.stack([unpack_quantized("ubinary", v) for v in packed["ubinary"]])
+        return store
+
+    def quantize(self, kinds: Sequence[str] = QUANTIZATIONS) -> None:
+        """Derive missing int8/ubinary matrices from the float vectors."""
+        if "int8" in kinds and self.int8 is None:
+            self.int8, self.int8_scale = quantize_int8(np.asarray(self.embeddings))
+        if "ubinary" in kinds and self.ubinary is None:
+            self.ubinary = quantize_ubinary(self.embeddings)
+
+    def index_bytes(self) -> Dict[str, int]:
+        sizes = {"float32": int(self.embeddings.nbytes)}
+        if self.int8 is not None:
+            sizes["int8"] = int(self.int8.nbytes)
+        if self.ubinary is not None:
+            sizes["ubinary"] = int(self.ubinary.nbytes)
+        return sizes
+
+    def build_ivf(self, n_lists: int, n_iter: int = 20, seed: int = 0) -> None:
+        """Cluster the vectors into ``n_lists`` inverted lists with spherical k-means."""
+        n_lists = max(1, min(n_lists, self.count()))
+        rng = np.random.default_rng(seed)
+        centroids = self.embeddings[rng.choice(self.count(), n_lists, replace=False)].copy()
+        for _ in range(n_iter):
+            assign = np.argmax(self.embeddings @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, self.embeddings)
+            empty = np.bincount(assign, minlength=n_lists) == 0
+            # re-seed empty clusters with random vectors
+            sums[empty] = self.embeddings[rng.choice(self.count(), int(empty.sum()))]
+            centroids = normalize(sums)
+        assign = np.argmax(self.embeddings @ centroids.T, axis=1)
+        order = np.argsort(assign, kind="stable")
+        self.embeddings = np.ascontiguousarray(self.embeddings[order])
+        self.ids = [self.ids[i] for i in order]
+        self.metadatas = [self.metadatas[i] for i in order]
+        if self.int8 is not None:
+            self.int8 = self.int8[order]
+        if self.ubinary is not None:
+            self.ubinary = self.ubinary[order]
+        self.centroids = centroids
+        self.list_offsets = np.searchsorted(assign[order], np.arange(n_lists + 1))
+        self.n_probe = max(1, n_lists // 8)
+
+    def _first_pass(self, queries: np.ndarray, kind: str, n_candidates: int) -> np.ndarray:
+        """Candidate indexes per query from the quantized matrix, best first."""
+        if kind == "ubinary":
+            if self.ubinary is None:
+                raise ValueError("no ubinary index; call quantize() first")
+            codes, query_bits = self.ubinary, quantize_ubinary(queries)
+            if codes.shape[1] % 8 == 0:
+                # XOR/popcount 64 dimensions per word instead of 8
+                codes, query_bits = codes.view(np.uint64), query_bits.view(np.uint64)
+            distances = np.stack([np.bitwise_count(codes ^ q).sum(axis=1, dtype=np.int32) for q in query_bits])
+            return top_k(-distances, n_candidates)
+
+        if self.int8 is None:
+            raise ValueError("no int8 index; call quantize() first")
+        scaled = queries * self.int8_scale if self.int8_scale is not None else queries
+        block = 16384
+        scores = np.empty((len(queries), self.count()), dtype=np.float32)
+        for start in range(0, self.count(), block):
+            scores[:, start : start + block] = scaled @ self.int8[start : start + block].astype(np.float32).T
+        return top_k(scores, n_candidates)
+
+    def search(
+        self,
+        query_embeddings: Sequence[Sequence[float]],
+        k: int,
+        n_probe: Optional[int] = None,
+        quantization: Optional[str] = None,
+    ) -> "tuple[np.ndarray, np.ndarray]":
+        """Return ``(indexes, scores)`` of shape ``(n_queries, k)``, by cosine similarity.
+
+        Without ``n_probe`` the search is exact. With an IVF index and ``n_probe``, only the
+        ``n_probe`` nearest lists are scored; rows with fewer than ``k`` candidates are
+        padded with index -1. With ``quantization`` ("int8"/"ubinary"), a quantized first
+        pass over the whole corpus picks candidates that are rescored with float vectors.
+        """
+        queries = normalize(np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32)))
+        if quantization is not None:
+            candidates = self._first_pass(queries, quantization, min(self.count(), k * self.rescore_multiplier))
+            scores = np.einsum("qcd,qd->qc", np.asarray(self.embeddings)[candidates], queries)
+            best = top_k(scores, k)
+            return np.take_along_axis(candidates, best, axis=1), np.take_along_axis(scores, best, axis=1)
+
+        if n_probe is None or self.centroids is None or self.list_offsets is None:
+            scores = queries @ self.embeddings.T
+            idx = top_k(scores, k)
+            return idx, np.take_along_axis(scores, idx, axis=1)
+
+        probes = top_k(queries @ self.centroids.T, n_probe)
+        k = min(k, self.count())
+        out_idx = np.full((len(queries), k), -1, dtype=np.int64)
+        out_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        offsets = self.list_offsets
+        for row, (query, lists) in enumerate(zip(queries, probes)):
+            candidates = np.concatenate([np.arange(offsets[c], offsets[c + 1]) for c in lists])
+            if not len(candidates):
+                continue
+            scores = np.concatenate([self.embeddings[offsets[c] : offsets[c + 1]] @ query for c in lists])
+            best = top_k(scores[None, :], k)[0]
+            out_idx[row, : len(best)] = candidates[best]
+            out_scores[row, : len(best)] = scores[best]
+        return out_idx, out_scores
+
+    def query(
+        self,
+        query_embeddings: Sequence[Sequence[float]],
+        n_results: int = 10,
+        n_probe: Optional[int] = None,
+        quantization: Optional[str] = None,
+        **_: Any,
+    ) -> Dict[str, List[List[Any]]]:
+        """Chroma-compatible query; ``distances`` are cosine distances (1 - similarity).
+
+        Defaults to ``self.quantization`` for a quantized first pass, else to the IVF index
+        with ``self.n_probe`` lists when one is built.
+        """
+        quantization = quantization or self.quantization
+        n_probe = n_probe if n_probe is not None else self.n_probe
+        idx, scores = self.search(query_embeddings, n_results, n_probe=n_probe, quantization=quantization)
+        ids, distances, metadatas = [], [], []
+        for row_idx, row_scores in zip(idx, scores):
+            keep = row_idx >= 0
+            ids.append([self.ids[i] for i in row_idx[keep]])
+            distances.append((1.0 - row_scores[keep]).tolist())
+            metadatas.append([self.metadatas[i] for i in row_idx[keep]])
+        return {"ids": ids, "distances": distances, "metadatas": metadatas}
+
+    def save(self, path: str) -> None:
+        """Write ``<path>.npy`` (matrix), ``<path>.json`` (ids/metadatas) and, if built, ``<path>.ivf.npz``."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        np.save(f"{path}.npy", np.ascontiguousarray(self.embeddings, dtype=np.float32))
+        with open(f"{path}.json", "w") as f:
+            json.dump({"ids": self.ids, "metadatas": self.metadatas, "quantization": self.quantization}, f)
+        for kind in QUANTIZATIONS:
+            matrix = getattr(self, kind)
+            if matrix is not None:
+                np.save(f"{path}.{kind}.npy", matrix)
+        if self.int8_scale is not None:
+            np.save(f"{path}.int8_scale.npy", self.int8_scale)
+        if self.centroids is not None and self.list_offsets is not None:
+            np.savez(f"{path}.ivf.npz", centroids=self.centroids, list_offsets=self.list_offsets)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "NumpyVectorStore":
+        """Load a saved index; with ``mmap`` the matrix is paged in from disk on demand."""
+        embeddings = np.load(f"{path}.npy", mmap_mode="r" if mmap else None)
+        with open(f"{path}.json", "r") as f:
+            meta = json.load(f)
+        store = cls(meta["ids"], embeddings, meta["metadatas"], normalized=True)
+        store.quantization = meta.get("quantization")
+        for kind in QUANTIZATIONS:
+            if os.path.exists(f"{path}.{kind}.npy"):
+                setattr(store, kind, np.load(f"{path}.{kind}.npy"))
+        if os.path.exists(f"{path}.int8_scale.npy"):
+            store.int8_scale = np.load(f"{path}.int8_scale.npy")
+        if os.path.exists(f"{path}.ivf.npz"):
+            ivf = np.load(f"{path}.ivf.npz")
+            store.centroids = ivf["centroids"]
+            store.list_offsets = ivf["list_offsets"]
+            store.n_probe = max(1, len(store.centroids) // 8)
+        return store
+
+
+def open_vector_store(
+    backend: str = "chroma",
+    persist_dir: str = "./chroma_db",
+    collection_name: str = "pdf_pages",
+    index_path: Optional[str] = None,
+) -> Any:
+    """Open the Chroma collection or the NumPy index (``index_path``) behind ``query_collection``."""
+    if backend == "numpy":
+        return NumpyVectorStore.load(index_path or os.path.join("./vector_index", collection_name))
+    import chromadb
+
+    return chromadb.PersistentClient(path=persist_dir).get_collection(collection_name)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build a NumPy vector index from a Chroma collection.")
+    parser.add_argument("--persist_dir", default="./chroma_db", help="Chroma DB directory")
+    parser.add_argument("--collection", default="pdf_pages", help="Chroma collection name")
+    parser.add_argument("--out", default=None, help="Index path prefix (default ./vector_index/<collection>)")
+    parser.add_argument("--ivf_lists", type=int, default=0, help="Build an IVF index with this many lists (0 = exact only)")
+    parser.add_argument(
+        "--quantization", default=None, choices=QUANTIZATIONS, help="Default first pass for queries (rescored with floats)"
+    )
+    args = parser.parse_args()
+
+    store = NumpyVectorStore.from_chroma(open_vector_store("chroma", args.persist_dir, args.collection))
+    if args.quantization:
+        store.quantize([args.quantization])
+        store.quantization = args.quantization
+    if args.ivf_lists:
+        store.build_ivf(args.ivf_lists)
+    out = args.out or os.path.join("./vector_index", args.collection)
+    store.save(out)
+    print(f"Wrote {store.count()} vectors to {out}.npy", flush=True)
+
+
+if __name__ == "__main__":
+    main()